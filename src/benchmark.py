@@ -0,0 +1,213 @@
+"""
+This script measures the end-to-end throughput of a transfer offline: the
+fetch engine pages through a local mock AniList server, every page is
+preprocessed into its tables and bulk inserted into a fresh DuckDB database.
+It builds the same stages as data_transfer.py (the fetch engine, the
+preprocessing pipeline and the bulk insert), but runs its own loop over
+them: there are no checkpoints, upserts, summaries or Parquet output, so
+the report measures fetching, preprocessing and inserting only.
+
+Usage:
+    # From the project root directory
+    $ python src/benchmark.py
+
+    # 8 seasons of 10 pages with 50 ms latency, AniList's 90 requests/minute
+    $ python src/benchmark.py --years 2 --pages 10 --latency 0.05 --limit 90
+
+    # Save the report to compare it with a later run
+    $ python src/benchmark.py --json bench.json
+
+Arguments:
+    Optional:
+        --years (int): The number of years to transfer, 4 seasons each (default: 2).
+        --pages (int): The pages of every season (default: 5).
+        --per-page (int): The media of every page (default: 50).
+        --reviews (int): The reviews of every media (default: 2).
+        --concurrency (int): The maximum number of requests in flight (default: 4).
+        --latency (float): Seconds every response is delayed (default: 0.0).
+        --batch (int): Pages of a season fetched per request (default: 1).
+        --split: Fetch reviews and studios with separate id_in queries.
+        --stream: Load every page as soon as it is fetched, as in data_transfer.py.
+        --limit (int): The requests the server allows per window (default: 100000).
+        --window (float): The rate limit window in seconds (default: 60).
+        --error-rate (float): The fraction of requests failing with a 500 (default: 0).
+        --recorded (str): A response cache directory to replay recorded pages from.
+        --database (str): Benchmark against a database file instead of memory.
+        --json (str): Also write the report, with the per-stage metrics of
+                      utils.metrics, as JSON to this file.
+
+Notes:
+    - The fetch engine gets a rate budget matching --limit and --window,
+      so lowering them measures the throttling and 429 handling too.
+    - Requests go through the pooled, compressed transport of data_transfer.py
+      (utils.transport); the server gzips responses when asked to.
+    - Rows are counted per table as preprocessed, inserted or not.
+    - Studio catalogues are fetched once per studio, as in data_transfer.py.
+    - The report includes the peak resident memory of the process, which
+      also holds the mock server's responses.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import duckdb
+
+from init_duckdb import create_tables
+from utils.cache import ResponseCache
+from utils.fetch_data import FetchEngine, plan_seasons
+from utils.memory import MemoryBudget
+from utils.insert_data import load_tables
+from utils.metrics import REGISTRY
+from utils.mock_anilist import SEASONS, MockAniList
+from utils.normalize import normalize
+from utils.pipeline import pipeline
+from utils.preprocess import DETAIL_FIELDS
+from utils.rate_limit import RateController
+from utils.studio_cache import StudioCache, merge_catalog
+from utils.transport import Transport
+
+if __name__ != "__main__":
+    sys.exit("This script must be run directly.")
+
+PARSER = argparse.ArgumentParser(
+    description="Benchmark a transfer end to end against a local mock AniList server."
+)
+PARSER.add_argument("--years", type=int, default=2, help="years to transfer (default: 2)")
+PARSER.add_argument("--pages", type=int, default=5, help="pages per season (default: 5)")
+PARSER.add_argument("--per-page", type=int, default=50, help="media per page (default: 50)")
+PARSER.add_argument("--reviews", type=int, default=2, help="reviews per media (default: 2)")
+PARSER.add_argument(
+    "--concurrency", type=int, default=4, help="requests in flight (default: 4)"
+)
+PARSER.add_argument(
+    "--latency", type=float, default=0.0, help="seconds per response (default: 0)"
+)
+PARSER.add_argument(
+    "--batch", type=int, default=1, help="pages of a season per request (default: 1)"
+)
+PARSER.add_argument(
+    "--split", action="store_true", help="fetch reviews and studios separately"
+)
+PARSER.add_argument(
+    "--stream", action="store_true", help="load every page as soon as it is fetched"
+)
+PARSER.add_argument(
+    "--limit", type=int, default=100_000, help="requests per window (default: 100000)"
+)
+PARSER.add_argument(
+    "--window", type=float, default=60.0, help="rate limit window in seconds (default: 60)"
+)
+PARSER.add_argument(
+    "--error-rate", type=float, default=0.0, help="fraction of 500 responses (default: 0)"
+)
+PARSER.add_argument("--recorded", help="a response cache directory to replay pages from")
+PARSER.add_argument("--database", default=":memory:", help="the database (default: memory)")
+PARSER.add_argument("--json", help="also write the report as JSON to this file")
+ARGS = PARSER.parse_args()
+
+with open(r"src/utils/api_query.graphql", "r", encoding="UTF-8") as file:
+    QUERY = file.read()
+
+PLAN = plan_seasons(range(2000, 2000 + ARGS.years), SEASONS)
+
+
+def transform(result):
+    """Preprocess each fetched page of a season into its tables."""
+    units = []
+    for i, frame in enumerate(result.frames):
+        tables = normalize(frame, details=result.details[i] if result.details else None)
+        if result.catalogs:
+            merge_catalog(tables, result.catalogs[i])
+        units.append(tables)
+    return units
+
+
+SERVER = MockAniList(
+    pages_per_season=ARGS.pages,
+    per_page=ARGS.per_page,
+    reviews=ARGS.reviews,
+    latency=ARGS.latency,
+    limit=ARGS.limit,
+    window=ARGS.window,
+    error_rate=ARGS.error_rate,
+    cache=ResponseCache(ARGS.recorded) if ARGS.recorded else None,
+)
+
+conn = duckdb.connect(ARGS.database)
+create_tables(conn)
+
+pages = 0
+incomplete = 0
+rows = {}
+TRANSPORT = Transport(pool_size=ARGS.concurrency)
+
+with SERVER:
+    ENGINE = FetchEngine(
+        SERVER.url,
+        QUERY,
+        concurrency=ARGS.concurrency,
+        bucket=RateController(capacity=ARGS.limit, period=ARGS.window),
+        api=TRANSPORT,
+        batch=ARGS.batch,
+        details=DETAIL_FIELDS if ARGS.split else None,
+        studios=StudioCache(),
+    )
+    REGISTRY.reset()
+    BUDGET = MemoryBudget()
+    if ARGS.stream:
+        RESULTS = pipeline(ENGINE.iter_pages(PLAN, BUDGET), transform, maxsize=1)
+    else:
+        RESULTS = pipeline(ENGINE.iter_seasons(PLAN), transform)
+    start = time.perf_counter()
+    for result, units in RESULTS:
+        pages += result.pages
+        incomplete += not (result.complete or result.more)
+        for tables in units:
+            for table, count in load_tables(tables, conn).items():
+                rows[table] = rows.get(table, 0) + sum(count.values())
+        if ARGS.stream and result.frames:
+            result = units = tables = None
+            BUDGET.release()
+        BUDGET.usage()
+    wall = time.perf_counter() - start
+TRANSPORT.close()
+conn.close()
+
+REPORT = {
+    "config": vars(ARGS),
+    "wall_seconds": round(wall, 3),
+    "seasons": len(PLAN),
+    "incomplete_seasons": incomplete,
+    "pages": pages,
+    "requests": SERVER.requests,
+    "connections": SERVER.connections,
+    "pages_per_second": round(pages / wall, 2),
+    "received_bytes": REGISTRY.counters.get(("response_wire_bytes", ()), 0),
+    "decoded_bytes": REGISTRY.counters.get(("response_decoded_bytes", ()), 0),
+    "peak_rss_bytes": BUDGET.peak,
+    "tables": {
+        table: {"rows": count, "rows_per_second": round(count / wall, 1)}
+        for table, count in sorted(rows.items())
+    },
+}
+
+print(
+    f"🟦 {len(PLAN)} seasons, {pages} pages, {SERVER.requests} requests "
+    f"over {SERVER.connections} connections in {wall:.2f}s"
+)
+print(f"🟩 {REPORT['pages_per_second']} pages/s")
+print(
+    f"🟩 {REPORT['received_bytes'] / 1e6:.2f} MB received, "
+    f"{REPORT['decoded_bytes'] / 1e6:.2f} MB decoded"
+)
+print(f"🟦 Peak memory: {BUDGET.peak / 2**20:.0f} MB")
+for table, stats in REPORT["tables"].items():
+    print(f"🟩 {table.upper()}: {stats['rows']} rows, {stats['rows_per_second']} rows/s")
+if incomplete:
+    print(f"🟥 {incomplete} season(s) could not be retrieved completely.")
+
+if ARGS.json:
+    with open(ARGS.json, "w", encoding="UTF-8") as file:
+        json.dump({**REPORT, "metrics": REGISTRY.report()}, file, indent=2)
@@ -5,180 +5,402 @@ processes the data, and inserts it into a DuckDB database.
 
 Usage:
     # From the project root directory
-    $ python data_transfer.py <inclusive: start_year> <exclusive: end_year> <optional: cooldown>
+    $ python data_transfer.py <inclusive: start_year> <exclusive: end_year> <optional: concurrency>
+
+    # Rebuild the database from cached responses, without any network access
+    $ python src/init_duckdb.py
+    $ python data_transfer.py 1940 2025 --replay
+
+    # Continue an interrupted transfer
+    $ python data_transfer.py 1940 2025 --resume
+
+    # Refresh only some tables; the query only selects the fields they need
+    $ python data_transfer.py 1940 2025 --tables Anime Status
+
+    # Load only the media updated since the last sync (e.g. nightly)
+    $ python data_transfer.py --sync
+
+    # Also write every table as partitioned Parquet to src/lake
+    $ python data_transfer.py 1940 2025 --output both
+
+    # Split a backfill across two workers, then merge their shard databases
+    $ python data_transfer.py 1940 2025 --shard 0/2
+    $ python data_transfer.py 1940 2025 --shard 1/2
+    $ python merge_shards.py
+
+    # Print the seasons a run would transfer, without transferring anything
+    $ python data_transfer.py 1940 2025 --shard 0/2 --plan
+
+    # In process, e.g. from a scheduler, with a warm connection between jobs
+    >>> from utils.transfer import Transfer
+    >>> with Transfer(upsert=True) as transfer:
+    ...     transfer.run(range(2024, 2026))
+    ...     transfer.sync()
 
 Arguments:
-    start_year (int): The starting year for data retrieval.
-    end_year (int): The ending year for data retrieval.
+    start_year (int): The starting year for data retrieval (not with --sync).
+    end_year (int): The ending year for data retrieval (not with --sync).
 
     Optional:
-        COOLDOWN (int): The cooldown period between API requests (default: 10 seconds).
+        CONCURRENCY (int): The maximum number of API requests in flight (default: 4).
+        --no-cache: Do not read or write the response cache.
+        --replay: Read pages from the response cache only.
+        --resume: Skip the pages already transferred by a previous run.
+        --tables (str...): Only fetch, preprocess and insert these tables.
+        --upsert: Update stored rows whose values changed, fetching every page
+                  again instead of reading the response cache.
+        --sync: Only load the media updated since the last sync, with --upsert.
+        --cache-dir (str): Where responses are cached (default: src/.cache/responses).
+        --shard (str): INDEX/COUNT; only transfer this worker's share of the seasons
+                       into its own shard database.
+        --database (str): The database to load into (default: src/anilist.duckdb, or
+                          src/shards/shard-INDEX-of-COUNT.duckdb with --shard).
+        --output (str): duckdb, parquet or both (default: duckdb).
+        --lake-dir (str): Where the Parquet files are written (default: src/lake).
+        --row-group-size (int): The maximum rows per Parquet row group (default: 100000).
+        --report (str): Write a JSON run report to this path.
+        --prometheus (str): Also write the metrics in the Prometheus text format.
+        --profile-tables: Time the preprocessing of every table separately.
+        --url (str): The GraphQL endpoint (default: https://graphql.anilist.co).
+        --connect-timeout (float): Seconds to wait for a connection (default: 3.05).
+        --read-timeout (float): Seconds to wait for a response (default: 10).
+        --http2: Use HTTP/2 (needs the optional httpx[http2] package).
+        --batch (int): Pages of a season fetched per request (default: 1).
+        --split: Fetch reviews and studios with separate id_in queries, only
+                 for new or changed media.
+        --studio-ttl (float): Days before a studio catalogue is fetched again (default: 30).
+        --no-studio-catalogs: Only store the studios of the transferred anime.
+        --stream: Normalize and load every page as soon as it is fetched.
+        --max-memory (float): MB of memory above which page requests wait for the
+                              loaded pages to be freed (implies --stream).
+        --plan: Print the seasons to transfer and exit.
 Modules:
-    time: Provides various time-related functions.
+    argparse: Parses the command line arguments.
     sys: Provides access to some variables used or maintained by the interpreter.
-    duckdb: A fast, embeddable SQL OLAP database management system.
-    tqdm: A fast, extensible progress bar for Python.
-    utils.fetch_data: Custom module to fetch data from Anilist.
-    utils.preprocess: Custom module to preprocess anime and review data.
+    utils.plan: Custom module to list the seasons of a transfer.
+    utils.shard: Custom module to split a backfill into shard databases.
+    utils.transfer: Custom module running the transfer in process (imported
+                    once there is work to do; it loads polars, DuckDB, tqdm and
+                    the fetch, preprocess and insert stages).
 Functions:
-    fetch_from: Fetches data from Anilist using a GraphQL query.
-    preprocess_<table>: Processes the fetched specific table data.
+    main(argv: list[str]) -> int: Parses the arguments and runs the transfer.
 
 Notes:
-    - The script must be run directly and not imported as a module.
+    - The script only imports the standard library until it has work to do, so
+      --help and --plan return at once; `main` can also be called in process.
     - The script requires a GraphQL query file located at 'src/utils/api_query.graphql'.
-    - The script includes a cooldown period between API requests to avoid rate limiting. Recommended cooldown: 10 seconds.
+    - Requests are paced by a rate controller fed by the API's rate limit headers
+      (X-RateLimit-Remaining, X-RateLimit-Reset, Retry-After); failed pages are
+      retried with jittered backoff.
+    - Raw page responses are cached on disk, keyed by the query text and its
+      variables, so reruns after preprocess or schema changes skip the network.
+    - Every page is inserted in its own transaction together with a row in the
+      TransferCheckpoint table; --resume continues an interrupted transfer.
+    - The primary keys already stored are indexed in memory for the whole run
+      (snapshots in src/.cache/keys/<database>), so known rows never reach DuckDB.
+    - With --upsert, stored rows whose values changed (scores, popularity,
+      status counts, ...) are updated; unchanged rows are left untouched.
+      Pages are fetched again rather than read from the response cache.
+    - --sync pages through all anime sorted by update time and stops at the
+      updatedAt watermark of the previous sync (SyncWatermark table). The
+      first sync loads the newest page of updates and records its
+      watermark. Changes that do not touch the media itself (e.g. a new
+      review) do not move updatedAt.
+    - DuckDB allows one writer per database file; with --shard every worker
+      writes to its own shard database, and merge_shards.py loads all shards
+      into the main database in one transaction.
+    - With --output parquet/both, every page is written as zstd Parquet files
+      partitioned by SeasonYear/Season (see utils.lake); load_lake.py creates
+      DuckDB views over them or bulk loads them. The checkpoints are still
+      recorded in the database.
+    - Request latency, response bytes (received and decoded), decode,
+      preprocess and insert times, row counts and rate limit headroom are
+      collected by utils.metrics and written as a JSON run report at the
+      end of a run with --report.
+    - Requests reuse a pool of keep-alive connections (one per concurrent
+      request) and ask for compressed responses.
+    - With --batch N, N pages of a season are fetched in one request, as
+      aliased copies of the Page query. N is capped by an estimate of the
+      query complexity, which counts every field once per media (and per
+      review) it is returned for, so only queries of a few --tables fit more
+      than one page. A batch AniList rejects is fetched again in halves.
+    - With --split, pages leave out the reviews (with their bodies) and the
+      studios (with all of their media), which make up most of a response.
+      They are fetched with media(id_in: ...) queries of 25 media each, only
+      for media whose updatedAt differs from the one recorded in the
+      MediaVersion table when their details were last loaded. Reviews added
+      without a change of the media itself are picked up on the next change.
+    - Pages only list the studios of each anime. The catalogue of a studio
+      (all of its media, for the AnimeStudio table) is fetched the first time the
+      studio is seen and again after --studio-ttl days; the fetch times are
+      kept in the StudioFetch table (see utils.studio_cache).
+    - Once a season is loaded, the dashboard summaries (SeasonSummary,
+      GenreSummary, ...) of the partitions it touched are recomputed (see
+      utils.aggregates); refresh_aggregates.py rebuilds or checks them all.
+    - With --stream, seasons are fetched one after another and every page is
+      normalized, loaded and freed on its own, so memory is bounded by a few
+      pages instead of several whole seasons (see utils.memory). Resuming works
+      as usual, as every page is checkpointed either way.
 """
 
+import argparse
 import sys
-import time
-
-import duckdb
-from tqdm import tqdm
-
-from utils import preprocess
-from utils.custom_exceptions import NoAnimeEntriesFound
-from utils.fetch_data import fetch_from
-from utils.insert_data import insert_data
-
-if __name__ != "__main__":
-    sys.exit("This script must be run directly.")
-
-if len(sys.argv) > 1:
-    start_year = int(sys.argv[1])
-    end_year = int(sys.argv[2])
-    COOLDOWN = int(sys.argv[3]) if len(sys.argv) > 3 else 10
-else:
-    sys.exit(
-        (
-        "Please provide a start and end year as kwargs. "
-        "python <inclusive: start_year> <exclusive: end_year> <optional: cooldown>"
-        )
+
+from utils.plan import SEASONS, plan_seasons
+from utils.shard import parse_shard, shard_path, shard_plan
+
+PARSER = argparse.ArgumentParser(
+    description="Transfer anime data from Anilist to the DuckDB database."
+)
+PARSER.add_argument(
+    "start_year", type=int, nargs="?", help="inclusive: the first year to fetch"
+)
+PARSER.add_argument("end_year", type=int, nargs="?", help="exclusive: the year to stop at")
+PARSER.add_argument(
+    "concurrency",
+    type=int,
+    nargs="?",
+    default=4,
+    help="the maximum number of API requests in flight (default: 4)",
+)
+PARSER.add_argument(
+    "--no-cache", action="store_true", help="do not read or write the response cache"
+)
+PARSER.add_argument(
+    "--replay",
+    action="store_true",
+    help="rebuild the database from cached responses only, without any network access",
+)
+PARSER.add_argument(
+    "--resume",
+    action="store_true",
+    help="skip the pages already transferred according to the checkpoints",
+)
+PARSER.add_argument(
+    "--tables",
+    nargs="+",
+    metavar="TABLE",
+    help="only transfer these tables (of utils.preprocess.TABLES, e.g. Anime Status)",
+)
+PARSER.add_argument(
+    "--upsert",
+    action="store_true",
+    help="update stored rows whose values changed instead of skipping them",
+)
+PARSER.add_argument(
+    "--sync",
+    action="store_true",
+    help="only transfer the anime updated since the last sync (implies --upsert)",
+)
+PARSER.add_argument(
+    "--cache-dir",
+    default="src/.cache/responses",
+    help="where raw API responses are cached (default: src/.cache/responses)",
+)
+PARSER.add_argument(
+    "--shard",
+    type=parse_shard,
+    metavar="INDEX/COUNT",
+    help="only transfer every COUNT-th season starting at INDEX (from 0) into a shard database",
+)
+PARSER.add_argument(
+    "--database",
+    help="the database to load into (default: src/anilist.duckdb, "
+    "or src/shards/shard-INDEX-of-COUNT.duckdb with --shard)",
+)
+PARSER.add_argument(
+    "--output",
+    choices=["duckdb", "parquet", "both"],
+    default="duckdb",
+    help="load the tables into the database, write them as Parquet, or both (default: duckdb)",
+)
+PARSER.add_argument(
+    "--lake-dir",
+    default="src/lake",
+    help="where the partitioned Parquet files are written (default: src/lake)",
+)
+PARSER.add_argument(
+    "--row-group-size",
+    type=int,
+    default=100_000,
+    help="the maximum number of rows per Parquet row group (default: 100000)",
+)
+PARSER.add_argument(
+    "--report",
+    metavar="PATH",
+    help="write a JSON run report to PATH",
+)
+PARSER.add_argument(
+    "--prometheus",
+    metavar="PATH",
+    help="also write the metrics to this file in the Prometheus text format",
+)
+PARSER.add_argument(
+    "--profile-tables",
+    action="store_true",
+    help="time the preprocessing of every table separately (slower overall)",
+)
+PARSER.add_argument(
+    "--url",
+    default="https://graphql.anilist.co",
+    help="the GraphQL endpoint (default: https://graphql.anilist.co)",
+)
+PARSER.add_argument(
+    "--connect-timeout",
+    type=float,
+    default=3.05,
+    help="seconds to wait for a connection (default: 3.05)",
+)
+PARSER.add_argument(
+    "--read-timeout",
+    type=float,
+    default=10.0,
+    help="seconds to wait for a response (default: 10)",
+)
+PARSER.add_argument(
+    "--http2",
+    action="store_true",
+    help="use HTTP/2 if the optional httpx[http2] package is installed",
+)
+PARSER.add_argument(
+    "--batch",
+    type=int,
+    default=1,
+    metavar="PAGES",
+    help="pages of a season fetched per request, within the query complexity limit "
+    "(default: 1)",
+)
+PARSER.add_argument(
+    "--split",
+    action="store_true",
+    help="fetch reviews and studios with separate id_in queries, only for new or "
+    "changed media",
+)
+PARSER.add_argument(
+    "--studio-ttl",
+    type=float,
+    default=30.0,
+    metavar="DAYS",
+    help="days before the catalogue of a studio is fetched again (default: 30)",
+)
+PARSER.add_argument(
+    "--stream",
+    action="store_true",
+    help="normalize and load every page as soon as it is fetched, one season at a time, "
+    "instead of whole seasons",
+)
+PARSER.add_argument(
+    "--max-memory",
+    type=float,
+    metavar="MB",
+    help="hold back page requests while the process uses more memory (implies --stream)",
+)
+PARSER.add_argument(
+    "--no-studio-catalogs",
+    action="store_true",
+    help="do not fetch studio catalogues; only store the studios of the transferred anime",
+)
+PARSER.add_argument(
+    "--plan",
+    action="store_true",
+    help="print the seasons to transfer and exit, without importing polars or DuckDB",
+)
+
+
+def print_plan(args):
+    """Print the seasons a run with the given arguments would transfer."""
+    database = args.database or (shard_path(*args.shard) if args.shard else "src/anilist.duckdb")
+    if args.sync:
+        print(f"🟦 Sync: every anime updated since the last sync, into {database}.")
+        return
+    plan = plan_seasons(range(args.start_year, args.end_year))
+    if args.shard:
+        plan = shard_plan(plan, *args.shard)
+    print(f"🟦 {len(plan)} season(s) into {database}:")
+    for year, season in plan:
+        print(f"{SEASONS[season]}  {season} {year}")
+    if args.resume:
+        # Reading the checkpoints would need DuckDB
+        print("🟨 Seasons already transferred are skipped once the transfer starts.")
+
+
+def main(argv=None) -> int:
+    """Parse the arguments and run the transfer.
+
+    Args:
+        argv (list[str]): The arguments (default: sys.argv[1:]).
+
+    Returns:
+        int: The exit status.
+    """
+    args = PARSER.parse_args(argv)
+
+    if args.replay and args.no_cache:
+        PARSER.error("--replay reads from the cache and cannot be combined with --no-cache")
+    if args.resume and args.tables:
+        PARSER.error("--resume needs the checkpoints of full transfers; drop --tables")
+    if args.sync and (args.start_year is not None or args.resume or args.replay):
+        PARSER.error("--sync covers every year; drop the years, --resume and --replay")
+    if args.sync and args.shard:
+        PARSER.error("--sync is a single sequential walk and cannot be sharded")
+    if not args.sync and args.end_year is None:
+        PARSER.error("start_year and end_year are required unless --sync is given")
+    if args.max_memory is not None:
+        args.stream = True
+    if args.sync and args.stream:
+        PARSER.error("--sync loads the changed media at once; drop --stream and --max-memory")
+
+    if args.plan:
+        print_plan(args)
+        return 0
+
+    # Only now is there work to do for polars, DuckDB and the HTTP stack
+    from utils.transfer import Transfer
+
+    try:
+        transfer = Transfer(
+            database=args.database,
+            url=args.url,
+            concurrency=args.concurrency,
+            tables=args.tables,
+            upsert=args.upsert,
+            cache_dir=None if args.no_cache else args.cache_dir,
+            replay=args.replay,
+            shard=args.shard,
+            output=args.output,
+            lake_dir=args.lake_dir,
+            row_group_size=args.row_group_size,
+            profile_tables=args.profile_tables,
+            connect_timeout=args.connect_timeout,
+            read_timeout=args.read_timeout,
+            http2=args.http2,
+            batch=args.batch,
+            split=args.split,
+            studio_ttl=None if args.no_studio_catalogs else args.studio_ttl,
         )
+    except ValueError as e:
+        PARSER.error(str(e))
 
-## GraphQL query to retrieve data from Anilist
-with open(r"src/utils/api_query.graphql", "r", encoding="UTF-8") as file:
-    QUERY = file.read()
-
-YEARS = range(start_year, end_year)
-SEASONS = {
-    "WINTER": "❄️",
-    "SPRING": "🌸",
-    "SUMMER": "🌞",
-    "FALL": "🍂",
-}
-
-YEAR_BAR = tqdm(YEARS, position=0, leave=False, colour="#60D850")
-for year in YEARS:
-    YEAR_BAR.set_description(f"Fetching {year}")
-
-    SEASON_BAR = tqdm(SEASONS, position=1, leave=False, colour="#22351F")
-    for season, emoji in SEASONS.items():
-        tqdm.write(f"===== {emoji}  {season} {year} =====")
-        SEASON_BAR.set_description(f"Fetching {season}")
-
-        try:
-            buffer = fetch_from(
-                url="https://graphql.anilist.co", query=QUERY, year=year, season=season
+    try:
+        if args.sync:
+            transfer.sync(report=args.report, prometheus=args.prometheus)
+        else:
+            transfer.run(
+                range(args.start_year, args.end_year),
+                resume=args.resume,
+                stream=args.stream,
+                max_memory=args.max_memory,
+                report=args.report,
+                prometheus=args.prometheus,
             )
+    except KeyboardInterrupt:
+        print("x--- Closing connection ---x")
+        print("\n" * 2)
+        sys.exit("👋 Script terminated.")
+    finally:
+        transfer.close()
+    return 0
 
-            if type(buffer) is tuple:
-                raise NoAnimeEntriesFound(
-                    f"🟨 No anime entries found for {year} {season}. "
-                    f"Requests remaining: {buffer[0]}/{buffer[1]}"
-                )
-
-            def handle_insert(data, table, year, season, conn):
-                """Handle the insertion of data into the database.
-
-                Args:
-                    data (DataFrame): The data to be inserted.
-                    data_type (str): The type of data being inserted
-                                    (e.g., 'anime shows', 'reviews').
-                    year (int): The year of the data.
-                    season (str): The season of the data
-                                (e.g., 'spring', 'summer', 'fall', 'winter').
-
-                Returns:
-                    None
-                """
-                try:
-                    generator = (
-                        data.iter_rows()
-                    )  # Raises an attribute error if data == 501
-                    try:
-                        for row in generator:
-                            insert_status = insert_data(row=row, table=table, conn=conn)
-                            if insert_status == 404:
-                                tqdm.write(
-                                    f"🟨 {row} for {table.upper()} already exists"
-                                )
-                            elif insert_status == 500:
-                                tqdm.write(
-                                    f"🟥 Error inserting {row} for {table.upper()} for {season} {year}"
-                                )
-                                continue
-                    except Exception as e:
-                        tqdm.write(f"🟥 Error inserting data: {type(e).__name__}: {e}")
-
-                except AttributeError:
-                    tqdm.write(f"🟨 No data found for {table.upper()}")
-                except Exception as e:
-                    tqdm.write(f"🟥 Error: {type(e).__name__}: {e}")
-
-            try:
-                tqdm.write("🟦 Inserting data...")
-                conn = duckdb.connect("src/anilist.duckdb")
-                handle_insert(preprocess.anime(buffer), "Anime", year, season, conn)
-                handle_insert(preprocess.genres(buffer), "Genre", year, season, conn)
-                handle_insert(preprocess.reviews(buffer), "Review", year, season, conn)
-                handle_insert(preprocess.status(buffer), "Status", year, season, conn)
-                handle_insert(preprocess.studios(buffer), "Studio", year, season, conn)
-                handle_insert(preprocess.tags(buffer), "Tag", year, season, conn)
-                handle_insert(preprocess.users(buffer), "User", year, season, conn)
-                handle_insert(
-                    preprocess.web_assets(buffer), "WebAsset", year, season, conn
-                )
-            except KeyboardInterrupt:
-                conn.close()
-                tqdm.write("x--- Closing connection ---x")
-                raise KeyboardInterrupt
-            except Exception as e:
-                conn.close()
-                tqdm.write(f"🟥 Caught an error: {type(e).__name__}: {e}")
-            else:
-                conn.commit()
-                conn.close()
-                tqdm.write(f"🟩 All data inserted for {season} {year}!")
-
-            SEASON_BAR.update(1)
-
-            try:
-                # TODO: Refactor the cooldown as a function
-                COOLDOWN_BAR = tqdm(
-                    range(0, COOLDOWN), position=2, leave=False, desc="Cooldown"
-                )
-                for i in range(0, COOLDOWN):
-                    COOLDOWN_BAR.set_description(f"⏱ Cooldown: {COOLDOWN-i} sec(s)")
-                    time.sleep(1)
-                    COOLDOWN_BAR.update(1)
-
-            except KeyboardInterrupt:
-                raise KeyboardInterrupt
-
-        except KeyboardInterrupt:
-            print("\n" * 2)
-            sys.exit("👋 Script terminated.")
-
-        except NoAnimeEntriesFound as e:
-            tqdm.write(f"{e}")
-            SEASON_BAR.update(1)
-            COOLDOWN_BAR = tqdm(
-                range(0, COOLDOWN), position=2, leave=False, desc="Cooldown"
-            )
-            for i in range(0, COOLDOWN):
-                COOLDOWN_BAR.set_description(f"⏱ Cooldown: {COOLDOWN-i} sec(s)")
-                time.sleep(1)
-                COOLDOWN_BAR.update(1)
 
-    YEAR_BAR.update(1)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,16 +10,33 @@ Tables created:
 - Status: Stores statistics about anime user statuses.
 - User: Stores user information.
 - WebAsset: Stores web assets related to anime.
-- Studio: Stores information about studios associated with anime.
-- Tag: Stores tags associated with anime.
+- StudioDim: Stores every studio once.
+- AnimeStudio: Links every anime to the studios that produced it.
+- TagDim: Stores every tag once.
+- AnimeTag: Links every anime to its tags.
 - Genre: Stores genres associated with anime.
 - Anime: Stores detailed information about anime.
 - Review: Stores reviews of anime.
+- ReviewBody: Stores the text of the reviews, apart from their numbers.
+- TransferCheckpoint: Stores the pages already transferred, for resuming.
+- SyncWatermark: Stores the media update time the last delta sync reached.
+- MediaVersion: Stores the update time of the media whose reviews and studios were
+  loaded by a split transfer.
+- StudioFetch: Stores when the catalogue of every studio was last fetched.
+- SeasonSummary, GenreSummary, TagSummary, StatusSummary, ReviewSummary: Store
+  per-season aggregates for dashboards, maintained by the transfer.
+
+Types created:
+- MediaSeason, MediaFormat, MediaListStatus: ENUMs of the AniList API's
+  closed value sets, for the Season, Format and UserStatus columns.
 
 Usage:
     # From the project root directory
     $ python src/init_duckdb.py
 
+    # Convert a database created with an older schema instead (see migrate_schema.py)
+    $ python src/migrate_schema.py
+
 Notes:
     - To if you want to customize the data retrieved,
       do so by editing the src/utils/api_query.graphql and the duckdb schema in this script.
@@ -40,16 +57,28 @@ Notes:
 
 import duckdb
 
-# Connect to the DuckDB database; if it doesn't exist, it will be created
-conn = duckdb.connect(r"src/anilist.duckdb")
+from utils import aggregates, checkpoint, studio_cache
+
+# The closed value sets of the AniList API. Open sets (genres, tag categories)
+# stay VARCHAR, which DuckDB stores dictionary compressed anyway, so that a
+# new value never fails an insert.
+ENUM_TYPES = """
+CREATE OR REPLACE TYPE MediaSeason AS ENUM ('WINTER', 'SPRING', 'SUMMER', 'FALL');
+CREATE OR REPLACE TYPE MediaFormat AS ENUM (
+    'TV', 'TV_SHORT', 'MOVIE', 'SPECIAL', 'OVA', 'ONA', 'MUSIC', 'MANGA', 'NOVEL', 'ONE_SHOT'
+);
+CREATE OR REPLACE TYPE MediaListStatus AS ENUM (
+    'CURRENT', 'PLANNING', 'COMPLETED', 'DROPPED', 'PAUSED', 'REPEATING'
+);
+"""
 
 STATS_TABLE = """
 CREATE OR REPLACE TABLE Status (
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
     AmountOfUsers INTEGER,
-    UserStatus TEXT,
+    UserStatus MediaListStatus,
 
     PRIMARY KEY (AnimeID, Season, SeasonYear, UserStatus)
 );
@@ -59,7 +88,7 @@ USERS_TABLE = """
 CREATE OR REPLACE TABLE User (
     UserID INTEGER,
     Username TEXT,
-    DonatorTier TEXT,
+    DonatorTier SMALLINT,
     DonatorBadge TEXT,
     UserCreatedAt DATE,
     LargeAvatar TEXT,
@@ -72,7 +101,7 @@ CREATE OR REPLACE TABLE User (
 WEB_ASSETS_TABLE = """
 CREATE OR REPLACE TABLE WebAsset (
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
     Banner TEXT,
     MediumCover TEXT,
@@ -87,35 +116,52 @@ CREATE OR REPLACE TABLE WebAsset (
 """
 
 STUDIOS_TABLE = """
-CREATE OR REPLACE TABLE Studio (
+CREATE OR REPLACE TABLE StudioDim (
+    StudioID INTEGER,
+    StudioName TEXT,
+
+    PRIMARY KEY (StudioID)
+);
+"""
+
+ANIME_STUDIOS_TABLE = """
+CREATE OR REPLACE TABLE AnimeStudio (
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
     StudioID INTEGER,
-    StudioName TEXT,
 
     PRIMARY KEY (StudioID, AnimeID, Season, SeasonYear)
 );
 """
 
 TAGS_TABLE = """
-CREATE OR REPLACE TABLE Tag (
+CREATE OR REPLACE TABLE TagDim (
     TagID INTEGER,
     IsAdult BOOLEAN,
     Category TEXT,
     Description TEXT,
+
+    PRIMARY KEY (TagID)
+);
+"""
+
+ANIME_TAGS_TABLE = """
+CREATE OR REPLACE TABLE AnimeTag (
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
+    TagID INTEGER,
 
-    PRIMARY KEY (TagID)
+    PRIMARY KEY (TagID, AnimeID, Season, SeasonYear)
 );
 """
+
 GENRES_TABLE = """
 CREATE OR REPLACE TABLE Genre (
     Genre TEXT,
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
 
     PRIMARY KEY (Genre, AnimeID, Season, SeasonYear)
@@ -125,12 +171,12 @@ CREATE OR REPLACE TABLE Genre (
 ANIME_TABLE = """
 CREATE OR REPLACE TABLE Anime (
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
     EnglishTitle TEXT,
     NativeTitle TEXT,
     RomajiTitle TEXT,
-    Format TEXT,
+    Format MediaFormat,
     MeanScore INTEGER,
     Popularity INTEGER,
     Episodes INTEGER,
@@ -139,8 +185,7 @@ CREATE OR REPLACE TABLE Anime (
     StartDate DATE,
     EndDate DATE,
 
-    PRIMARY KEY (AnimeID, Season, SeasonYear),
-    CHECK (season IN ('FALL', 'WINTER', 'SPRING', 'SUMMER'))
+    PRIMARY KEY (AnimeID, Season, SeasonYear)
 );
 """
 
@@ -149,12 +194,11 @@ CREATE OR REPLACE TABLE Review (
     ReviewID INTEGER,
     Rating INTEGER,
     RatingAmount INTEGER,
-    Body TEXT,
     Summary TEXT,
     ReviewCreatedAt DATE,
     ReviewUpdatedAt DATE,
     AnimeID INTEGER,
-    Season VARCHAR(6),
+    Season MediaSeason,
     SeasonYear INTEGER,
     UserID INTEGER,
 
@@ -162,15 +206,48 @@ CREATE OR REPLACE TABLE Review (
   );
 """
 
-# Execute the SQL statements
-conn.execute(STATS_TABLE)
-conn.execute(USERS_TABLE)
-conn.execute(WEB_ASSETS_TABLE)
-conn.execute(STUDIOS_TABLE)
-conn.execute(TAGS_TABLE)
-conn.execute(GENRES_TABLE)
-conn.execute(ANIME_TABLE)
-conn.execute(REVIEW_TABLE)
-
-conn.commit()
-conn.close()
+REVIEW_BODY_TABLE = """
+CREATE OR REPLACE TABLE ReviewBody (
+    ReviewID INTEGER,
+    Body TEXT,
+
+    PRIMARY KEY (ReviewID)
+);
+"""
+
+TABLES = [
+    STATS_TABLE,
+    USERS_TABLE,
+    WEB_ASSETS_TABLE,
+    STUDIOS_TABLE,
+    ANIME_STUDIOS_TABLE,
+    TAGS_TABLE,
+    ANIME_TAGS_TABLE,
+    GENRES_TABLE,
+    ANIME_TABLE,
+    REVIEW_TABLE,
+    REVIEW_BODY_TABLE,
+]
+
+
+def create_tables(conn):
+    """Create or replace every table of the schema on the given connection.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+    """
+    conn.execute(ENUM_TYPES)
+    for table in TABLES:
+        conn.execute(table)
+    # The progress of previous transfers no longer applies to the new tables
+    checkpoint.create_table(conn, replace=True)
+    studio_cache.create_table(conn, replace=True)
+    aggregates.create_tables(conn, replace=True)
+
+
+if __name__ == "__main__":
+    # Connect to the DuckDB database; if it doesn't exist, it will be created
+    conn = duckdb.connect(r"src/anilist.duckdb")
+    create_tables(conn)
+    conn.commit()
+    conn.close()
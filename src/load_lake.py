@@ -0,0 +1,72 @@
+"""
+This script reads the partitioned Parquet lake written by
+`data_transfer.py --output parquet` back into DuckDB.
+
+Usage:
+    # From the project root directory; bulk load the lake into the tables
+    $ python src/load_lake.py
+
+    # Only create views over the files, in the `lake` schema
+    $ python src/load_lake.py --views
+
+Arguments:
+    Optional:
+        --views: Create views instead of loading the rows.
+        --lake-dir (str): The root of the lake (default: src/lake).
+        --database (str): The database to use (default: src/anilist.duckdb).
+
+Notes:
+    - The views read the files at query time; filters on SeasonYear and
+      Season only read the matching partitions. Rows written again (by a
+      sync or an upsert) are read from the newest file only.
+    - The views store the lake path as given, so query them from the same
+      working directory (or pass an absolute --lake-dir).
+    - After a load the dashboard summaries (see utils.aggregates) are rebuilt.
+"""
+
+import argparse
+import sys
+
+import duckdb
+
+from utils import aggregates, lake
+
+if __name__ != "__main__":
+    sys.exit("This script must be run directly.")
+
+PARSER = argparse.ArgumentParser(description="Read the Parquet lake into DuckDB.")
+PARSER.add_argument(
+    "--views",
+    action="store_true",
+    help="create views over the files in the lake schema instead of loading the rows",
+)
+PARSER.add_argument(
+    "--lake-dir", default="src/lake", help="the root of the lake (default: src/lake)"
+)
+PARSER.add_argument(
+    "--database",
+    default="src/anilist.duckdb",
+    help="the database to use (default: src/anilist.duckdb)",
+)
+ARGS = PARSER.parse_args()
+
+conn = duckdb.connect(ARGS.database)
+try:
+    if ARGS.views:
+        for table in lake.create_views(conn, ARGS.lake_dir):
+            print(f'🟩 Created view lake."{table}"')
+    else:
+        print(f"🟦 Loading {ARGS.lake_dir} into {ARGS.database}...")
+        for table, count in lake.load(conn, ARGS.lake_dir).items():
+            print(
+                f"🟩 {table.upper()}: {count['inserted']} inserted, "
+                f"{count['skipped']} already exist"
+            )
+        aggregates.create_tables(conn)
+        aggregates.refresh(conn)
+        print("🟩 Summaries rebuilt.")
+    print("🟩 Done!")
+except Exception as e:
+    sys.exit(f"🟥 Failed, nothing was loaded: {type(e).__name__}: {e}")
+finally:
+    conn.close()
@@ -0,0 +1,71 @@
+"""
+This script merges the shard databases of a sharded backfill into the main
+DuckDB database in a single transaction.
+
+Usage:
+    # From the project root directory; one worker per terminal or machine
+    $ python src/data_transfer.py 1940 2025 --shard 0/2
+    $ python src/data_transfer.py 1940 2025 --shard 1/2
+
+    # Once every worker is done (copy the shard files here first)
+    $ python src/merge_shards.py
+
+Arguments:
+    Optional:
+        SHARDS (str...): The shard databases (default: src/shards/*.duckdb).
+        --database (str): The database to merge into (default: src/anilist.duckdb).
+
+Notes:
+    - Rows already stored, or found in several shards, are kept once.
+    - The transfer checkpoints are merged too, so --resume on the main
+      database skips the seasons the shards have finished.
+    - The dashboard summaries (see utils.aggregates) are rebuilt from the
+      merged rows.
+"""
+
+import argparse
+import glob
+import sys
+
+import duckdb
+
+from utils import aggregates, checkpoint
+from utils.shard import merge
+
+if __name__ != "__main__":
+    sys.exit("This script must be run directly.")
+
+PARSER = argparse.ArgumentParser(
+    description="Merge the shard databases of a sharded backfill into the main database."
+)
+PARSER.add_argument(
+    "shards",
+    nargs="*",
+    metavar="SHARD",
+    help="the shard databases to merge (default: src/shards/*.duckdb)",
+)
+PARSER.add_argument(
+    "--database",
+    default="src/anilist.duckdb",
+    help="the database to merge into (default: src/anilist.duckdb)",
+)
+ARGS = PARSER.parse_args()
+
+SHARDS = ARGS.shards or sorted(glob.glob("src/shards/*.duckdb"))
+if not SHARDS:
+    PARSER.error("no shard databases found")
+
+conn = duckdb.connect(ARGS.database)
+checkpoint.create_table(conn)
+aggregates.create_tables(conn)
+try:
+    print(f"🟦 Merging {len(SHARDS)} shard(s) into {ARGS.database}...")
+    for table, count in merge(conn, SHARDS).items():
+        print(f"🟩 {table.upper()}: {count['inserted']} inserted, {count['skipped']} already exist")
+    aggregates.refresh(conn)
+    print("🟩 Summaries rebuilt.")
+    print("🟩 All shards merged!")
+except Exception as e:
+    sys.exit(f"🟥 Merge failed, nothing was written: {type(e).__name__}: {e}")
+finally:
+    conn.close()
@@ -0,0 +1,113 @@
+"""
+This script rewrites an existing database in the current schema of
+init_duckdb.py: ENUM types for the season, format and user status columns,
+a numeric donator tier, review bodies in their own ReviewBody table, and
+tags and studios stored once in TagDim and StudioDim with AnimeTag and
+AnimeStudio bridge tables.
+It reports the file size and the time of typical scans before and after.
+
+Usage:
+    # From the project root directory
+    $ python src/migrate_schema.py
+
+    # Keep no copy of the old database and save the report
+    $ python src/migrate_schema.py --no-backup --report migration.json
+
+Arguments:
+    Optional:
+        --database (str): The database to migrate (default: src/anilist.duckdb).
+        --no-backup: Do not keep the old database as <database>.bak.
+        --repeat (int): How many times every scan is timed (default: 5).
+        --report (str): Also write the before/after report as JSON to this file.
+
+Notes:
+    - The rows are copied into a new file, which then replaces the database;
+      if anything fails, the database is left untouched.
+    - Key snapshots in src/.cache/keys stay valid; the new tables start
+      without one.
+    - The old Tag table kept a single anime per tag, so AnimeTag only gets
+      those links; transferring the seasons again fills in the rest.
+    - The dashboard summaries (see utils.aggregates) are rebuilt.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import duckdb
+
+from init_duckdb import create_tables
+from utils import aggregates
+from utils.migration import copy, measure
+
+if __name__ != "__main__":
+    sys.exit("This script must be run directly.")
+
+PARSER = argparse.ArgumentParser(
+    description="Rewrite a database in the current schema and report what it gains."
+)
+PARSER.add_argument(
+    "--database",
+    default="src/anilist.duckdb",
+    help="the database to migrate (default: src/anilist.duckdb)",
+)
+PARSER.add_argument(
+    "--no-backup", action="store_true", help="do not keep the old database as <database>.bak"
+)
+PARSER.add_argument(
+    "--repeat", type=int, default=5, help="how many times every scan is timed (default: 5)"
+)
+PARSER.add_argument("--report", help="also write the before/after report as JSON to this file")
+ARGS = PARSER.parse_args()
+
+if not os.path.exists(ARGS.database):
+    PARSER.error(f"{ARGS.database} does not exist")
+
+DATABASE = ARGS.database
+TEMPORARY = f"{DATABASE}.migrating"
+
+# Fold the write-ahead log into the file, so the copy and the backup are complete
+duckdb.connect(DATABASE).execute("CHECKPOINT").close()
+
+print(f"🟦 Measuring {DATABASE}...")
+BEFORE = measure(DATABASE, ARGS.repeat)
+
+if os.path.exists(TEMPORARY):
+    os.remove(TEMPORARY)
+conn = duckdb.connect(TEMPORARY)
+try:
+    create_tables(conn)
+    for table, count in copy(conn, DATABASE).items():
+        print(f"🟩 {table.upper()}: {count} rows")
+    aggregates.refresh(conn)
+    conn.execute("CHECKPOINT")
+except Exception as e:
+    conn.close()
+    os.remove(TEMPORARY)
+    sys.exit(f"🟥 Migration failed, {DATABASE} is unchanged: {type(e).__name__}: {e}")
+conn.close()
+
+if ARGS.no_backup:
+    os.replace(TEMPORARY, DATABASE)
+else:
+    os.replace(DATABASE, f"{DATABASE}.bak")
+    os.replace(TEMPORARY, DATABASE)
+    print(f"🟦 The old database is kept as {DATABASE}.bak")
+
+AFTER = measure(DATABASE, ARGS.repeat)
+
+print(
+    f"🟩 Size: {BEFORE['bytes'] / 2**20:.2f} MB -> {AFTER['bytes'] / 2**20:.2f} MB "
+    f"({AFTER['bytes'] / max(BEFORE['bytes'], 1) - 1:+.0%})"
+)
+for name, seconds in BEFORE["scans"].items():
+    after = AFTER["scans"][name]
+    print(
+        f"🟩 {name}: {seconds * 1e3:.2f} ms -> {after * 1e3:.2f} ms "
+        f"({after / max(seconds, 1e-9) - 1:+.0%})"
+    )
+
+if ARGS.report:
+    with open(ARGS.report, "w", encoding="UTF-8") as file:
+        json.dump({"database": DATABASE, "before": BEFORE, "after": AFTER}, file, indent=2)
@@ -0,0 +1,68 @@
+"""
+This script rebuilds the dashboard summary tables from the base tables, or
+checks the summaries maintained by data_transfer.py against a rebuild.
+
+Usage:
+    # From the project root directory
+    $ python src/refresh_aggregates.py
+
+    # Only report the summary rows that differ from a rebuild
+    $ python src/refresh_aggregates.py --check
+
+Arguments:
+    Optional:
+        --check: Compare the summaries with a rebuild without writing them.
+        --database (str): The database to use (default: src/anilist.duckdb).
+
+Notes:
+    - data_transfer.py recomputes the summaries of every season it loads;
+      a rebuild is only needed after the base tables were changed by hand.
+    - --check exits with status 1 if any summary is out of date.
+"""
+
+import argparse
+import sys
+
+import duckdb
+
+from utils import aggregates
+
+if __name__ != "__main__":
+    sys.exit("This script must be run directly.")
+
+PARSER = argparse.ArgumentParser(
+    description="Rebuild or check the dashboard summary tables."
+)
+PARSER.add_argument(
+    "--check",
+    action="store_true",
+    help="compare the summaries with a rebuild without writing them",
+)
+PARSER.add_argument(
+    "--database",
+    default="src/anilist.duckdb",
+    help="the database to use (default: src/anilist.duckdb)",
+)
+ARGS = PARSER.parse_args()
+
+conn = duckdb.connect(ARGS.database)
+aggregates.create_tables(conn)
+try:
+    if ARGS.check:
+        stale = aggregates.verify(conn)
+        for table, count in stale.items():
+            if count:
+                print(f"🟥 {table.upper()}: {count} rows differ from a rebuild")
+            else:
+                print(f"🟩 {table.upper()}: up to date")
+        if any(stale.values()):
+            sys.exit(1)
+    else:
+        print(f"🟦 Rebuilding the summaries of {ARGS.database}...")
+        for table, count in aggregates.refresh(conn).items():
+            print(f"🟩 {table.upper()}: {count} rows")
+        print("🟩 Done!")
+except duckdb.Error as e:
+    sys.exit(f"🟥 Failed, nothing was written: {type(e).__name__}: {e}")
+finally:
+    conn.close()
@@ -1 +1,24 @@
-__all__ = ["preprocess", "fetch_data", "insert_data", "custom_exceptions"]
\ No newline at end of file
+__all__ = [
+    "preprocess",
+    "fetch_data",
+    "insert_data",
+    "custom_exceptions",
+    "rate_limit",
+    "cache",
+    "pipeline",
+    "checkpoint",
+    "normalize",
+    "graphql",
+    "schema",
+    "key_index",
+    "shard",
+    "lake",
+    "mock_anilist",
+    "metrics",
+    "transport",
+    "studio_cache",
+    "memory",
+    "aggregates",
+    "plan",
+    "transfer",
+]
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""
+This module maintains summary tables for dashboards, so that per-season
+counts, mean scores, genre popularity, tag categories, status
+distributions and review ratings are read with a lookup instead of a
+GROUP BY over the base tables.
+
+Every summary is partitioned by (SeasonYear, Season) like the base tables.
+After a season is loaded, `refresh` recomputes only the partitions whose
+rows were loaded; without partitions it rebuilds every summary from
+scratch (see refresh_aggregates.py).
+
+Functions:
+    create_tables(conn, replace: bool):
+        Create the summary tables.
+    partitions(tables: dict) -> set[tuple[int, str]]:
+        The (SeasonYear, Season) partitions a page of tables touches.
+    refresh(conn, partitions) -> dict:
+        Recompute the summaries of some or all partitions.
+    verify(conn) -> dict:
+        Count the stored summary rows that differ from a rebuild.
+
+Attributes:
+    SUMMARIES (dict): Mapping of summary table to its source, its keys
+                      within a partition and its aggregate columns.
+    SOURCES (set): The base tables the summaries are computed from.
+"""
+
+import polars as pl
+
+from utils.lake import PARTITIONS
+
+SUMMARIES = {
+    "SeasonSummary": {
+        "source": "Anime",
+        "keys": {},
+        "columns": {
+            "AnimeCount": ("INTEGER", "count(*)"),
+            "ScoredCount": ("INTEGER", "count(MeanScore)"),
+            "MeanScore": ("DOUBLE", "avg(MeanScore)"),
+            "TotalPopularity": ("BIGINT", "sum(Popularity)"),
+            "TotalFavourites": ("BIGINT", "sum(Favourites)"),
+        },
+    },
+    "GenreSummary": {
+        "source": "Genre LEFT JOIN Anime USING (AnimeID, Season, SeasonYear)",
+        "keys": {"Genre": "TEXT"},
+        "columns": {
+            "AnimeCount": ("INTEGER", "count(*)"),
+            "MeanScore": ("DOUBLE", "avg(MeanScore)"),
+            "TotalPopularity": ("BIGINT", "sum(Popularity)"),
+        },
+    },
+    "TagSummary": {
+        "source": "AnimeTag JOIN TagDim USING (TagID)",
+        "keys": {"Category": "TEXT"},
+        "columns": {
+            "TagCount": ("INTEGER", "count(*)"),
+            "AdultCount": ("INTEGER", "count_if(IsAdult)"),
+        },
+    },
+    "StatusSummary": {
+        "source": "Status",
+        "keys": {"UserStatus": "TEXT"},
+        "columns": {
+            "AnimeCount": ("INTEGER", "count(*)"),
+            "TotalUsers": ("BIGINT", "sum(AmountOfUsers)"),
+            "MeanUsers": ("DOUBLE", "avg(AmountOfUsers)"),
+        },
+    },
+    "ReviewSummary": {
+        "source": "Review",
+        "keys": {},
+        "columns": {
+            "ReviewCount": ("INTEGER", "count(*)"),
+            "MeanRating": ("DOUBLE", "avg(Rating)"),
+            "TotalRatings": ("BIGINT", "sum(RatingAmount)"),
+        },
+    },
+}
+
+SOURCES = {"Anime", "Genre", "AnimeTag", "Status", "Review"}
+
+SUMMARY_TABLE = """
+CREATE {} {} (
+    SeasonYear INTEGER,
+    Season VARCHAR(6),
+    {}
+
+    PRIMARY KEY ({})
+);
+"""
+
+
+def create_tables(conn, replace: bool = False):
+    """Create the summary tables.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        replace (bool): Replace existing tables, e.g. with the base tables.
+    """
+    for name, summary in SUMMARIES.items():
+        columns = {**summary["keys"], **{c: t for c, (t, _) in summary["columns"].items()}}
+        conn.execute(
+            SUMMARY_TABLE.format(
+                "OR REPLACE TABLE" if replace else "TABLE IF NOT EXISTS",
+                name,
+                "".join(f"{column} {kind},\n    " for column, kind in columns.items()),
+                ", ".join(PARTITIONS + list(summary["keys"])),
+            )
+        )
+
+
+def partitions(tables: dict) -> set[tuple[int, str]]:
+    """The (SeasonYear, Season) partitions a page of tables touches.
+
+    Args:
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+
+    Returns:
+        set[tuple[int, str]]: The partitions of the rows of the base tables
+                              the summaries are computed from.
+    """
+    touched = set()
+    for table, data in tables.items():
+        if table in SOURCES and isinstance(data, pl.DataFrame):
+            touched.update(data.select(PARTITIONS).drop_nulls().unique().iter_rows())
+    return touched
+
+
+def _aggregate(name: str, where: str = "true") -> str:
+    """The query aggregating a summary from its source, for some partitions."""
+    summary = SUMMARIES[name]
+    groups = PARTITIONS + list(summary["keys"])
+    aggregates = ", ".join(
+        f"{expression} AS {column}" for column, (_, expression) in summary["columns"].items()
+    )
+    # Rows without a partition or key cannot be summarized
+    known = " AND ".join(f"{column} IS NOT NULL" for column in groups)
+    return (
+        f"SELECT {', '.join(groups)}, {aggregates} FROM {summary['source']} "
+        f"WHERE {where} AND {known} GROUP BY ALL"
+    )
+
+
+def refresh(conn, partitions=None) -> dict:
+    """Recompute the summaries of some or all partitions.
+
+    The stale rows of the partitions are deleted and aggregated again from
+    the base tables, in a single transaction.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        partitions (Iterable[tuple[int, str]]): The (SeasonYear, Season)
+                                                partitions to recompute;
+                                                None rebuilds everything.
+
+    Returns:
+        dict: Mapping of summary table to the number of rows written.
+    """
+    where = "true"
+    if partitions is not None:
+        partitions = pl.DataFrame(
+            list(partitions), schema={"SeasonYear": pl.Int64, "Season": pl.String}, orient="row"
+        )
+        if partitions.is_empty():
+            return {}
+        conn.register("refreshed_partitions", partitions)
+        where = "(SeasonYear, Season) IN (SELECT SeasonYear, Season FROM refreshed_partitions)"
+
+    counts = {}
+    conn.begin()
+    try:
+        for name in SUMMARIES:
+            conn.execute(f"DELETE FROM {name} WHERE {where}")
+            counts[name] = conn.execute(
+                f"INSERT INTO {name} BY NAME {_aggregate(name, where)}"
+            ).fetchone()[0]
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if partitions is not None:
+            conn.unregister("refreshed_partitions")
+    conn.commit()
+
+    return counts
+
+
+def verify(conn) -> dict:
+    """Count the stored summary rows that differ from a rebuild.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        dict: Mapping of summary table to the number of rows that are
+              stale, missing or left over; all 0 if the summaries are
+              up to date.
+    """
+    counts = {}
+    for name, summary in SUMMARIES.items():
+        columns = ", ".join(PARTITIONS + list(summary["keys"]) + list(summary["columns"]))
+        stored = f"SELECT {columns} FROM {name}"
+        rebuilt = f"SELECT {columns} FROM ({_aggregate(name)})"
+        counts[name] = conn.execute(
+            f"SELECT count(*) FROM (({stored} EXCEPT ALL {rebuilt}) "
+            f"UNION ALL ({rebuilt} EXCEPT ALL {stored}))"
+        ).fetchone()[0]
+    return counts
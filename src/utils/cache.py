@@ -0,0 +1,156 @@
+"""
+This module provides an on-disk cache of raw GraphQL page responses so that
+reruns (e.g. after changing a preprocess function or the DuckDB schema) do
+not download everything from AniList again.
+
+Entries are gzip compressed and content addressed: the key is a SHA-256 of
+the query text and the request variables, so editing api_query.graphql or
+any variable naturally misses the cache.
+
+Classes:
+    ResponseCache:
+        A size and age bounded cache of response bodies.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """A size and age bounded on-disk cache of response bodies.
+
+    Args:
+        directory (str): Where the entries are stored.
+        max_bytes (int): The total compressed size kept after eviction
+                         (default: 2 GiB).
+        max_age (float): Entries older than this many seconds are treated as
+                         misses and evicted (default: 30 days).
+    """
+
+    # Seconds between two sweeps of the expired entries
+    SWEEP_INTERVAL = 60 * 60
+
+    def __init__(
+        self,
+        directory: str = "src/.cache/responses",
+        max_bytes: int = 2 * 1024**3,
+        max_age: float = 30 * 24 * 60 * 60,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._size = None
+        self._swept = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, variables: dict) -> str:
+        """Return the content address of a request.
+
+        Args:
+            query (str): The GraphQL query text.
+            variables (dict): The request variables.
+
+        Returns:
+            str: A hex SHA-256 digest.
+        """
+        digest = hashlib.sha256(query.encode("UTF-8"))
+        digest.update(json.dumps(variables, sort_keys=True).encode("UTF-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json.gz"):
+                    path = os.path.join(root, name)
+                    yield path, os.stat(path)
+
+    def get(self, query: str, variables: dict, ignore_age: bool = False) -> bytes:
+        """Read a cached response body.
+
+        Args:
+            query (str): The GraphQL query text.
+            variables (dict): The request variables.
+            ignore_age (bool): Return expired entries too (used by replays).
+
+        Returns:
+            bytes: The response body, or None on a miss.
+        """
+        path = self._path(self.key(query, variables))
+        try:
+            age = time.time() - os.stat(path).st_mtime
+            if not ignore_age and age > self.max_age:
+                return None
+            with gzip.open(path, "rb") as file:
+                return file.read()
+        except (OSError, EOFError):
+            return None
+
+    def put(self, query: str, variables: dict, body: bytes):
+        """Store a response body, then evict if the cache is full.
+
+        Expired entries are also evicted on the first put, and then at most
+        once every SWEEP_INTERVAL seconds, whether or not the cache is full.
+
+        Args:
+            query (str): The GraphQL query text.
+            variables (dict): The request variables.
+            body (bytes): The raw response body.
+        """
+        path = self._path(self.key(query, variables))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see partial entries
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(temporary, "wb") as file:
+            file.write(body)
+        size = os.stat(temporary).st_size
+
+        with self._lock:
+            try:
+                # An overwritten entry no longer counts towards the size
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(temporary, path)
+
+            sweep = self._swept is None or time.time() - self._swept > self.SWEEP_INTERVAL
+            if not sweep:
+                self._size += size - replaced
+            full = not sweep and self._size > self.max_bytes
+
+        if sweep or full:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove expired entries, then the oldest ones until under max_bytes.
+
+        Returns:
+            int: The number of removed entries.
+        """
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+            size = sum(stat.st_size for _, stat in entries)
+
+            removed = 0
+            for path, stat in entries:
+                if size <= self.max_bytes and now - stat.st_mtime <= self.max_age:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                size -= stat.st_size
+                removed += 1
+
+            self._size = size
+            self._swept = now
+            return removed
@@ -0,0 +1,225 @@
+"""
+This module records the progress of a transfer in the DuckDB database so
+that an interrupted backfill can resume where it stopped.
+
+A unit of work is one (year, season, page). Its rows and its checkpoint are
+committed in the same transaction, so a unit is either fully loaded and
+recorded or not at all.
+
+A delta sync records the newest media updatedAt it has loaded in the
+SyncWatermark table; the next sync stops paging once it reaches it.
+
+A split transfer (see `FetchEngine(details=...)`) records the updatedAt of
+every media whose reviews and studios it loaded in the MediaVersion table,
+so that later runs only fetch them again for media that changed.
+
+Functions:
+    create_table(conn, replace: bool):
+        Create the TransferCheckpoint, SyncWatermark and MediaVersion tables.
+    pending(conn, plan) -> list[tuple[int, str, int]]:
+        Drop finished seasons from a plan and find the page to resume from.
+    load_unit(conn, year, season, page, has_next_page, tables, record, index, upsert) -> dict:
+        Load the tables of one page and record its checkpoint atomically.
+    watermark(conn) -> int:
+        The updatedAt the last delta sync reached.
+    advance(conn, updated_at):
+        Record the updatedAt a delta sync reached.
+    versions(conn) -> pl.DataFrame:
+        The media whose details were loaded, at the updatedAt they were loaded.
+    version_rows(media: pl.DataFrame, details: pl.DataFrame) -> pl.DataFrame:
+        The MediaVersion rows of the media whose details were fetched.
+"""
+
+import polars as pl
+
+from utils.insert_data import insert_tables
+
+CHECKPOINT_TABLE = """
+CREATE {} TransferCheckpoint (
+    SeasonYear INTEGER,
+    Season VARCHAR(6),
+    Page INTEGER,
+    HasNextPage BOOLEAN,
+    MediaCount INTEGER,
+    InsertedRows INTEGER,
+    CompletedAt TIMESTAMP DEFAULT current_timestamp,
+
+    PRIMARY KEY (SeasonYear, Season, Page)
+);
+"""
+
+WATERMARK_TABLE = """
+CREATE {} SyncWatermark (
+    UpdatedAt BIGINT,
+    SyncedAt TIMESTAMP DEFAULT current_timestamp
+);
+"""
+
+
+VERSION_TABLE = """
+CREATE {} MediaVersion (
+    AnimeID INTEGER PRIMARY KEY,
+    UpdatedAt BIGINT
+);
+"""
+
+
+def create_table(conn, replace: bool = False):
+    """Create the TransferCheckpoint, SyncWatermark and MediaVersion tables.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        replace (bool): Replace existing tables, forgetting all progress.
+    """
+    for table in (CHECKPOINT_TABLE, WATERMARK_TABLE, VERSION_TABLE):
+        conn.execute(table.format("OR REPLACE TABLE" if replace else "TABLE IF NOT EXISTS"))
+
+
+def pending(conn, plan) -> list[tuple[int, str, int]]:
+    """Drop finished seasons from a plan and find the page to resume from.
+
+    A season is finished once a page without a next page was recorded.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        plan (Iterable[tuple[int, str]]): The (year, season) work items.
+
+    Returns:
+        list[tuple[int, str, int]]: The unfinished (year, season, first_page)
+                                    work items, in plan order.
+    """
+    progress = {
+        (year, season): (last_page, finished)
+        for year, season, last_page, finished in conn.execute(
+            """
+            SELECT SeasonYear, Season, max(Page), bool_or(NOT HasNextPage)
+            FROM TransferCheckpoint
+            GROUP BY SeasonYear, Season
+            """
+        ).fetchall()
+    }
+
+    work = []
+    for year, season in plan:
+        last_page, finished = progress.get((year, season), (0, False))
+        if not finished:
+            work.append((year, season, last_page + 1))
+    return work
+
+
+def load_unit(
+    conn, year, season, page, has_next_page, tables, record=True, index=None, upsert=()
+) -> dict:
+    """Load the tables of one page and record its checkpoint atomically.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        year (int): The season year.
+        season (str): The season.
+        page (int): The page number.
+        has_next_page (bool): Whether the season continues after this page.
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+        record (bool): Record the checkpoint. Transfers of only some tables
+                       load their pages without recording them, as the page
+                       is not complete for the other tables.
+        index (utils.key_index.KeyIndex): Known keys; rows with a known key
+                                          are skipped before touching DuckDB.
+        upsert (Iterable[str]): Tables whose changed rows are updated.
+
+    Returns:
+        dict: Mapping of table name to {"inserted": int, "updated": int,
+              "skipped": int}.
+    """
+    conn.begin()
+    try:
+        counts = insert_tables(tables, conn, index, upsert)
+        media = tables.get("Anime")
+        if record:
+            conn.execute(
+                "INSERT OR REPLACE INTO TransferCheckpoint "
+                "(SeasonYear, Season, Page, HasNextPage, MediaCount, InsertedRows) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    year,
+                    season,
+                    page,
+                    has_next_page,
+                    len(media) if hasattr(media, "__len__") else 0,
+                    sum(count["inserted"] for count in counts.values()),
+                ],
+            )
+    except BaseException:
+        conn.rollback()
+        if index is not None:
+            index.rollback()
+        raise
+    conn.commit()
+    if index is not None:
+        index.commit()
+
+    return counts
+
+
+def watermark(conn) -> int:
+    """The updatedAt the last delta sync reached.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        int: The newest media updatedAt (unix time) loaded by a sync, or
+             None if no sync has run yet.
+    """
+    return conn.execute("SELECT max(UpdatedAt) FROM SyncWatermark").fetchone()[0]
+
+
+def advance(conn, updated_at: int):
+    """Record the updatedAt a delta sync reached.
+
+    The watermark never moves backwards: a value that is not newer than the
+    current watermark is not recorded. Older values are kept as history.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        updated_at (int): The newest media updatedAt the sync loaded.
+    """
+    conn.execute(
+        """
+        INSERT INTO SyncWatermark (UpdatedAt)
+        SELECT $1 WHERE $1 > (SELECT coalesce(max(UpdatedAt), 0) FROM SyncWatermark)
+        """,
+        [updated_at],
+    )
+
+
+def versions(conn) -> pl.DataFrame:
+    """The media whose details were loaded, at the updatedAt they were loaded.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        pl.DataFrame: The `id` and `updatedAt` of every recorded media, named
+                      like the API fields for `FetchEngine(versions=...)`.
+    """
+    return conn.execute(
+        'SELECT AnimeID::BIGINT AS id, UpdatedAt AS "updatedAt" FROM MediaVersion'
+    ).pl()
+
+
+def version_rows(media: pl.DataFrame, details: pl.DataFrame) -> pl.DataFrame:
+    """The MediaVersion rows of the media whose details were fetched.
+
+    Load them (upserted) together with the detail tables, so the versions
+    are only recorded once the details are stored.
+
+    Args:
+        media (pl.DataFrame): The core media of a page.
+        details (pl.DataFrame): The details fetched for (some of) them.
+
+    Returns:
+        pl.DataFrame: AnimeID and UpdatedAt of every media in `details`.
+    """
+    return media.join(details.select("id"), on="id", how="semi").select(
+        pl.col("id").alias("AnimeID"), pl.col("updatedAt").alias("UpdatedAt")
+    )
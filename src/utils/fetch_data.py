@@ -4,16 +4,61 @@ based on provided query parameters, including year and season. It handles rate
 limiting and retries if necessary.
 
 Functions:
-    fetch_from(url: str, query: str, year: int, season: str) -> None:
+    page_variables(year: int, season: str, page: int, sort: str) -> dict:
+        Builds the GraphQL variables of a page request (see utils.plan).
+    api_call(url: str, query: str, year: int, season: str, page: int, sort: str):
+        Sends a single page request to the GraphQL API.
+    split_query(query: str, details) -> tuple[str, str]:
+        Splits a page query into a core query and a detail query.
+    plan_seasons(years, seasons) -> list[tuple[int, str]]:
+        Lists the (year, season) work items of a transfer (see utils.plan).
+    fetch_from(url: str, query: str, year: int, season: str) -> pl.DataFrame:
         Fetches data from a given URL based on the provided query, year, and season.
+
+Classes:
+    SeasonResult:
+        The pages retrieved for one (year, season).
+    FetchEngine:
+        Fetches many seasons concurrently under a shared rate budget.
 """
 
+import asyncio
+import functools
+import json
+import queue
+import threading
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
 
 import polars as pl
-import requests
 from tqdm import tqdm
 
+from utils.cache import ResponseCache
+from utils.memory import MemoryBudget
+from utils.metrics import REGISTRY
+from utils.plan import page_variables, plan_seasons
+from utils.rate_limit import RateController
+from utils.graphql import batch, batch_variables, max_batch, parse, project
+from utils.schema import decode_batch, decode_page, media_schema
+from utils.studio_cache import CATALOG_SCHEMA, STUDIO_QUERY, StudioCache, decode_catalog
+from utils.transport import Transport
+
+_TRANSPORT = None
+
+# Returned by FetchEngine._request for requests AniList refused to run
+REJECTED = object()
+
+
+def _transport() -> Transport:
+    """The Transport shared by `api_call` and engines without their own."""
+    global _TRANSPORT
+    if _TRANSPORT is None:
+        _TRANSPORT = Transport()
+    return _TRANSPORT
+
 
 def api_call(
     url: str,
@@ -21,6 +66,7 @@ def api_call(
     year: int,
     season: str,
     page: int,
+    sort: str = "ID",
 ):
     """Fetch data from a given URL with specified query parameters.
 
@@ -30,36 +76,896 @@ def api_call(
         year (int): The year parameter for the query.
         season (str): The season parameter for the query (e.g., 'spring', 'summer', 'fall', 'winter').
         page (int): The page number for paginated results.
+        sort (str): The MediaSort order of the pages.
+
+    Requests share the pooled connections of one module-level Transport.
 
     Returns:
-        dict: The JSON response from the server as a dictionary.
+        requests.Response: The response, or None if the request failed.
     """
 
-    variables = {
-        "page": page,
-        "perPage": 50,  # hard limit of 50 anime entries per page
-        "seasonYear": year,
-        "season": season,
-        "sort": "ID",
-        "type": "ANIME",
-    }
-    try:
-        response = requests.post(
-            url, json={"query": query, "variables": variables}, timeout=10
+    return _transport()(url, query, year, season, page, sort)
+
+
+def split_query(query: str, details) -> tuple[str, str]:
+    """Split a page query into a core query and a detail query.
+
+    The core query selects every media field but the detail fields. The
+    detail query selects the key fields and the detail fields of the media
+    given by the `$ids` variable, paged like the core query. If the query
+    selects none of the detail fields, the detail query is None.
+
+    Args:
+        query (str): The GraphQL page query, e.g. api_query.graphql.
+        details (Iterable[str]): The media fields to move to the detail query.
+
+    Returns:
+        tuple[str, str]: The core query and the detail query.
+    """
+    details = set(details)
+    operation = parse(query)
+    media = operation.get("Page").get("media")
+    core = [selected.key for selected in media.selections if selected.key not in details]
+    if len(core) == len(media.selections):
+        return query, None
+
+    media.selections = [
+        selected
+        for selected in media.selections
+        if selected.key in details or selected.key in ("id", "season", "seasonYear")
+    ]
+    media.arguments = "(id_in: $ids, type: $type)"
+    operation.name = "DetailQuery"
+    operation.variables = "($page: Int, $perPage: Int, $ids: [Int], $type: MediaType)"
+    return project(query, "Page.media", core), operation.render()
+
+
+@dataclass
+class SeasonResult:
+    """The pages retrieved for one (year, season), or for a delta sync.
+
+    Attributes:
+        year (int): The season year; None for a delta sync.
+        season (str): The season (e.g. 'WINTER'); None for a delta sync.
+        first_page (int): The page the fetch started at; frames[i] is page
+                          first_page + i.
+        frames (list[pl.DataFrame]): One DataFrame per non-empty page.
+        pages (int): The number of pages retrieved.
+        cached (int): How many of those pages were read from the cache.
+        rate_limit_remaining (int): The last X-RateLimit-Remaining seen.
+        rate_limit_limit (int): The last X-RateLimit-Limit seen.
+        complete (bool): False if a page could not be fetched after retrying.
+        updated_at (int): The newest media updatedAt seen by a delta sync.
+        details (list[pl.DataFrame]): In a split transfer, the detail fields
+                                      fetched for each page of `frames`.
+        catalogs (list[pl.DataFrame]): With a StudioCache, the catalogue rows
+                                       of the studios first seen (or stale)
+                                       on each page of `frames`.
+        more (bool): When streamed page by page, whether later pages of the
+                     season follow in the next results.
+    """
+
+    year: int
+    season: str
+    first_page: int = 1
+    frames: list = field(default_factory=list)
+    pages: int = 0
+    cached: int = 0
+    rate_limit_remaining: int = None
+    rate_limit_limit: int = None
+    complete: bool = True
+    updated_at: int = None
+    details: list = field(default_factory=list)
+    catalogs: list = field(default_factory=list)
+    more: bool = False
+
+    @property
+    def label(self) -> str:
+        """str: The season (e.g. 'WINTER 2014') the pages belong to."""
+        if self.year is None:
+            return "updated media"
+        return f"{self.season} {self.year}"
+
+    @property
+    def data(self) -> pl.DataFrame:
+        """pl.DataFrame: All pages concatenated, or None if nothing was found."""
+        if not self.frames:
+            return None
+        return pl.concat(self.frames)
+
+
+class FetchEngine:
+    """Fetches many seasons concurrently under a shared rate budget.
+
+    Pages of a season are requested one after another, as each page's
+    `hasNextPage` decides whether there is another one, but up to
+    `concurrency` seasons are in flight at once. Every request first takes
+    a token from a single RateController that is fed by the rate limit
+    headers, and failed pages are retried instead of dropping the season.
+
+    With a ResponseCache, cached pages are served without touching the
+    network or the rate budget and fetched pages are stored. In replay mode
+    only the cache is read, regardless of the age of its entries.
+
+    Response bodies are decoded in the thread pool against a media schema
+    derived from the query, so pages never rely on type inference.
+
+    With `details`, the heavy media fields are left out of the page query
+    and fetched by a second query with `media(id_in: ...)`, only for media
+    that are new or changed since their details were last loaded, so pages
+    stay small and quick to decode.
+
+    With a StudioCache, the catalogue of every studio on a page (all of its
+    media) is fetched the first time the studio is seen, and again once
+    the cache's TTL has passed.
+
+    `iter_pages` streams the seasons instead, one page at a time, for
+    transfers that must not hold a whole season in memory.
+
+    With `batch` > 1, the pages of a season are requested `batch` at a time
+    in one round trip, so a long season costs a fraction of the requests
+    against the rate limit. Pages past the last one come back empty.
+
+    Args:
+        url (str): The GraphQL endpoint.
+        query (str): The GraphQL query.
+        concurrency (int): The maximum number of requests in flight.
+        bucket (RateController): The shared request budget.
+        window (int): How many seasons may be fetched ahead of the consumer.
+        retries (int): How many times a failed page is retried.
+        cache (ResponseCache): Where raw page responses are cached.
+        replay (bool): Serve pages from the cache only, with no network.
+        refresh (bool): Send every request instead of reading the cache,
+                        only writing the fresh responses to it, e.g. to
+                        pick up changed values of cached pages.
+        api (Callable): The function performing one page request
+                        (default: api_call).
+        batch (int): How many pages of a season are requested at once, as
+                     aliases of one batched query; capped by the query
+                     complexity (see `utils.graphql.max_batch`).
+        post (Callable): The function sending one batched request payload
+                         (default: the `post` of `api` if it has one, e.g. a
+                         Transport, else of the shared Transport).
+        details (list[str]): Media fields to fetch in a second phase (e.g.
+                             preprocess.DETAIL_FIELDS) instead of with the
+                             pages; see `split_query`.
+        detail_batch (int): How many media a detail request covers.
+        versions (pl.DataFrame): The `id` and `updatedAt` of media whose
+                                 details are stored (checkpoint.versions);
+                                 their details are not fetched again.
+        studios (utils.studio_cache.StudioCache): Fetch the catalogue of the
+                                                  studios it holds no fresh
+                                                  catalogue of. Not in replay.
+        source_query (str): The query `query` was projected from (see
+                            `utils.graphql.project`). Responses cached for it
+                            are served when the projected query has none,
+                            so a transfer of some tables replays the cache
+                            of a full one.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        query: str,
+        concurrency: int = 4,
+        bucket: RateController = None,
+        window: int = None,
+        retries: int = 5,
+        cache: ResponseCache = None,
+        replay: bool = False,
+        refresh: bool = False,
+        api=None,
+        batch: int = 1,
+        post=None,
+        details=None,
+        detail_batch: int = 25,
+        versions: pl.DataFrame = None,
+        studios: StudioCache = None,
+        source_query: str = None,
+    ):
+        self.url = url
+        self.query = query
+        self.concurrency = concurrency
+        self.bucket = bucket or RateController()
+        self.window = window or concurrency * 2
+        self.retries = retries
+        self.cache = cache
+        self.replay = replay
+        self.refresh = refresh and not replay
+        self.api = api or api_call
+        self.detail_query = None
+        # Mapping of each query to the query it was projected from
+        self.sources = {}
+        if source_query is not None and source_query != query:
+            self.sources[query] = source_query
+        if details:
+            query, self.detail_query = split_query(query, details)
+            self.query = query
+            self.detail_schema = media_schema(self.detail_query)
+            if self.sources:
+                self.sources = dict(
+                    zip((query, self.detail_query), split_query(source_query, details))
+                )
+        self.detail_batch = detail_batch
+        self.versions = versions
+        if versions is not None:
+            self.versions = versions.select(
+                pl.col("id").cast(pl.Int64), pl.col("updatedAt").cast(pl.Int64)
+            )
+        self.schema = media_schema(query)
+        self.studios = studios if not replay else None
+        variables = page_variables(None, None, 1)
+        self.batch = max(1, min(batch, max_batch(query, variables=variables)))
+        self.post = post or getattr(self.api, "post", None)
+        self._batches = {}
+
+    async def fetch_page(self, result: SeasonResult, page: int, sort: str = "ID") -> tuple:
+        """Fetch one page, retrying failed requests with jittered backoff.
+
+        Network errors, 429s and 5xx responses are retried up to `retries`
+        times. After a 429 the controller pauses every request until its
+        Retry-After has elapsed; other failures wait a jittered backoff.
+
+        Args:
+            result (SeasonResult): The season the page belongs to; its page
+                                   count and rate limit fields are updated.
+            page (int): The page number.
+            sort (str): The MediaSort order of the pages. Only pages sorted
+                        by ID are cached, as other orders change over time.
+
+        Returns:
+            tuple[pl.DataFrame, dict]: The media and pageInfo of the page, or
+                                       None if the page could not be fetched.
+        """
+        year, season = result.year, result.season
+        variables = page_variables(year, season, page, sort)
+        return await self._cached(
+            result,
+            f"page {page}",
+            self.query,
+            variables,
+            functools.partial(self.api, self.url, self.query, year, season, page, sort),
+            self._decode,
+            cache=self.cache if sort == "ID" else None,
         )
-        return response
 
-    except requests.exceptions.RequestException as e:
-        print(f"Request failed: {e}")
-        return None
+    async def fetch_pages(self, result: SeasonResult, pages) -> list:
+        """Fetch several pages of a season in one batched request.
 
-    except Exception as e:
-        print(
-            (f"Status Code: {response}. " f"{type(e).__name__}: {e}"),
-            response.json(),
+        Cached pages are served from the cache; the others are requested
+        together as the aliases of one batched query (see
+        `utils.graphql.batch`) and cached one by one, as if fetched alone.
+        A batch AniList rejects (e.g. as too complex) is fetched again in
+        halves, and later batches are no larger than a half.
+
+        Args:
+            result (SeasonResult): The season the pages belong to.
+            pages (Iterable[int]): The page numbers.
+
+        Returns:
+            list[tuple[pl.DataFrame, dict]]: The media and pageInfo of every
+                                             page, None for pages that could
+                                             not be fetched.
+        """
+        pages = list(pages)
+        if len(pages) == 1:
+            return [await self.fetch_page(result, pages[0])]
+
+        loop = asyncio.get_running_loop()
+        slots = [page_variables(result.year, result.season, page) for page in pages]
+        decoded = [None] * len(pages)
+        missing = []
+        for i, variables in enumerate(slots):
+            body = None
+            if self.cache is not None:
+                body = await loop.run_in_executor(
+                    None, self._lookup, self.cache, self.query, variables
+                )
+            if body is not None:
+                result.cached += 1
+                REGISTRY.add("pages", source="cache")
+                decoded[i] = await loop.run_in_executor(None, self._decode, body)
+            elif self.replay:
+                tqdm.write(f"🟨 Page {pages[i]} of {result.label} is not cached.")
+            else:
+                missing.append(i)
+
+        if not missing:
+            return decoded
+
+        query = self._batch_query(len(missing))
+        variables = batch_variables([slots[i] for i in missing])
+        fetched = await self._request(
+            result,
+            f"pages {pages[missing[0]]}-{pages[missing[-1]]}",
+            functools.partial(
+                self.post or _transport().post,
+                self.url,
+                {"query": query, "variables": variables},
+            ),
+            functools.partial(self._decode_batch, count=len(missing)),
+            rejected=True,
         )
+        if fetched is REJECTED:
+            # Likely over the complexity limit: retry in halves, and use the
+            # smaller size for the batches that follow
+            half = len(missing) // 2
+            self.batch = min(self.batch, half)
+            tqdm.write(
+                f"🟨 Batch of {len(missing)} pages of {result.label} rejected; "
+                f"retrying {half} pages at a time."
+            )
+            for part in (missing[:half], missing[half:]):
+                parts = await self.fetch_pages(result, [pages[i] for i in part])
+                for i, retried in zip(part, parts):
+                    decoded[i] = retried
+            return decoded
+        if fetched is None:
+            return decoded
+
+        for i, (media, page_info, page) in zip(missing, fetched[0]):
+            decoded[i] = media, page_info
+            REGISTRY.add("pages", source="network")
+            if self.cache is not None:
+                body = json.dumps({"data": {"Page": page}}).encode("UTF-8")
+                await loop.run_in_executor(None, self.cache.put, self.query, slots[i], body)
+        return decoded
+
+    async def fetch_details(self, result: SeasonResult, media: pl.DataFrame) -> pl.DataFrame:
+        """Fetch the detail fields of the new or changed media of a page.
+
+        Media whose (id, updatedAt) is in `versions` are skipped. The others
+        are requested `detail_batch` at a time with `media(id_in: ...)`,
+        following the pages of each request.
+
+        Args:
+            result (SeasonResult): The season the media belong to.
+            media (pl.DataFrame): The core media of a page.
+
+        Returns:
+            pl.DataFrame: The id, season, seasonYear and detail fields of the
+                          fetched media (empty if none changed), or None if
+                          a request failed.
+        """
+        if self.versions is not None:
+            media = media.join(self.versions, on=["id", "updatedAt"], how="anti")
+        ids = media["id"].to_list()
+
+        frames = []
+        for start in range(0, len(ids), self.detail_batch):
+            chunk = ids[start : start + self.detail_batch]
+            page = 1
+            while True:
+                variables = {
+                    "page": page,
+                    "perPage": self.detail_batch,
+                    "ids": chunk,
+                    "type": "ANIME",
+                }
+                decoded = await self._cached(
+                    result,
+                    f"details of {len(chunk)} media",
+                    self.detail_query,
+                    variables,
+                    functools.partial(
+                        self.post or _transport().post,
+                        self.url,
+                        {"query": self.detail_query, "variables": variables},
+                    ),
+                    self._decode_details,
+                    cache=self.cache,
+                    metric="detail_pages",
+                )
+                if decoded is None:
+                    return None
+                details, page_info = decoded
+                frames.append(details)
+                if len(details) == 0 or not page_info["hasNextPage"]:
+                    break
+                page += 1
+
+        if not frames:
+            return pl.DataFrame(schema=self.detail_schema)
+        return pl.concat(frames)
+
+    async def _cached(
+        self, result, what: str, query: str, variables: dict, send, decode, cache, metric="pages"
+    ):
+        """Serve a request from the cache, or send it and cache the response.
+
+        Args:
+            result (SeasonResult): The season the request belongs to.
+            what (str): The requested page(s), for messages.
+            query (str): The query, part of the cache key.
+            variables (dict): The variables, part of the cache key.
+            send (Callable): Sends the request, see `_request`.
+            decode (Callable): Decodes the response body.
+            cache (ResponseCache): The cache to use, or None.
+            metric (str): The counter of the pages served, by source.
+
+        Returns:
+            The decoded response, or None if it could not be retrieved.
+        """
+        loop = asyncio.get_running_loop()
+        if cache is not None:
+            body = await loop.run_in_executor(None, self._lookup, cache, query, variables)
+            if body is not None:
+                result.cached += 1
+                REGISTRY.add(metric, source="cache")
+                return await loop.run_in_executor(None, decode, body)
+            if self.replay:
+                tqdm.write(f"🟨 {what.capitalize()} of {result.label} not cached.")
+                return None
+
+        fetched = await self._request(result, what, send, decode)
+        if fetched is None:
+            return None
+        decoded, body = fetched
+        REGISTRY.add(metric, source="network")
+        if cache is not None:
+            await loop.run_in_executor(None, cache.put, query, variables, body)
+        return decoded
+
+    def _lookup(self, cache: ResponseCache, query: str, variables: dict) -> bytes:
+        """The cached response of a request, or of the query it was projected from.
+
+        A response of the source query decodes against the schema of the
+        projected one, as the fields it does not select are ignored. Nothing
+        is read when refreshing.
+        """
+        if self.refresh:
+            return None
+        body = cache.get(query, variables, self.replay)
+        if body is None and query in self.sources:
+            body = cache.get(self.sources[query], variables, self.replay)
+        return body
+
+    def _batch_query(self, count: int) -> str:
+        """The batched query for `count` pages, built once per count."""
+        if count not in self._batches:
+            self._batches[count] = batch(self.query, count)
+        return self._batches[count]
+
+    async def _request(
+        self, result: SeasonResult, what: str, send, decode, rejected: bool = False
+    ) -> tuple:
+        """Send one request, retrying failed ones with jittered backoff.
+
+        Args:
+            result (SeasonResult): The season the request belongs to; its
+                                   rate limit fields are updated.
+            what (str): The requested page(s), for messages.
+            send (Callable): Sends the request and returns the response, or
+                             None on network errors.
+            decode (Callable): Decodes the response body.
+            rejected (bool): Return REJECTED for a 400 response, e.g. a
+                             batch over the query complexity limit, so the
+                             caller can retry in smaller parts.
+
+        Returns:
+            tuple: The decoded and raw response body, or None if the request
+                   failed for good.
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            with REGISTRY.timer("rate_wait_seconds"):
+                await self.bucket.acquire()
+            start = time.perf_counter()
+            response = await loop.run_in_executor(None, send)
+            REGISTRY.observe(
+                "request_seconds",
+                time.perf_counter() - start,
+                status=str(response.status_code) if response is not None else "error",
+            )
+
+            if response is not None:
+                headers = response.headers
+                retry_after = self.bucket.observe(response.status_code, headers)
+                if "X-RateLimit-Remaining" in headers:
+                    result.rate_limit_remaining = int(headers["X-RateLimit-Remaining"])
+                    result.rate_limit_limit = int(headers["X-RateLimit-Limit"])
+                    REGISTRY.set("rate_limit_remaining", result.rate_limit_remaining)
+                    REGISTRY.set("rate_limit_limit", result.rate_limit_limit)
+
+                if response.status_code == 200:
+                    REGISTRY.add("response_decoded_bytes", len(response.content))
+                    try:
+                        decoded = await loop.run_in_executor(None, decode, response.content)
+                    except Exception as e:
+                        tqdm.write(f"🟥 Failed to decode {what}: {type(e).__name__}: {e}")
+                    else:
+                        return decoded, response.content
+                elif response.status_code == 400 and rejected:
+                    return REJECTED
+                elif response.status_code != 429 and response.status_code < 500:
+                    tqdm.write(
+                        f"🟥 Failed to retrieve {what} of {result.label}: "
+                        f"status {response.status_code}"
+                    )
+                    return None
+            else:
+                retry_after = None
+
+            if attempt == self.retries:
+                break
+
+            REGISTRY.add("retries")
+            delay = self.bucket.backoff(attempt) if retry_after is None else 0.0
+            tqdm.write(
+                f"🟨 Retrying {what} of {result.label} "
+                f"(attempt {attempt + 2}/{self.retries + 1}, "
+                f"requests remaining: {result.rate_limit_remaining}/{result.rate_limit_limit})"
+            )
+            await asyncio.sleep(delay)
+
+        tqdm.write(f"🟥 Giving up on {what} of {result.label}.")
+        REGISTRY.add("failed_pages")
         return None
 
+    def _decode(self, body: bytes) -> tuple:
+        """Decode a response body against the media schema, timing it."""
+        with REGISTRY.timer("decode_seconds"):
+            return decode_page(body, self.schema)
+
+    def _decode_details(self, body: bytes) -> tuple:
+        """Decode a detail response body against the detail schema, timing it."""
+        with REGISTRY.timer("decode_seconds"):
+            return decode_page(body, self.detail_schema)
+
+    def _decode_batch(self, body: bytes, count: int) -> list:
+        """Decode a batched response body against the media schema, timing it."""
+        with REGISTRY.timer("decode_seconds"):
+            return decode_batch(body, self.schema, count)
+
+    async def _append(self, result: SeasonResult, media: pl.DataFrame) -> bool:
+        """Add a page to a result, with its details in a split transfer.
+
+        Returns:
+            bool: False if the details could not be fetched; the page is
+                  then left out and the result marked incomplete.
+        """
+        if self.detail_query is not None:
+            details = await self.fetch_details(result, media)
+            if details is None:
+                result.complete = False
+                return False
+            result.details.append(details)
+        if self.studios is not None:
+            source = details if self.detail_query is not None else media
+            catalog = None
+            if "studios" in source.columns:
+                ids = source["studios"].struct.field("nodes").explode().struct.field("id")
+                catalog = await self.fetch_catalogs(result, ids.to_list())
+            result.catalogs.append(catalog)
+        result.frames.append(media)
+        return True
+
+    async def fetch_catalogs(self, result: SeasonResult, studios) -> pl.DataFrame:
+        """Fetch the catalogues of the studios the StudioCache claims stale.
+
+        A catalogue that cannot be fetched completely is released and left
+        out; the page itself does not depend on it.
+
+        Args:
+            result (SeasonResult): The season the studios were seen in.
+            studios (Iterable[int]): The studios of a page.
+
+        Returns:
+            pl.DataFrame: The catalogue rows, see `utils.studio_cache`.
+        """
+        frames = []
+        for studio in self.studios.claim(studios):
+            catalog = []
+            page = 1
+            while True:
+                variables = {"id": studio, "page": page, "perPage": 50}
+                fetched = await self._request(
+                    result,
+                    f"page {page} of the catalogue of studio {studio}",
+                    functools.partial(
+                        self.post or _transport().post,
+                        self.url,
+                        {"query": STUDIO_QUERY, "variables": variables},
+                    ),
+                    decode_catalog,
+                )
+                if fetched is None:
+                    self.studios.release(studio)
+                    catalog = []
+                    break
+                (rows, has_next_page), _ = fetched
+                REGISTRY.add("catalog_pages")
+                catalog.append(rows)
+                if not has_next_page:
+                    break
+                page += 1
+            frames += catalog
+
+        if not frames:
+            return pl.DataFrame(schema=CATALOG_SCHEMA)
+        return pl.concat(frames)
+
+    async def stream_season(
+        self, year: int, season: str, first_page: int = 1, budget: MemoryBudget = None
+    ):
+        """Fetch the pages of a season, yielding every page once it is fetched.
+
+        Every result holds one page (page `first_page`) and tells with
+        `more` whether later pages of the season follow. A season ending on
+        an empty page, or on a page that could not be fetched, ends with a
+        result without frames.
+
+        Args:
+            year (int): The season year.
+            season (str): The season.
+            first_page (int): The page to start at, e.g. when resuming.
+            budget (MemoryBudget): Admits every request and holds every
+                                   yielded page until the consumer
+                                   releases it.
+
+        Yields:
+            SeasonResult: The pages, one at a time.
+        """
+        result = SeasonResult(year=year, season=season, first_page=first_page)
+
+        page = first_page
+        while True:
+            if budget is not None:
+                await budget.admit()
+            # The batch size may shrink meanwhile, see `fetch_pages`
+            pages = range(page, page + self.batch)
+            for decoded in await self.fetch_pages(result, pages):
+                if decoded is None:
+                    result.complete = False
+                    yield result
+                    return
+                result.pages += 1
+
+                media, page_info = decoded
+                if len(media) == 0 or not await self._append(result, media):
+                    yield result
+                    return
+
+                result.more = page_info["hasNextPage"]
+                if budget is not None:
+                    budget.hold()
+                yield result
+                # Stop if there are no more pages
+                if not result.more:
+                    return
+
+                result = SeasonResult(
+                    year=year,
+                    season=season,
+                    first_page=result.first_page + 1,
+                    rate_limit_remaining=result.rate_limit_remaining,
+                    rate_limit_limit=result.rate_limit_limit,
+                )
+
+            page = pages.stop
+
+    async def fetch_season(
+        self, year: int, season: str, first_page: int = 1
+    ) -> SeasonResult:
+        """Fetch every page of a season.
+
+        Args:
+            year (int): The season year.
+            season (str): The season.
+            first_page (int): The page to start at, e.g. when resuming.
+
+        Returns:
+            SeasonResult: The retrieved pages.
+        """
+        result = SeasonResult(year=year, season=season, first_page=first_page)
+
+        async for part in self.stream_season(year, season, first_page):
+            result.frames += part.frames
+            result.details += part.details
+            result.catalogs += part.catalogs
+            result.pages += part.pages
+            result.cached += part.cached
+            result.rate_limit_remaining = part.rate_limit_remaining
+            result.rate_limit_limit = part.rate_limit_limit
+            result.complete = part.complete
+
+        return result
+
+    async def fetch_updates(self, since: int = None) -> SeasonResult:
+        """Fetch the media updated since a watermark, newest first.
+
+        Pages are requested sorted by update time and paging stops one page
+        after the first page reaching the watermark, so only the changed
+        media are fetched. The watermark second itself is re-read, since
+        more media may have been updated within it after the last sync, and
+        the extra page catches media pushed down the order by updates made
+        during the walk. Without a watermark only the newest page is
+        fetched, to find the current one.
+
+        Args:
+            since (int): The updatedAt (unix time) of the last sync.
+
+        Returns:
+            SeasonResult: The changed media; `updated_at` is the newest
+                          updatedAt seen, the watermark of the next sync.
+        """
+        result = SeasonResult(year=None, season=None)
+
+        page = 1
+        reached = False
+        while True:
+            decoded = await self.fetch_page(result, page, sort="UPDATED_AT_DESC")
+            if decoded is None:
+                result.complete = False
+                break
+            result.pages += 1
+
+            media, page_info = decoded
+            if len(media) == 0:
+                break
+            if result.updated_at is None:
+                result.updated_at = media["updatedAt"].max()
+
+            changed = media if since is None else media.filter(pl.col("updatedAt") >= since)
+            if len(changed) and not await self._append(result, changed):
+                break
+
+            if since is None or reached or not page_info["hasNextPage"]:
+                break
+
+            # Updates made during the walk shift media down by up to a page
+            reached = len(changed) < len(media)
+            page += 1
+
+        return result
+
+    def sync(self, since: int = None) -> SeasonResult:
+        """Synchronous wrapper around `fetch_updates`.
+
+        Args:
+            since (int): The updatedAt (unix time) of the last sync.
+
+        Returns:
+            SeasonResult: The changed media.
+        """
+        return asyncio.run(self.fetch_updates(since))
+
+    async def run(self, plan):
+        """Fetch the planned seasons, yielding them in plan order.
+
+        Args:
+            plan (Iterable[tuple]): The (year, season) or
+                                    (year, season, first_page) work items.
+
+        Yields:
+            SeasonResult: The retrieved pages of each season.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guarded(*item):
+            async with semaphore:
+                return await self.fetch_season(*item)
+
+        plan = iter(plan)
+        pending = deque(
+            asyncio.create_task(guarded(*item)) for item in islice(plan, self.window)
+        )
+        try:
+            while pending:
+                result = await pending.popleft()
+                for item in islice(plan, 1):
+                    pending.append(asyncio.create_task(guarded(*item)))
+                yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def iter_seasons(self, plan):
+        """Synchronous wrapper around `run` for use outside of asyncio.
+
+        The event loop runs in a background thread; at most `window` fetched
+        seasons wait for the consumer.
+
+        Args:
+            plan (Iterable[tuple]): The (year, season) or
+                                    (year, season, first_page) work items.
+
+        Yields:
+            SeasonResult: The retrieved pages of each season.
+        """
+        return self._iterate(self.run(plan), self.window)
+
+    def iter_pages(self, plan, budget: MemoryBudget = None):
+        """Fetch the planned seasons one page at a time, for streaming.
+
+        Seasons are fetched one after another and every page is handed to
+        the consumer on its own (see `stream_season`), so memory is bounded
+        by a few pages instead of the largest season. With a budget, the
+        consumer releases every page with frames once it is loaded.
+
+        Args:
+            plan (Iterable[tuple]): The (year, season) or
+                                    (year, season, first_page) work items.
+            budget (MemoryBudget): Bounds the pages held in memory.
+
+        Yields:
+            SeasonResult: The pages of every season, one at a time.
+        """
+
+        async def pages():
+            for item in plan:
+                async for result in self.stream_season(*item, budget=budget):
+                    yield result
+                    # Not kept alive while the next page is fetched
+                    del result
+
+        return self._iterate(pages(), 1)
+
+    def _iterate(self, results, maxsize: int):
+        """Drain an async iterator in a background event loop.
+
+        If the consumer stops early, closing the generator cancels the
+        iterator and its pending fetches, and the event loop shuts down.
+
+        Args:
+            results (AsyncIterator): The results, e.g. of `run`.
+            maxsize (int): How many results may wait for the consumer.
+
+        Yields:
+            SeasonResult: The results, in order.
+        """
+        queued = queue.Queue(maxsize=maxsize)
+        done = object()
+        stop = threading.Event()
+
+        def put(item) -> bool:
+            # Gives up once the consumer is gone instead of blocking forever
+            while not stop.is_set():
+                try:
+                    queued.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        async def drain():
+            loop = asyncio.get_running_loop()
+            try:
+                async for result in results:
+                    if not await loop.run_in_executor(None, put, result):
+                        return
+                    del result
+            except Exception as e:
+                await loop.run_in_executor(None, put, e)
+            finally:
+                await results.aclose()
+            await loop.run_in_executor(None, put, done)
+
+        async def supervise():
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(self.concurrency))
+            task = asyncio.create_task(drain())
+            while not (await asyncio.wait({task}, timeout=0.1))[0]:
+                # A consumer that stopped early no longer releases pages or
+                # takes results, so the fetches waiting on it are cancelled
+                if stop.is_set():
+                    task.cancel()
+            if not task.cancelled():
+                task.result()
+
+        threading.Thread(target=asyncio.run, args=(supervise(),), daemon=True).start()
+
+        try:
+            while True:
+                result = queued.get()
+                if result is done:
+                    return
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+                del result
+        finally:
+            stop.set()
+
 
 def fetch_from(
     url: str,
@@ -71,69 +977,31 @@ def fetch_from(
 
     Args:
         url (str): The URL to send the POST request to.
-        query (str): _description_
-        year (int): _description_
-        season (str): _description_
+        query (str): The GraphQL query.
+        year (int): The season year to fetch.
+        season (str): The season to fetch.
 
     Returns:
         pl.DataFrame: the aggregated data from the API response.
+        tuple[int, int]: The remaining and maximum requests if no anime were found.
     """
 
-    data = []
-    current_page = 1
-    no_more_pages = False
-    while not no_more_pages:
-        try:  # Try and retrieve data
-            response = api_call(url, query, year, season, current_page)
-
-            headers = dict(response.headers)
-            rate_limit_remaining = int(headers["X-RateLimit-Remaining"])
-            rate_limit_limit = int(headers["X-RateLimit-Limit"])
-
-            ## Rate limiting and retrying
-            if response.status_code == 429 or rate_limit_remaining < 20:
-                tqdm.write(
-                    (
-                        f"Rate limit exceeded ({rate_limit_remaining}/{rate_limit_remaining}). "
-                        f"Stopping at page {current_page}."
-                        "\nTrying again in 300 seconds."
-                    )
-                )
-
-                time.sleep(1)
-                break
-
-        except Exception as e:
-            print(f"Failed to retrieve data: {e}")
-            break
-        else:
-            response_data = response.json()
-
-        media = response_data["data"]["Page"]["media"]
-
-        if len(media) == 0:
-            return (rate_limit_remaining, rate_limit_limit)
-
-        data.append(pl.DataFrame(media))
-
-        # Stop if there are no more pages
-        if not response_data["data"]["Page"]["pageInfo"]["hasNextPage"]:
-            no_more_pages = True
-            break
+    engine = FetchEngine(url, query, concurrency=1)
+    result = next(engine.iter_seasons([(year, season)]))
 
-        # Continue looping for pages
-        current_page += 1
+    if not result.frames:
+        return (result.rate_limit_remaining, result.rate_limit_limit)
 
     try:
-        aggregated_data = pl.concat(data)
+        aggregated_data = result.data
     except Exception as e:
         print(f"Failed to aggregate data: {type(e).__name__}: {e}")
     else:
         # Write a summary of the data retrieval
         tqdm.write(
-            f"🟩 Maximum pages retrieved ({current_page}). "
+            f"🟩 Maximum pages retrieved ({result.pages}). "
             f"Retrieved {len(aggregated_data)} anime entries. "
-            f"Requests remaining: {rate_limit_remaining}/{rate_limit_limit}"
+            f"Requests remaining: {result.rate_limit_remaining}/{result.rate_limit_limit}"
         )
 
         return aggregated_data
@@ -0,0 +1,434 @@
+"""
+This module parses the selection sets of a GraphQL query (such as
+api_query.graphql) into a tree of fields and renders such trees back to
+query text.
+
+Only the subset of GraphQL used by this project is supported: a single
+operation with variables, fields with aliases, arguments and nested
+selections. Arguments are kept as raw text.
+
+A query can also be batched: its root field is repeated under the aliases
+p1, p2, ..., each with its own copy of the per-page variables, so several
+pages (of one or several seasons) are fetched in one request.
+
+Classes:
+    Field:
+        A selected field and its sub-selections.
+    Operation:
+        A parsed query operation.
+
+Functions:
+    parse(query: str) -> Operation:
+        Parse a query.
+    render(fields, indent: int) -> str:
+        Render a list of fields as a selection set.
+    prune(fields, paths) -> list[Field]:
+        Keep only the fields on the given paths.
+    project(query: str, root: str, paths) -> str:
+        Reduce the selection below a root field to the given paths.
+    complexity(fields, variables: dict) -> int:
+        Estimate the query complexity of a selection.
+    max_batch(query: str, root: str, limit: int, variables: dict) -> int:
+        The most aliased copies of a root field a request may carry.
+    batch(query: str, count: int, root: str, slot_variables) -> str:
+        Repeat the root field of a query under aliases.
+    batch_variables(slots, slot_variables) -> dict:
+        Merge the variables of every alias of a batched query.
+    split_variables(variables: dict) -> list[dict]:
+        Recover the variables of every alias of a batched query.
+
+Attributes:
+    COMPLEXITY_LIMIT (int): The query complexity AniList allows per request.
+    CONNECTION_SIZE (int): The page size of connections (e.g. `reviews`)
+                           queried without a perPage argument.
+    SLOT_VARIABLES (tuple): The variables that differ between batched pages.
+"""
+
+import re
+from dataclasses import dataclass, field, replace
+
+COMPLEXITY_LIMIT = 500
+CONNECTION_SIZE = 25
+SLOT_VARIABLES = ("page", "seasonYear", "season")
+
+_PER_PAGE = re.compile(r"perPage\s*:\s*(\$?\w+)")
+_TOKEN = re.compile(
+    r"""
+    (?P<skip>[\s,]+|\#[^\n]*)
+    | (?P<name>[_A-Za-z][_0-9A-Za-z]*)
+    | (?P<punct>\.\.\.|[{}():\[\]!=$@])
+    | (?P<string>"(?:\\.|[^"\\])*")
+    | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+    """,
+    re.VERBOSE,
+)
+
+
+@dataclass
+class Field:
+    """A selected field and its sub-selections.
+
+    Attributes:
+        name (str): The field name.
+        alias (str): The response key if the field is aliased.
+        arguments (str): The raw argument text, e.g. "(page: $page)".
+        selections (list[Field]): The selected sub-fields; empty for leaves.
+    """
+
+    name: str
+    alias: str = None
+    arguments: str = ""
+    selections: list = field(default_factory=list)
+
+    @property
+    def key(self) -> str:
+        """str: The key of the field in the response."""
+        return self.alias or self.name
+
+    def get(self, name: str):
+        """Return the sub-field with the given response key, or None."""
+        for selection in self.selections:
+            if selection.key == name:
+                return selection
+        return None
+
+
+@dataclass
+class Operation:
+    """A parsed query operation.
+
+    Attributes:
+        kind (str): The operation type, e.g. "query".
+        name (str): The operation name.
+        variables (str): The raw variable definitions, e.g. "($page: Int)".
+        selections (list[Field]): The root fields.
+    """
+
+    kind: str
+    name: str
+    variables: str
+    selections: list
+
+    def get(self, name: str):
+        """Return the root field with the given response key, or None."""
+        return Field("", selections=self.selections).get(name)
+
+    def render(self) -> str:
+        """Render the operation back to query text.
+
+        Returns:
+            str: The query.
+        """
+        header = " ".join(part for part in (self.kind, self.name) if part)
+        return f"{header}{self.variables} {render(self.selections)}\n"
+
+
+def _tokenize(text: str):
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Unexpected character {text[position]!r} at {position}")
+        if match.lastgroup != "skip":
+            yield match.group(), match.start(), match.end()
+        position = match.end()
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = list(_tokenize(text))
+        self.index = 0
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index][0]
+        return None
+
+    def take(self, expected: str = None):
+        if self.index >= len(self.tokens):
+            raise ValueError("Unexpected end of query")
+        token = self.tokens[self.index]
+        if expected is not None and token[0] != expected:
+            raise ValueError(f"Expected {expected!r} but found {token[0]!r} at {token[1]}")
+        self.index += 1
+        return token
+
+    def balanced(self) -> str:
+        """Consume a parenthesised group and return its raw text."""
+        _, start, _ = self.take("(")
+        depth = 1
+        while depth:
+            token, _, end = self.take()
+            depth += {"(": 1, ")": -1}.get(token, 0)
+        return self.text[start:end]
+
+    def operation(self) -> Operation:
+        kind, name, variables = "query", None, ""
+        if self.peek() != "{":
+            kind = self.take()[0]
+            if self.peek() not in ("(", "{"):
+                name = self.take()[0]
+            if self.peek() == "(":
+                variables = self.balanced()
+        return Operation(kind, name, variables, self.selection_set())
+
+    def selection_set(self) -> list:
+        self.take("{")
+        fields = []
+        while self.peek() != "}":
+            name = self.take()[0]
+            alias = None
+            if self.peek() == ":":
+                self.take(":")
+                alias, name = name, self.take()[0]
+            arguments = self.balanced() if self.peek() == "(" else ""
+            selections = self.selection_set() if self.peek() == "{" else []
+
+            selected = Field(name, alias, arguments, selections)
+            duplicate = next((f for f in fields if f.key == selected.key), None)
+            if duplicate is None:
+                fields.append(selected)
+            else:
+                # Selecting the same field twice merges the selections
+                for selection in selections:
+                    if duplicate.get(selection.key) is None:
+                        duplicate.selections.append(selection)
+        self.take("}")
+        return fields
+
+
+def parse(query: str) -> Operation:
+    """Parse a query.
+
+    Args:
+        query (str): The GraphQL query text.
+
+    Returns:
+        Operation: The parsed operation.
+    """
+    return _Parser(query).operation()
+
+
+def render(fields, indent: int = 0) -> str:
+    """Render a list of fields as a selection set.
+
+    Args:
+        fields (list[Field]): The fields to render.
+        indent (int): The indentation of the closing brace.
+
+    Returns:
+        str: The selection set, starting with "{".
+    """
+    pad = "  " * (indent + 1)
+    lines = ["{"]
+    for selected in fields:
+        line = pad
+        if selected.alias:
+            line += f"{selected.alias}: "
+        line += selected.name + selected.arguments
+        if selected.selections:
+            line += " " + render(selected.selections, indent + 1)
+        lines.append(line)
+    lines.append("  " * indent + "}")
+    return "\n".join(lines)
+
+
+def prune(fields, paths) -> list:
+    """Keep only the fields on the given paths.
+
+    A path selects a field with its whole sub-selection ("reviews") or a
+    field nested below it ("reviews.nodes.user.id"). Field order is kept;
+    paths that do not exist in `fields` are ignored.
+
+    Args:
+        fields (list[Field]): The selection to prune.
+        paths (Iterable[str]): Dotted response key paths.
+
+    Returns:
+        list[Field]: The pruned copy of the selection.
+    """
+    paths = [path.split(".") for path in paths]
+
+    pruned = []
+    for selected in fields:
+        below = [path[1:] for path in paths if path[0] == selected.key]
+        if not below:
+            continue
+        if [] in below or not selected.selections:
+            pruned.append(selected)
+            continue
+        selections = prune(selected.selections, (".".join(path) for path in below))
+        if selections:
+            pruned.append(Field(selected.name, selected.alias, selected.arguments, selections))
+    return pruned
+
+
+def project(query: str, root: str, paths) -> str:
+    """Reduce the selection below a root field to the given paths.
+
+    Args:
+        query (str): The GraphQL query text.
+        root (str): The dotted path of the root field, e.g. "Page.media".
+        paths (Iterable[str]): The paths to keep below the root.
+
+    Returns:
+        str: The projected query.
+    """
+    operation = parse(query)
+    parent = operation
+    for key in root.split("."):
+        parent = parent.get(key)
+    parent.selections = prune(parent.selections, paths)
+    return operation.render()
+
+
+def _page_size(selected: Field, variables: dict) -> int:
+    """The perPage argument of a field, resolved from the variables, or None."""
+    match = _PER_PAGE.search(selected.arguments)
+    if match is None:
+        return None
+    value = match.group(1)
+    if value.startswith("$"):
+        value = (variables or {}).get(value[1:])
+    return int(value) if value is not None else None
+
+
+def complexity(fields, variables: dict = None) -> int:
+    """Estimate the query complexity of a selection.
+
+    Every selected field counts once, and every list counts once per
+    element it can return: the lists of a `Page` (other than pageInfo)
+    count `perPage` times, and the `nodes` and `edges` of a connection count
+    its perPage argument, or CONNECTION_SIZE, times. Lists that are not
+    paginated (e.g. tags) count once. AniList's own scoring is not
+    published in detail, so requests may still be rejected.
+
+    Args:
+        fields (list[Field]): The selection.
+        variables (dict): The values of the query variables, for perPage
+                          arguments given as variables.
+
+    Returns:
+        int: The estimated complexity.
+    """
+    total = 0
+    for selected in fields:
+        size = _page_size(selected, variables)
+        total += 1
+        for child in selected.selections:
+            cost = complexity([child], variables)
+            if child.name in ("nodes", "edges"):
+                cost *= size or CONNECTION_SIZE
+            elif selected.name == "Page" and child.name != "pageInfo":
+                cost *= size or CONNECTION_SIZE
+            total += cost
+    return total
+
+
+def max_batch(
+    query: str, root: str = "Page", limit: int = COMPLEXITY_LIMIT, variables: dict = None
+) -> int:
+    """The most aliased copies of a root field a request may carry.
+
+    Args:
+        query (str): The GraphQL query text.
+        root (str): The root field that is repeated.
+        limit (int): The complexity allowed per request.
+        variables (dict): The values of the query variables.
+
+    Returns:
+        int: The number of copies, at least 1.
+    """
+    return max(1, limit // complexity([parse(query).get(root)], variables))
+
+
+def _slot(name: str, index: int) -> str:
+    return f"{name}_{index}"
+
+
+def _rename(selected: Field, pattern, index: int) -> Field:
+    """Copy a field, suffixing the slot variables in all of its arguments."""
+    return replace(
+        selected,
+        arguments=pattern.sub(
+            lambda match: "$" + _slot(match.group(1), index), selected.arguments
+        ),
+        selections=[_rename(child, pattern, index) for child in selected.selections],
+    )
+
+
+def batch(query: str, count: int, root: str = "Page", slot_variables=SLOT_VARIABLES) -> str:
+    """Repeat the root field of a query under the aliases p1 ... p<count>.
+
+    Every copy refers to its own slot variables (e.g. `$page_2`), declared
+    with the type of the original variable; the other variables (e.g.
+    `$perPage`, `$sort`) are shared by all copies.
+
+    Args:
+        query (str): The GraphQL query text.
+        count (int): The number of copies.
+        root (str): The root field to repeat.
+        slot_variables (Iterable[str]): The variables every copy gets its own of.
+
+    Returns:
+        str: The batched query. The response holds one `Page` per alias.
+    """
+    operation = parse(query)
+    slot_variables = tuple(slot_variables)
+    pattern = re.compile(r"\$(" + "|".join(map(re.escape, slot_variables)) + r")\b")
+
+    definitions = []
+    for name, kind in re.findall(r"\$(\w+)\s*:\s*([^,)$]+)", operation.variables):
+        names = [_slot(name, i) for i in range(1, count + 1)] if name in slot_variables else [name]
+        definitions += [f"${variable}: {kind.strip()}" for variable in names]
+    operation.variables = "(" + ", ".join(definitions) + ")"
+
+    copied = operation.get(root)
+    copies = [
+        replace(_rename(copied, pattern, i), alias=f"p{i}") for i in range(1, count + 1)
+    ]
+    operation.selections = [
+        selection for selected in operation.selections
+        for selection in (copies if selected is copied else [selected])
+    ]
+    return operation.render()
+
+
+def batch_variables(slots, slot_variables=SLOT_VARIABLES) -> dict:
+    """Merge the variables of every alias of a batched query.
+
+    Args:
+        slots (list[dict]): The variables of each page, in alias order.
+        slot_variables (Iterable[str]): The variables every alias gets its own of.
+
+    Returns:
+        dict: The variables of the batched request; the shared ones are
+              taken from the first slot.
+    """
+    variables = {
+        name: value for name, value in slots[0].items() if name not in slot_variables
+    }
+    for i, slot in enumerate(slots, start=1):
+        for name in slot_variables:
+            variables[_slot(name, i)] = slot.get(name)
+    return variables
+
+
+def split_variables(variables: dict) -> list:
+    """Recover the variables of every alias of a batched query.
+
+    Args:
+        variables (dict): The variables of a batched request.
+
+    Returns:
+        list[dict]: The variables of each alias, in alias order.
+    """
+    shared, slots = {}, {}
+    for name, value in variables.items():
+        match = re.fullmatch(r"(\w+)_(\d+)", name)
+        if match is None:
+            shared[name] = value
+        else:
+            slots.setdefault(int(match.group(2)), {})[match.group(1)] = value
+    return [{**shared, **slots[i]} for i in sorted(slots)]
@@ -1,8 +1,25 @@
 """
 This module provides functionality to insert data into a DuckDB database.
+
+Functions:
+    insert_data(row, table, conn):
+        Insert a single row into a table.
+    primary_key(table, conn) -> list[str]:
+        The primary key columns of a table.
+    bulk_insert(data, table, conn) -> tuple[int, int]:
+        Insert a whole Polars DataFrame into a table in one statement.
+    bulk_upsert(data, table, conn) -> tuple[int, int, int]:
+        Insert new rows and update changed rows of a table in one statement.
+    insert_tables(tables, conn, index, upsert) -> dict:
+        Bulk insert several preprocessed tables.
+    load_tables(tables, conn, index, upsert) -> dict:
+        Bulk insert several preprocessed tables in a single transaction.
 """
 
 import duckdb
+import polars as pl
+
+from utils.metrics import REGISTRY
 
 
 def insert_data(row, table, conn):
@@ -31,4 +48,202 @@ def insert_data(row, table, conn):
         return 404
     except duckdb.BinderException as e:
         print(f"Error inserting data: {e}")
-        return 500
\ No newline at end of file
+        return 500
+
+
+def primary_key(table: str, conn) -> list[str]:
+    """The primary key columns of a table.
+
+    Args:
+        table (str): The name of the table.
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        list[str]: The key columns, in key order; empty without a primary key.
+    """
+    row = conn.execute(
+        "SELECT constraint_column_names FROM duckdb_constraints() "
+        "WHERE constraint_type = 'PRIMARY KEY' AND table_name = ?",
+        [table],
+    ).fetchone()
+    return list(row[0]) if row else []
+
+
+def bulk_insert(data: pl.DataFrame, table: str, conn) -> tuple[int, int]:
+    """Insert a whole DataFrame into the specified table in one statement.
+
+    The DataFrame is registered with DuckDB as an Arrow scan and inserted
+    by column name. Rows whose primary key already exists (in the table or
+    earlier in the same DataFrame) are skipped with ON CONFLICT DO NOTHING.
+    Rows with a null key column (e.g. exploded from an empty nested list)
+    cannot be stored and are skipped as well.
+
+    Args:
+        data (pl.DataFrame): The preprocessed rows to insert.
+        table (str): The name of the table to insert data into.
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        tuple[int, int]: The number of inserted rows and skipped rows.
+    """
+
+    rows = len(data)
+    key = primary_key(table, conn)
+    if key:
+        data = data.drop_nulls(key)
+    if data.is_empty():
+        return 0, rows
+
+    staged = f"staged_{table.lower()}"
+    conn.register(staged, data)
+    try:
+        inserted = conn.execute(
+            f'INSERT INTO "{table}" BY NAME SELECT * FROM {staged} '
+            "ON CONFLICT DO NOTHING"
+        ).fetchone()[0]
+    finally:
+        conn.unregister(staged)
+
+    return inserted, rows - inserted
+
+
+def bulk_upsert(data: pl.DataFrame, table: str, conn) -> tuple[int, int, int]:
+    """Insert new rows and update changed rows of a table in one statement.
+
+    The DataFrame is registered with DuckDB and merged into the table on its
+    primary key. A row whose key already exists is only updated when the
+    hash of its non-key columns differs from the hash of the stored row, so
+    unchanged rows are never rewritten. Rows are cast to the column types
+    of the table before hashing, so both hashes describe the same values.
+    When a key occurs several times in the DataFrame, the last row wins.
+
+    Args:
+        data (pl.DataFrame): The preprocessed rows to upsert.
+        table (str): The name of the table to upsert data into.
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+
+    Returns:
+        tuple[int, int, int]: The number of inserted, updated and skipped
+                              (unchanged, duplicate or null-key) rows.
+    """
+
+    key = primary_key(table, conn)
+    if not key:
+        inserted, skipped = bulk_insert(data, table, conn)
+        return inserted, 0, skipped
+
+    rows = len(data)
+    data = data.drop_nulls(key).unique(subset=key, keep="last", maintain_order=True)
+    if data.is_empty():
+        return 0, 0, rows
+
+    types = dict(
+        conn.execute(
+            "SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = ?",
+            [table],
+        ).fetchall()
+    )
+    columns = [column for column in data.columns if column in types]
+    values = [column for column in columns if column not in key]
+
+    staged = f"staged_{table.lower()}"
+    source = ", ".join(f'CAST("{column}" AS {types[column]}) AS "{column}"' for column in columns)
+    condition = " AND ".join(f'target."{column}" = source."{column}"' for column in key)
+    matched = ""
+    if values:
+        stored = ", ".join(f'target."{column}"' for column in values)
+        incoming = ", ".join(f'source."{column}"' for column in values)
+        assignments = ", ".join(f'"{column}" = source."{column}"' for column in values)
+        matched = (
+            f"WHEN MATCHED AND hash({stored}) IS DISTINCT FROM hash({incoming}) "
+            f"THEN UPDATE SET {assignments} "
+        )
+
+    conn.register(staged, data)
+    try:
+        actions = conn.execute(
+            f'MERGE INTO "{table}" AS target '
+            f"USING (SELECT {source} FROM {staged}) AS source "
+            f"ON {condition} "
+            f"{matched}"
+            "WHEN NOT MATCHED THEN INSERT BY NAME "
+            "RETURNING merge_action"
+        ).fetchall()
+    finally:
+        conn.unregister(staged)
+
+    inserted = sum(action == "INSERT" for action, in actions)
+    updated = len(actions) - inserted
+    return inserted, updated, rows - len(actions)
+
+
+def insert_tables(tables: dict, conn, index=None, upsert=()) -> dict:
+    """Bulk insert several preprocessed tables.
+
+    Args:
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+                       Entries that are not DataFrames (e.g. the 501 returned
+                       by preprocess on a SchemaError) are ignored.
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        index (utils.key_index.KeyIndex): Known keys; rows with a known key
+                                          are skipped before touching DuckDB.
+                                          The caller commits or rolls back
+                                          the index with the transaction.
+        upsert (Iterable[str]): Tables whose changed rows are updated with
+                                `bulk_upsert` instead of skipped.
+
+    Returns:
+        dict: Mapping of table name to {"inserted": int, "updated": int,
+              "skipped": int} for every table that was loaded.
+    """
+
+    counts = {}
+    for table, data in tables.items():
+        if not isinstance(data, pl.DataFrame):
+            continue
+        with REGISTRY.timer("insert_seconds", table=table):
+            if table in upsert:
+                if index is not None:
+                    # Known rows still have to be compared; only stage new keys
+                    index.filter(table, data)
+                inserted, updated, skipped = bulk_upsert(data, table, conn)
+            else:
+                rows = len(data)
+                if index is not None:
+                    data = index.filter(table, data)
+                inserted, _ = bulk_insert(data, table, conn)
+                updated, skipped = 0, rows - inserted
+        counts[table] = {"inserted": inserted, "updated": updated, "skipped": skipped}
+        for name, value in counts[table].items():
+            REGISTRY.add(f"{name}_rows", value, table=table)
+
+    return counts
+
+
+def load_tables(tables: dict, conn, index=None, upsert=()) -> dict:
+    """Bulk insert several preprocessed tables in a single transaction.
+
+    Args:
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        index (utils.key_index.KeyIndex): Known keys, see `insert_tables`.
+        upsert (Iterable[str]): Tables to upsert, see `insert_tables`.
+
+    Returns:
+        dict: Mapping of table name to {"inserted": int, "updated": int,
+              "skipped": int} for every table that was loaded.
+    """
+
+    conn.begin()
+    try:
+        counts = insert_tables(tables, conn, index, upsert)
+    except BaseException:
+        conn.rollback()
+        if index is not None:
+            index.rollback()
+        raise
+    conn.commit()
+    if index is not None:
+        index.commit()
+
+    return counts
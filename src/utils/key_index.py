@@ -0,0 +1,138 @@
+"""
+This module keeps the primary keys already stored in the database in memory
+for a whole run, so that rows seen before (the same users, studios and tags
+appear in many seasons) are dropped with a vectorized anti-join before they
+reach DuckDB.
+
+The index is warmed from the tables at startup and saved as Parquet
+snapshots at the end of a run. A snapshot is only reused while its
+fingerprint still matches the table, so an index can never hide rows that
+are missing from the database. The fingerprint is computed from the keys
+themselves, in one scan of the key columns: the row count and the XOR of
+the hashes of every key, which changes whenever a key is removed, added or
+replaced, however the table was changed (up to a 64-bit hash collision).
+
+Classes:
+    KeyIndex:
+        Per-table primary keys known to be stored.
+"""
+
+import json
+import os
+
+import polars as pl
+
+from utils.insert_data import primary_key
+
+
+class KeyIndex:
+    """Per-table primary keys known to be stored.
+
+    Keys found by `filter` are only staged; `commit` adds them to the index
+    once the transaction that inserted them has been committed, and
+    `rollback` forgets them.
+
+    Args:
+        directory (str): Where the Parquet snapshots are saved.
+    """
+
+    def __init__(self, directory: str = "src/.cache/keys"):
+        self.directory = directory
+        self.columns = {}
+        self._chunks = {}
+        self._staged = []
+
+    def _fingerprint(self, table: str, conn) -> list:
+        """The row count and the XOR of the key hashes of an indexed table."""
+        columns = ", ".join(f'"{column}"' for column in self.columns[table])
+        return list(
+            conn.execute(
+                f'SELECT count(*), coalesce(bit_xor(hash({columns})), 0) FROM "{table}"'
+            ).fetchone()
+        )
+
+    def _manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.directory, "manifest.json"), encoding="UTF-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def warm(self, conn, tables):
+        """Load the stored keys of the given tables.
+
+        Args:
+            conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+            tables (Iterable[str]): The tables to index.
+        """
+        manifest = self._manifest()
+        for table in tables:
+            self.columns[table] = primary_key(table, conn)
+            if not self.columns[table]:
+                continue
+
+            snapshot = os.path.join(self.directory, f"{table}.parquet")
+            if manifest.get(table) == self._fingerprint(table, conn) and os.path.exists(snapshot):
+                keys = pl.read_parquet(snapshot)
+            else:
+                columns = ", ".join(f'"{column}"' for column in self.columns[table])
+                keys = conn.execute(f'SELECT {columns} FROM "{table}"').pl()
+            self._chunks[table] = [keys]
+
+    def keys(self, table: str) -> pl.DataFrame:
+        """The known keys of a table as a single DataFrame."""
+        chunks = self._chunks[table]
+        if len(chunks) > 1:
+            chunks[:] = [pl.concat(chunks, how="vertical_relaxed")]
+        return chunks[0]
+
+    def filter(self, table: str, data: pl.DataFrame) -> pl.DataFrame:
+        """Drop the rows whose key is already known and stage the new keys.
+
+        Args:
+            table (str): The table the rows are inserted into.
+            data (pl.DataFrame): The preprocessed rows.
+
+        Returns:
+            pl.DataFrame: The rows with unknown keys. Tables that are not
+                          indexed are returned unchanged.
+        """
+        if table not in self._chunks:
+            return data
+
+        columns = self.columns[table]
+        known = self.keys(table)
+        data_schema = data.select(columns).schema
+        if known.schema != data_schema:
+            known = known.cast(dict(data_schema))
+            self._chunks[table] = [known]
+
+        new = data.join(known, on=columns, how="anti")
+        self._staged.append((table, new.select(columns).drop_nulls().unique()))
+        return new
+
+    def commit(self):
+        """Add the staged keys to the index."""
+        for table, keys in self._staged:
+            self._chunks[table].append(keys)
+        self._staged = []
+
+    def rollback(self):
+        """Forget the staged keys."""
+        self._staged = []
+
+    def save(self, conn):
+        """Write a snapshot of every indexed table.
+
+        Args:
+            conn (duckdb.DuckDBPyConnection): The connection the index
+                                              describes, for fingerprints.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self._manifest()
+        for table in self._chunks:
+            self.keys(table).write_parquet(os.path.join(self.directory, f"{table}.parquet"))
+            manifest[table] = self._fingerprint(table, conn)
+
+        with open(os.path.join(self.directory, "manifest.json"), "w", encoding="UTF-8") as file:
+            json.dump(manifest, file)
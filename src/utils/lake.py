@@ -0,0 +1,186 @@
+"""
+This module writes the preprocessed tables as a Parquet lake next to (or
+instead of) the DuckDB database, and reads the lake back from DuckDB.
+
+Every table gets its own directory, partitioned Hive-style by SeasonYear
+and Season, e.g. `src/lake/Anime/SeasonYear=2014/Season=FALL/`. Each loaded
+page is one zstd-compressed file per partition, named after the page and
+the time it was written (`FALL-2014-p0001.v<ns>.parquet`), so loads are
+append-only file writes and rewriting a page replaces its file. Tables
+without season columns (User) are written unpartitioned. The bookkeeping
+tables of a transfer (MediaVersion, StudioFetch) are only kept in DuckDB.
+
+A row may be written again in another file, e.g. by a delta sync or by an
+upsert whose pages shifted; readers keep the row of the newest file for
+every primary key.
+
+Functions:
+    write_tables(directory: str, tables: dict, name: str, row_group_size: int) -> dict:
+        Write the preprocessed tables of one page to the lake.
+    create_views(conn, directory: str) -> list[str]:
+        Create DuckDB views over the lake.
+    load(conn, directory: str) -> dict:
+        Bulk load the lake into the DuckDB tables in one transaction.
+"""
+
+import glob
+import os
+import time
+
+import polars as pl
+
+from utils.insert_data import primary_key
+
+PARTITIONS = ["SeasonYear", "Season"]
+BOOKKEEPING = ("MediaVersion", "StudioFetch")
+# The write time in a file name, see `_write`
+VERSION = r"""TRY_CAST(regexp_extract(filename, '\.v([0-9]+)\.parquet$', 1) AS BIGINT)"""
+
+
+def _write(data: pl.DataFrame, path: str, row_group_size: int):
+    """Write a new version of one Parquet file atomically, removing older ones."""
+    directory, name = os.path.split(path.removesuffix(".parquet"))
+    os.makedirs(directory, exist_ok=True)
+    versioned = os.path.join(directory, f"{name}.v{time.time_ns()}.parquet")
+    temporary = f"{versioned}.tmp"
+    data.write_parquet(temporary, compression="zstd", row_group_size=row_group_size)
+    os.replace(temporary, versioned)
+    stem = os.path.join(glob.escape(directory), glob.escape(name))
+    for older in glob.glob(f"{stem}.parquet") + glob.glob(f"{stem}.v*.parquet"):
+        if older != versioned:
+            os.remove(older)
+
+
+def write_tables(
+    directory: str, tables: dict, name: str, row_group_size: int = 100_000
+) -> dict:
+    """Write the preprocessed tables of one page to the lake.
+
+    Rows with a null SeasonYear or Season cannot be placed in a partition
+    (nor stored in the database, where both are key columns) and are skipped.
+
+    Args:
+        directory (str): The root of the lake.
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+                       Entries that are not DataFrames, and the BOOKKEEPING
+                       tables, are ignored.
+        name (str): The file name of the page, without extension.
+        row_group_size (int): The maximum number of rows per row group.
+
+    Returns:
+        dict: Mapping of table name to the number of rows written.
+    """
+    counts = {}
+    for table, data in tables.items():
+        if not isinstance(data, pl.DataFrame) or table in BOOKKEEPING:
+            continue
+
+        if not all(column in data.columns for column in PARTITIONS):
+            _write(data, os.path.join(directory, table, f"{name}.parquet"), row_group_size)
+            counts[table] = len(data)
+            continue
+
+        data = data.drop_nulls(PARTITIONS)
+        partitions = data.partition_by(PARTITIONS, as_dict=True, include_key=False)
+        for (year, season), part in partitions.items():
+            path = os.path.join(
+                directory, table, f"SeasonYear={year}", f"Season={season}", f"{name}.parquet"
+            )
+            _write(part, path, row_group_size)
+        counts[table] = len(data)
+
+    return counts
+
+
+def _scan(directory: str, table: str) -> str:
+    """The read_parquet call over the files of a table, or None without files."""
+    partitioned = os.path.join(directory, table, "*", "*", "*.parquet")
+    if glob.glob(partitioned):
+        quoted = partitioned.replace("'", "''")
+        return (
+            f"read_parquet('{quoted}', hive_partitioning = true, filename = true, "
+            "hive_types = {'SeasonYear': INTEGER, 'Season': VARCHAR})"
+        )
+    flat = os.path.join(directory, table, "*.parquet")
+    if glob.glob(flat):
+        quoted = flat.replace("'", "''")
+        return f"read_parquet('{quoted}', filename = true)"
+    return None
+
+
+def _latest(conn, table: str, scan: str) -> str:
+    """Select the rows of the newest file for every primary key of a table."""
+    key = primary_key(table, conn)
+    if not key:
+        return f"SELECT * EXCLUDE (filename) FROM {scan}"
+    columns = ", ".join(f'"{column}"' for column in key)
+    # Unlike DISTINCT ON, the window lets season filters prune partitions
+    return (
+        f"SELECT * EXCLUDE (filename) FROM {scan} QUALIFY row_number() OVER ("
+        f"PARTITION BY {columns} ORDER BY {VERSION} DESC NULLS LAST, filename DESC) = 1"
+    )
+
+
+def _scans(conn, directory: str) -> dict:
+    """Mapping of every database table with files in the lake to its scan."""
+    scans = {}
+    for (table,) in conn.execute(
+        "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' ORDER BY table_name"
+    ).fetchall():
+        scan = _scan(directory, table)
+        if scan is not None:
+            scans[table] = scan
+    return scans
+
+
+def create_views(conn, directory: str) -> list[str]:
+    """Create DuckDB views over the lake, in the `lake` schema.
+
+    A view is created for every table of the database that has files in
+    the lake. Filters on SeasonYear and Season only read the matching
+    partitions. Every view keeps one row per primary key, from the newest
+    file holding it.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        directory (str): The root of the lake.
+
+    Returns:
+        list[str]: The tables a view was created for.
+    """
+    conn.execute("CREATE SCHEMA IF NOT EXISTS lake")
+    scans = _scans(conn, directory)
+    for table, scan in scans.items():
+        conn.execute(f'CREATE OR REPLACE VIEW lake."{table}" AS {_latest(conn, table, scan)}')
+    return list(scans)
+
+
+def load(conn, directory: str) -> dict:
+    """Bulk load the lake into the DuckDB tables in one transaction.
+
+    Rows whose primary key is already stored are skipped; of rows that occur
+    in several files, the newest is loaded.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        directory (str): The root of the lake.
+
+    Returns:
+        dict: Mapping of table name to {"inserted": int, "skipped": int}.
+    """
+    counts = {}
+    conn.begin()
+    try:
+        for table, scan in _scans(conn, directory).items():
+            latest = _latest(conn, table, scan)
+            rows = conn.execute(f"SELECT count(*) FROM ({latest})").fetchone()[0]
+            inserted = conn.execute(
+                f'INSERT INTO "{table}" BY NAME {latest} ON CONFLICT DO NOTHING'
+            ).fetchone()[0]
+            counts[table] = {"inserted": inserted, "skipped": rows - inserted}
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+    return counts
@@ -0,0 +1,128 @@
+"""
+This module bounds the memory of a streaming transfer, in which every page
+is normalized and loaded on its own instead of with the rest of its season.
+
+The fetch engine asks a MemoryBudget for admission before requesting a
+page and holds one page of it per page it hands to the writer; the writer
+releases the page once it is loaded and every reference to it is dropped.
+A few pages may be held at once, so fetching overlaps loading, but while
+the process is over the memory ceiling the next page is only requested
+once every held page has been freed.
+
+Functions:
+    rss() -> int:
+        The resident set size of the process, in bytes.
+
+Classes:
+    MemoryBudget:
+        Holds back page requests while too much memory is in use.
+"""
+
+import asyncio
+import gc
+import os
+import sys
+import threading
+
+from tqdm import tqdm
+
+from utils.metrics import REGISTRY
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def rss() -> int:
+    """The resident set size of the process, in bytes.
+
+    Read from /proc on Linux. Elsewhere the peak resident set size is the
+    closest measure available, and 0 where neither is.
+
+    Returns:
+        int: The memory in use.
+    """
+    try:
+        with open("/proc/self/statm", "r", encoding="UTF-8") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes, except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryBudget:
+    """Holds back page requests while too much memory is in use.
+
+    The peak and current resident set size are recorded as the
+    `peak_rss_bytes` and `rss_bytes` gauges of `utils.metrics.REGISTRY`.
+
+    Args:
+        limit (int): The memory ceiling in bytes; None to only bound the
+                     pages held.
+        ahead (int): How many fetched pages may wait for the writer while
+                     under the ceiling.
+        interval (float): Seconds between two checks while waiting.
+        measure (Callable): Returns the memory in use (default: rss).
+    """
+
+    def __init__(self, limit: int = None, ahead: int = 2, interval: float = 0.01, measure=rss):
+        self.limit = limit
+        self.ahead = max(1, ahead)
+        self.interval = interval
+        self.measure = measure
+        self.held = 0
+        self.peak = 0
+        self.exceeded = 0
+        self._lock = threading.Lock()
+
+    def usage(self) -> int:
+        """int: The memory in use now, also recorded as a gauge."""
+        usage = self.measure()
+        self.peak = max(self.peak, usage)
+        REGISTRY.set("rss_bytes", usage)
+        REGISTRY.set("peak_rss_bytes", self.peak)
+        return usage
+
+    def over(self) -> bool:
+        """bool: Whether the memory in use is above the ceiling."""
+        usage = self.usage()
+        return self.limit is not None and usage > self.limit
+
+    def hold(self):
+        """Count a fetched page until the writer releases it."""
+        with self._lock:
+            self.held += 1
+            REGISTRY.set("pages_held", self.held)
+
+    def release(self):
+        """Free a page held since it was fetched, once it is loaded."""
+        with self._lock:
+            self.held -= 1
+            REGISTRY.set("pages_held", self.held)
+
+    async def admit(self):
+        """Wait until the next page may be requested.
+
+        Under the ceiling a page may be requested while fewer than `ahead`
+        pages are held; over it, only once none is. If memory is still
+        over the ceiling with no page held, nothing the transfer keeps can
+        be freed any more and the page is requested anyway, with a warning.
+        """
+        while self.held >= self.ahead or (self.held and self.over()):
+            await asyncio.sleep(self.interval)
+
+        if self.over():
+            gc.collect()
+            if self.over():
+                REGISTRY.add("memory_ceiling_exceeded")
+                if not self.exceeded:
+                    tqdm.write(
+                        f"🟨 {self.usage() / 2**20:.0f} MB in use with no page held, "
+                        f"above the ceiling of {self.limit / 2**20:.0f} MB."
+                    )
+                self.exceeded += 1
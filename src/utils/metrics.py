@@ -0,0 +1,241 @@
+"""
+This module collects performance metrics of a transfer: how long requests,
+decoding, preprocessing and inserts take, how many bytes and rows pass
+through each stage, and how much of the rate limit is left.
+
+The stages record into the process-wide `REGISTRY`, which is thread safe
+(the fetch engine records from its thread pool). At the end of a run the
+registry can be written as a JSON report and, optionally, as a Prometheus text
+format file for a node exporter's textfile collector.
+
+Metrics have a name and optional labels:
+
+    counters    add up values, e.g. response_wire_bytes or inserted_rows{table}
+    gauges      keep the last value, e.g. rate_limit_remaining
+    histograms  bucket durations in seconds, e.g. request_seconds{status}
+
+Classes:
+    Histogram:
+        Counts observations into cumulative buckets.
+    Metrics:
+        A thread-safe registry of counters, gauges and histograms.
+
+Attributes:
+    BUCKETS (tuple): The default histogram bucket bounds, in seconds.
+    REGISTRY (Metrics): The registry the transfer stages record into.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Histogram:
+    """Counts observations into cumulative buckets.
+
+    Args:
+        buckets (tuple[float]): The upper bounds of the buckets.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """Record one observation."""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by interpolating within its bucket.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimate; `max` if it falls beyond the last bucket.
+        """
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and seen + count >= rank:
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            lower = bound
+        return self.max
+
+    def summary(self) -> dict:
+        """dict: count, sum, mean, p50, p95 and max of the observations."""
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "max": round(self.max, 6),
+        }
+
+
+class Metrics:
+    """A thread-safe registry of counters, gauges and histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every metric and restart the run clock."""
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def add(self, name: str, value: float = 1, **labels):
+        """Add a value to a counter."""
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """Set a gauge."""
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Record a duration into a histogram."""
+        key = _key(name, labels)
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Time the enclosed block into a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self) -> dict:
+        """Summarize the run.
+
+        Besides every metric, the report derives the insert throughput of
+        each table (inserted_rows per second of insert_seconds).
+
+        Returns:
+            dict: The JSON-serializable report.
+        """
+        with self._lock:
+            def entries(metrics, value):
+                return [
+                    {"name": name, "labels": dict(labels), **value(metric)}
+                    for (name, labels), metric in sorted(metrics.items())
+                ]
+
+            report = {
+                "started": self.started,
+                "wall_seconds": round(time.time() - self.started, 3),
+                "counters": entries(self.counters, lambda value: {"value": value}),
+                "gauges": entries(self.gauges, lambda value: {"value": value}),
+                "histograms": entries(self.histograms, Histogram.summary),
+            }
+
+            throughput = {}
+            for (name, labels), histogram in self.histograms.items():
+                if name != "insert_seconds" or not histogram.sum:
+                    continue
+                table = dict(labels).get("table")
+                rows = self.counters.get(_key("inserted_rows", {"table": table}), 0)
+                throughput[table] = round(rows / histogram.sum, 1)
+            report["insert_rows_per_second"] = dict(sorted(throughput.items()))
+
+        return report
+
+    def prometheus(self, prefix: str = "anilist_transfer") -> str:
+        """Render every metric in the Prometheus text exposition format.
+
+        Args:
+            prefix (str): Prepended to every metric name.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                typed = set()
+                for (name, labels), value in sorted(metrics.items()):
+                    metric = f"{prefix}_{name}" + ("_total" if kind == "counter" else "")
+                    if metric not in typed:
+                        lines.append(f"# TYPE {metric} {kind}")
+                        typed.add(metric)
+                    lines.append(f"{metric}{_labels(labels)} {value}")
+
+            typed = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{prefix}_{name}"
+                if metric not in typed:
+                    lines.append(f"# TYPE {metric} histogram")
+                    typed.add(metric)
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}"
+                    )
+                lines.append(
+                    f"{metric}_bucket{_labels(labels + (('le', '+Inf'),))} {histogram.count}"
+                )
+                lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, report: str = None, prometheus: str = None, **extra):
+        """Write the JSON report and/or the Prometheus file.
+
+        Args:
+            report (str): The path of the JSON report.
+            prometheus (str): The path of the Prometheus text file.
+            **extra: Additional top-level fields of the JSON report.
+        """
+        for path, render in (
+            (report, lambda: json.dumps({**extra, **self.report()}, indent=2, default=str)),
+            (prometheus, self.prometheus),
+        ):
+            if path is None:
+                continue
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # Written atomically, as a textfile collector may read it any time
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="UTF-8") as file:
+                file.write(render())
+            os.replace(temporary, path)
+
+
+REGISTRY = Metrics()
@@ -0,0 +1,179 @@
+"""
+This module converts a database created with an older schema to the
+current one (see init_duckdb.py) and measures what the conversion gains.
+
+The rows are copied into a database created with the current schema
+rather than altered in place: DuckDB cannot change the type of a key
+column, and a rewritten file no longer carries the free blocks of the
+old layout, so it also shrinks on disk.
+
+Functions:
+    measure(path: str, repeat: int) -> dict:
+        The file size of a database and the time of typical scans.
+    copy(conn, path: str) -> dict:
+        Copy every table of an older database into the current schema.
+
+Attributes:
+    SCAN_QUERIES (dict): Mapping of name to the analytical queries timed
+                         by `measure`; a tuple holds the same query for
+                         the older and the current schema.
+    SPLITS (dict): Mapping of older table to the current tables its
+                   columns moved to.
+"""
+
+import os
+import statistics
+import time
+
+import duckdb
+
+from utils.insert_data import primary_key
+
+SCAN_QUERIES = {
+    "anime_by_season_format": (
+        "SELECT Season, Format, count(*), avg(MeanScore) FROM Anime GROUP BY ALL"
+    ),
+    "status_distribution": "SELECT UserStatus, sum(AmountOfUsers) FROM Status GROUP BY ALL",
+    "review_ratings": (
+        "SELECT SeasonYear, Season, avg(Rating), sum(RatingAmount) FROM Review GROUP BY ALL"
+    ),
+    "review_rows": "SELECT * FROM Review WHERE Rating >= 50",
+    "genre_popularity": "SELECT Genre, Season, count(*) FROM Genre GROUP BY ALL",
+    "tag_categories": (
+        "SELECT Category, count(*) FROM Tag GROUP BY ALL",
+        "SELECT Category, count(*) FROM AnimeTag JOIN TagDim USING (TagID) GROUP BY ALL",
+    ),
+}
+
+SPLITS = {
+    "Review": ["ReviewBody"],
+    "Studio": ["StudioDim", "AnimeStudio"],
+    "Tag": ["TagDim", "AnimeTag"],
+}
+
+
+def measure(path: str, repeat: int = 5) -> dict:
+    """The file size of a database and the time of typical scans.
+
+    Args:
+        path (str): The database file.
+        repeat (int): How many times every query runs; the median counts.
+
+    Returns:
+        dict: {"bytes": int, "scans": {name: seconds}}. The size includes
+              the write-ahead log, if any.
+    """
+
+    def run(queries):
+        # The first alternative whose tables exist in this schema
+        for query in queries[:-1]:
+            try:
+                conn.execute(query).fetchall()
+                return query
+            except duckdb.CatalogException:
+                continue
+        conn.execute(queries[-1]).fetchall()
+        return queries[-1]
+
+    size = sum(
+        os.path.getsize(file) for file in (path, f"{path}.wal") if os.path.exists(file)
+    )
+    scans = {}
+    conn = duckdb.connect(path, read_only=True)
+    try:
+        for name, queries in SCAN_QUERIES.items():
+            query = run(queries if isinstance(queries, tuple) else (queries,))
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(query).fetchall()
+                times.append(time.perf_counter() - start)
+            scans[name] = statistics.median(times)
+    finally:
+        conn.close()
+
+    return {"bytes": size, "scans": scans}
+
+
+def copy(conn, path: str) -> dict:
+    """Copy every table of an older database into the current schema.
+
+    The older database is attached read-only and its rows are inserted by
+    column name, so columns are cast to their new types (e.g. text seasons
+    to the MediaSeason ENUM); a value outside an ENUM fails the copy.
+    The columns of the older tables in SPLITS move to the current tables
+    they were split into: review bodies to ReviewBody, tags and studios to
+    their dimension and bridge tables. Rows of a split table are copied
+    once per key; those without any value besides the key are left out.
+    Other tables unknown to the current schema are copied as they are.
+    Everything is copied in a single transaction.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): A connection to a database created
+                                          with the current schema.
+        path (str): The older database file.
+
+    Returns:
+        dict: Mapping of table name to the number of rows copied.
+    """
+
+    def columns(database):
+        found = {}
+        for table, column in conn.execute(
+            "SELECT table_name, column_name FROM duckdb_columns() "
+            "WHERE database_name = ? AND schema_name = 'main' ORDER BY table_name, column_index",
+            [database],
+        ).fetchall():
+            found.setdefault(table, []).append(column)
+        return found
+
+    target = conn.execute("SELECT current_database()").fetchone()[0]
+    quoted = path.replace("'", "''")
+    conn.execute(f"ATTACH '{quoted}' AS old (READ_ONLY)")
+    try:
+        old, new = columns("old"), columns(target)
+        counts = {}
+        conn.begin()
+        try:
+            for table, old_columns in old.items():
+                if table in SPLITS and table not in new:
+                    continue
+                if table not in new:
+                    counts[table] = conn.execute(
+                        f'CREATE TABLE "{table}" AS SELECT * FROM old."{table}"'
+                    ).fetchone()[0]
+                    continue
+                shared = ", ".join(f'"{column}"' for column in old_columns if column in new[table])
+                counts[table] = conn.execute(
+                    f'INSERT INTO "{table}" BY NAME SELECT {shared} FROM old."{table}"'
+                ).fetchone()[0]
+
+            for table, splits in SPLITS.items():
+                for split in splits:
+                    if table in old and split not in old:
+                        counts[split] = _split(conn, table, old[table], split, new[split])
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        conn.execute("DETACH old")
+
+    return counts
+
+
+def _split(conn, table: str, old_columns: list, target: str, new_columns: list) -> int:
+    """Move the columns of an older table to a table it was split into."""
+    key = primary_key(target, conn)
+    shared = [column for column in new_columns if column in old_columns]
+    if not set(key) <= set(shared):
+        return 0
+    conditions = [f'"{column}" IS NOT NULL' for column in key]
+    values = [f'"{column}" IS NOT NULL' for column in shared if column not in key]
+    if values:
+        conditions.append(f"({' OR '.join(values)})")
+    columns = ", ".join(f'"{column}"' for column in shared)
+    return conn.execute(
+        f'INSERT INTO "{target}" BY NAME SELECT {columns} FROM old."{table}" '
+        f"WHERE {' AND '.join(conditions)} ON CONFLICT DO NOTHING"
+    ).fetchone()[0]
@@ -0,0 +1,389 @@
+"""
+This module provides a local stand-in for the AniList GraphQL API, so the
+transfer can be tested and benchmarked without network access.
+
+The server answers every POST with one `Page` of media holding the fields
+the query selects. Pages are generated deterministically from the request
+variables, or replayed from a ResponseCache of recorded responses; batched
+queries get one generated page per alias, `media(id_in: $ids)` queries the
+media with those ids and `Studio` queries a page of a studio catalogue.
+Latency, the number of pages per season, server errors and the
+`X-RateLimit-*` / 429 behaviour of AniList are configurable. Like AniList,
+bodies are gzipped for clients sending `Accept-Encoding: gzip`.
+
+Functions:
+    sample_media(anime_id, season, year, reviews, updated_at) -> dict:
+        Build one generated `Page.media` entry.
+    page_body(media, has_next_page) -> bytes:
+        Encode one page as a GraphQL response body.
+
+Classes:
+    MockAniList:
+        A threaded HTTP server imitating the AniList GraphQL endpoint.
+"""
+
+import gzip
+import json
+import math
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.cache import ResponseCache
+from utils.graphql import parse, split_variables
+
+SEASONS = ["WINTER", "SPRING", "SUMMER", "FALL"]
+
+
+def sample_media(anime_id, season="FALL", year=2014, reviews=1, updated_at=1400000000):
+    """Build one `Page.media` entry shaped like the api_query.graphql response.
+
+    Args:
+        anime_id (int): The media id; tag, review and user ids derive from it.
+        season (str): The media season.
+        year (int): The media season year.
+        reviews (int): The number of reviews of the media.
+        updated_at (int): The media updatedAt (unix time).
+
+    Returns:
+        dict: The media entry.
+    """
+    return {
+        "id": anime_id,
+        "title": {"english": f"E{anime_id}", "native": f"N{anime_id}", "romaji": f"R{anime_id}"},
+        "format": "TV",
+        "episodes": 12,
+        "meanScore": 70,
+        "popularity": 1000,
+        "duration": 24,
+        "favourites": 10,
+        "genres": ["Action", "Drama"],
+        "season": season,
+        "seasonYear": year,
+        "updatedAt": updated_at,
+        "tags": [
+            {"id": 1, "isAdult": False, "category": "Theme", "description": "d1"},
+            {"id": 100 + anime_id, "isAdult": False, "category": "Cast", "description": "d2"},
+        ],
+        "startDate": {"day": 1, "month": 10, "year": year},
+        "endDate": {"day": 20, "month": 12, "year": year},
+        "reviews": {
+            "nodes": [
+                {
+                    "id": anime_id * 100 + r,
+                    "createdAt": 1400000000,
+                    "updatedAt": 1400000100,
+                    "rating": 5,
+                    "ratingAmount": 7,
+                    "body": "body " * 50,
+                    "summary": "summary",
+                    "media": {"id": anime_id, "season": season, "seasonYear": year},
+                    "user": {
+                        "avatar": {"large": "L", "medium": "M"},
+                        "id": 900 + r,
+                        "name": f"user{r}",
+                        "donatorTier": 0,
+                        "donatorBadge": "Donator",
+                        "createdAt": 1300000000,
+                    },
+                }
+                for r in range(reviews)
+            ]
+        },
+        "trailer": {"id": "abc", "site": "youtube", "thumbnail": "thumb"},
+        "siteUrl": f"https://anilist.co/anime/{anime_id}",
+        "studios": {"nodes": [{"id": 7, "name": "Sunrise"}]},
+        "bannerImage": "banner",
+        "coverImage": {"medium": "m", "large": "l", "extraLarge": "xl", "color": "#ffffff"},
+        "stats": {
+            "statusDistribution": [
+                {"amount": 10, "status": "CURRENT"},
+                {"amount": 5, "status": "DROPPED"},
+            ]
+        },
+    }
+
+
+def page_body(media, has_next_page: bool) -> bytes:
+    """Encode one page as a GraphQL response body.
+
+    Args:
+        media (list[dict]): The media entries of the page.
+        has_next_page (bool): The pageInfo.hasNextPage of the page.
+
+    Returns:
+        bytes: The JSON response body.
+    """
+    return json.dumps(
+        {"data": {"Page": {"pageInfo": {"hasNextPage": has_next_page}, "media": media}}}
+    ).encode("UTF-8")
+
+
+def _select(value, fields):
+    """Keep only the selected fields of a generated response value."""
+    if not fields or value is None:
+        return value
+    if isinstance(value, list):
+        return [_select(item, fields) for item in value]
+    return {
+        selected.key: _select(value.get(selected.name), selected.selections)
+        for selected in fields
+    }
+
+
+class MockAniList:
+    """A threaded HTTP server imitating the AniList GraphQL endpoint.
+
+    Generated seasons have `pages_per_season` pages of `per_page` media with
+    unique ids; a request without a season (a delta sync) pages through one
+    season's worth of media sorted by descending updatedAt. Responses only
+    hold the fields the query selects. At most `limit`
+    requests are answered per `window` seconds; further requests get a 429
+    with Retry-After, like AniList. A fraction `error_rate` of the requests
+    fails with a 500.
+
+    `requests` and `connections` count what the server has accepted.
+
+    Use as a context manager, or call `start` and `stop`:
+
+        with MockAniList(latency=0.05) as server:
+            engine = FetchEngine(server.url, query)
+
+    Args:
+        pages_per_season (int): The number of pages of every season.
+        per_page (int): The number of media per page.
+        reviews (int): The number of reviews of every media.
+        latency (float): Seconds every response is delayed.
+        limit (int): The requests allowed per window (X-RateLimit-Limit).
+        window (float): The rate limit window in seconds.
+        error_rate (float): The fraction of requests answered with a 500.
+        cache (ResponseCache): Recorded responses to replay; requests it
+                               does not hold are generated.
+        seed (int): Seeds the error injection.
+        studio_media (int): The size of every studio's catalogue (the
+                            media with ids 1 to `studio_media`).
+    """
+
+    def __init__(
+        self,
+        pages_per_season: int = 3,
+        per_page: int = 50,
+        reviews: int = 1,
+        latency: float = 0.0,
+        limit: int = 90,
+        window: float = 60.0,
+        error_rate: float = 0.0,
+        cache: ResponseCache = None,
+        seed: int = 0,
+        studio_media: int = 60,
+    ):
+        self.pages_per_season = pages_per_season
+        self.per_page = per_page
+        self.reviews = reviews
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.error_rate = error_rate
+        self.cache = cache
+        self.studio_media = studio_media
+        self.requests = 0
+        self.connections = 0
+        self._random = random.Random(seed)
+        self._served = deque()
+        self._lock = threading.Lock()
+        self._server = None
+        self._queries = {}
+
+    @property
+    def url(self) -> str:
+        """str: The GraphQL endpoint of the running server."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _rate_limit(self) -> tuple[int, dict]:
+        """Admit one request; returns its status code and rate limit headers."""
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            while self._served and self._served[0] <= now - self.window:
+                self._served.popleft()
+
+            reset = (self._served[0] if self._served else now) + self.window
+            headers = {"X-RateLimit-Limit": str(self.limit), "X-RateLimit-Reset": str(int(reset))}
+            if len(self._served) >= self.limit:
+                headers["X-RateLimit-Remaining"] = "0"
+                headers["Retry-After"] = str(max(1, math.ceil(reset - now)))
+                return 429, headers
+
+            self._served.append(now)
+            headers["X-RateLimit-Remaining"] = str(self.limit - len(self._served))
+            if self._random.random() < self.error_rate:
+                return 500, headers
+            return 200, headers
+
+    def media(self, anime_id: int) -> dict:
+        """Generate the media with an id, as listed on its season's page.
+
+        Args:
+            anime_id (int): The media id.
+
+        Returns:
+            dict: The media entry.
+        """
+        slot, offset = divmod(anime_id - 1, self.pages_per_season * self.per_page)
+        year, season = divmod(slot, len(SEASONS))
+        return sample_media(
+            anime_id, SEASONS[season], year, self.reviews, updated_at=2_000_000_000 - offset
+        )
+
+    def page(self, variables: dict) -> dict:
+        """Generate the `Page` object of a page request.
+
+        Requests with `ids` page through those media (`media(id_in: ...)`);
+        requests without a season (a delta sync) page through one season's
+        worth of media sorted by descending updatedAt.
+
+        Args:
+            variables (dict): The GraphQL variables of the page.
+
+        Returns:
+            dict: The page, with every media field.
+        """
+        page = variables["page"]
+        if "ids" in variables:
+            per_page = variables.get("perPage") or 50
+            ids = sorted(variables["ids"])[(page - 1) * per_page : page * per_page]
+            has_next_page = page * per_page < len(variables["ids"])
+            return {
+                "pageInfo": {"hasNextPage": has_next_page},
+                "media": [self.media(anime_id) for anime_id in ids],
+            }
+
+        if page > self.pages_per_season:
+            return {"pageInfo": {"hasNextPage": False}, "media": []}
+
+        year, season = variables.get("seasonYear"), variables.get("season")
+        if season is None:
+            # A delta sync: the newest updates first, all in FALL 2014
+            year, season = 2014, "FALL"
+        slot = year * len(SEASONS) + SEASONS.index(season)
+
+        first = (slot * self.pages_per_season + page - 1) * self.per_page + 1
+        return {
+            "pageInfo": {"hasNextPage": page < self.pages_per_season},
+            "media": [self.media(first + i) for i in range(self.per_page)],
+        }
+
+    def studio(self, variables: dict) -> dict:
+        """Generate the `Studio` object of a catalogue request.
+
+        Args:
+            variables (dict): The GraphQL variables of the request.
+
+        Returns:
+            dict: The studio with one page of its media.
+        """
+        page, per_page = variables["page"], variables.get("perPage") or 25
+        ids = range((page - 1) * per_page + 1, min(page * per_page, self.studio_media) + 1)
+        return {
+            "id": variables["id"],
+            "name": "Sunrise",
+            "media": {
+                "pageInfo": {"hasNextPage": page * per_page < self.studio_media},
+                "nodes": [self.media(anime_id) for anime_id in ids],
+            },
+        }
+
+    def body(self, request: dict) -> bytes:
+        """Generate the response body of a request, with the fields it selects.
+
+        A batched query (see `utils.graphql.batch`) gets one page per alias.
+
+        Args:
+            request (dict): The decoded request body ({"query", "variables"}).
+
+        Returns:
+            bytes: The JSON response body.
+        """
+        query, variables = request["query"], request["variables"]
+        if query not in self._queries:
+            self._queries[query] = parse(query).selections
+        roots = self._queries[query]
+        slots = [variables] if "page" in variables else split_variables(variables)
+        data = {
+            root.key: _select(
+                self.studio(slot) if root.name == "Studio" else self.page(slot),
+                root.selections,
+            )
+            for root, slot in zip(roots, slots)
+        }
+        return json.dumps({"data": data}).encode("UTF-8")
+
+    def respond(self, request: dict) -> tuple[int, dict, bytes]:
+        """Answer one GraphQL request.
+
+        Args:
+            request (dict): The decoded request body ({"query", "variables"}).
+
+        Returns:
+            tuple[int, dict, bytes]: The status code, headers and body.
+        """
+        time.sleep(self.latency)
+        status, headers = self._rate_limit()
+        if status != 200:
+            return status, headers, b'{"errors": [{"message": "mock error"}]}'
+
+        body = None
+        if self.cache is not None:
+            body = self.cache.get(request["query"], request["variables"], ignore_age=True)
+        if body is None:
+            body = self.body(request)
+        return status, headers, body
+
+    def start(self) -> "MockAniList":
+        """Serve on a free port of 127.0.0.1 in a background thread."""
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keeps connections alive between requests, like AniList
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with mock._lock:
+                    mock.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                status, headers, body = mock.respond(json.loads(self.rfile.read(length)))
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        """Stop serving."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "MockAniList":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,103 @@
+"""
+This module normalizes a buffer of API media into every table of the
+database in a single pass.
+
+The preprocess functions are applied to a LazyFrame of the buffer, which
+turns each of them into a lazy plan over the same source. The plans
+are collected together with `polars.collect_all`, so work they share (such as
+the review node explosion behind both Review and User) is computed once.
+
+Functions:
+    plans(table: pl.DataFrame, tables) -> dict:
+        Build the lazy plan of every table.
+    normalize(table: pl.DataFrame, tables, per_table: bool, details: pl.DataFrame) -> dict:
+        Collect every table of a buffer at once.
+
+The collection time is recorded in `utils.metrics.REGISTRY`, as a whole
+(preprocess_seconds{table="all"}) or, when profiling, per table.
+"""
+
+import polars as pl
+from polars.exceptions import SchemaError
+
+from utils.metrics import REGISTRY
+from utils.preprocess import DETAIL_TABLES, TABLES
+
+
+def plans(table: pl.DataFrame, tables=None, details: pl.DataFrame = None) -> dict:
+    """Build the lazy plan of every table from a single source.
+
+    Args:
+        table (pl.DataFrame): The media of a page or of a whole season.
+        tables (Iterable[str]): The tables to plan (default: all of them).
+        details (pl.DataFrame): The detail fields of the media in a split
+                                transfer; the DETAIL_TABLES are planned
+                                from them instead of from `table`.
+
+    Returns:
+        dict: Mapping of table name to its LazyFrame, or to the value the
+              preprocess function returned if the plan could not be built.
+    """
+    source = table.lazy()
+    detail_source = details.lazy() if details is not None else source
+    return {
+        name: TABLES[name](detail_source if name in DETAIL_TABLES else source)
+        for name in tables or TABLES
+    }
+
+
+def _collect(name: str, plan):
+    """Collect one plan on its own, mapping errors like `utils.preprocess`."""
+    if not isinstance(plan, pl.LazyFrame):
+        return plan
+    try:
+        with REGISTRY.timer("preprocess_seconds", table=name):
+            return plan.collect()
+    except SchemaError:
+        return 501
+    except Exception as e:
+        print(f"Error preprocessing {name.upper()}: {e}")
+        return None
+
+
+def normalize(
+    table: pl.DataFrame, tables=None, per_table: bool = False, details: pl.DataFrame = None
+) -> dict:
+    """Collect every table of a buffer at once.
+
+    If the joint collection fails, the tables are collected one by one so
+    that a single malformed table (e.g. a SchemaError on reviews) does not
+    cost the others; the failing table gets the same 501/None value the
+    preprocess functions return.
+
+    Args:
+        table (pl.DataFrame): The media of a page or of a whole season.
+        tables (Iterable[str]): The tables to normalize (default: all of
+                                them). Only their fields need to be present.
+        per_table (bool): Collect (and time) every table on its own, to find
+                          the slow ones. Work shared by several tables is
+                          then repeated, so this is slower overall.
+        details (pl.DataFrame): The detail fields of a split transfer, see
+                                `plans`.
+
+    Returns:
+        dict: Mapping of table name to its preprocessed DataFrame.
+    """
+    lazy = plans(table, tables, details)
+    if per_table:
+        frames = {name: _collect(name, plan) for name, plan in lazy.items()}
+    else:
+        collectable = {
+            name: plan for name, plan in lazy.items() if isinstance(plan, pl.LazyFrame)
+        }
+        try:
+            with REGISTRY.timer("preprocess_seconds", table="all"):
+                collected = dict(zip(collectable, pl.collect_all(collectable.values())))
+        except Exception:
+            collected = {name: _collect(name, plan) for name, plan in lazy.items()}
+        frames = {name: collected.get(name, plan) for name, plan in lazy.items()}
+
+    for name, frame in frames.items():
+        if isinstance(frame, pl.DataFrame):
+            REGISTRY.add("preprocessed_rows", len(frame), table=name)
+    return frames
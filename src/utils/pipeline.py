@@ -0,0 +1,123 @@
+"""
+This module connects the fetch, preprocess and insert stages of a transfer
+with bounded queues so that the network, the CPU and the DuckDB writer are
+busy at the same time.
+
+Functions:
+    threaded(iterable, maxsize) -> Iterator:
+        Consume an iterable in a background thread.
+    pipeline(source, transform, maxsize) -> Iterator[tuple]:
+        Run a fetch stage and a transform stage ahead of the caller.
+"""
+
+import queue
+import threading
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception raised by a stage to the consuming thread."""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def threaded(iterable, maxsize: int = 2):
+    """Consume an iterable in a background thread.
+
+    At most `maxsize` items wait in the queue; the producing thread blocks
+    once it is full, which keeps memory bounded when the consumer is slower.
+    Neither thread keeps a reference to an item it has passed on.
+
+    If the consumer stops early (the generator is closed, e.g. when the
+    loop over it raises), the producing thread stops after the item it is
+    producing and closes `iterable`, so earlier stages stop too.
+
+    Args:
+        iterable (Iterable): The items to produce.
+        maxsize (int): The capacity of the queue between the two threads.
+
+    Yields:
+        The items of `iterable`, in order.
+
+    Raises:
+        Exception: Any exception raised while producing an item.
+    """
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        # Gives up once the consumer is gone instead of blocking forever
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+                # Not kept alive while the next item is produced
+                del item
+        except Exception as e:
+            put(_Failure(e))
+        finally:
+            _close(iterable)
+        put(_DONE)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    try:
+        while (item := items.get()) is not _DONE:
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+            del item
+    finally:
+        stop.set()
+        # Items left behind are not kept alive by the abandoned queue
+        while not items.empty():
+            items.get_nowait()
+
+
+def pipeline(source, transform, maxsize: int = 2):
+    """Run a source and a transform stage ahead of the caller.
+
+    The source (e.g. FetchEngine.iter_seasons) and the transform
+    (e.g. preprocessing a season into its tables) each run in their own
+    thread, so while the caller writes season N, season N+1 is transformed
+    and later seasons are downloaded.
+
+    Args:
+        source (Iterable): The fetched items.
+        transform (Callable): Applied to every fetched item.
+        maxsize (int): The capacity of the queue after each stage.
+
+    Yields:
+        tuple: Each fetched item and its transformed value, in order.
+    """
+    fetched = threaded(source, maxsize)
+    return threaded(_apply(transform, fetched), maxsize)
+
+
+def _apply(transform, items):
+    """Yield every item with its transformed value, dropping both afterwards."""
+    try:
+        for item in items:
+            value = transform(item)
+            yield item, value
+            del item, value
+    finally:
+        _close(items)
+
+
+def _close(iterable):
+    """Close a generator (or anything else with a close method) once done with it."""
+    close = getattr(iterable, "close", None)
+    if close is not None:
+        close()
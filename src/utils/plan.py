@@ -0,0 +1,58 @@
+"""
+This module lists the work items of a transfer. It imports nothing beyond
+the standard library, so that data_transfer.py can print a plan (or its
+--help) without loading polars, DuckDB or the HTTP stack.
+
+Functions:
+    plan_seasons(years, seasons) -> list[tuple[int, str]]:
+        Lists the (year, season) work items of a transfer.
+    page_variables(year: int, season: str, page: int, sort: str) -> dict:
+        Build the GraphQL variables of a page request.
+
+Attributes:
+    SEASONS (dict): Mapping of every AniList season, in chronological
+                    order within a year, to the emoji printed with it.
+"""
+
+SEASONS = {
+    "WINTER": "❄️",
+    "SPRING": "🌸",
+    "SUMMER": "🌞",
+    "FALL": "🍂",
+}
+
+
+def plan_seasons(years, seasons=SEASONS) -> list[tuple[int, str]]:
+    """List the (year, season) work items of a transfer in chronological order.
+
+    Args:
+        years (Iterable[int]): The years to fetch.
+        seasons (Iterable[str]): The seasons to fetch for every year
+                                 (default: all of them).
+
+    Returns:
+        list[tuple[int, str]]: The planned (year, season) pairs.
+    """
+    return [(year, season) for year in years for season in seasons]
+
+
+def page_variables(year: int, season: str, page: int, sort: str = "ID") -> dict:
+    """Build the GraphQL variables of a page request.
+
+    Args:
+        year (int): The year parameter for the query; None for every year.
+        season (str): The season parameter for the query; None for every season.
+        page (int): The page number for paginated results.
+        sort (str): The MediaSort order of the pages.
+
+    Returns:
+        dict: The variables sent along with the query.
+    """
+    return {
+        "page": page,
+        "perPage": 50,  # hard limit of 50 anime entries per page
+        "seasonYear": year,
+        "season": season,
+        "sort": sort,
+        "type": "ANIME",
+    }
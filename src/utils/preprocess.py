@@ -9,6 +9,22 @@ Functions:
     reviews(table: pl.DataFrame) -> pl.DataFrame:
         Preprocess the given reviews table to a Polars DataFrame by unnesting
         nested columns and converting date columns.
+
+    review_bodies(table: pl.DataFrame) -> pl.DataFrame:
+        Preprocess the text of the reviews, stored apart from their numbers.
+
+Every function also accepts a polars.LazyFrame, in which case it returns the
+lazy plan of its table; `utils.normalize` uses this to collect all tables of a
+buffer in one pass.
+
+Attributes:
+    TABLES (dict): Mapping of database table name to its preprocess function.
+    FIELDS (dict): Mapping of database table name to the media fields (dotted
+                   paths in api_query.graphql) its preprocess function reads.
+    MUTABLE (list): The tables whose stored rows are refreshed by an upsert.
+    DETAIL_FIELDS (list): The heavy media fields a split transfer fetches
+                          with a separate query.
+    DETAIL_TABLES (list): The tables built from those fields only.
 """
 
 import polars as pl
@@ -99,6 +115,21 @@ def anime(table: pl.DataFrame) -> pl.DataFrame:
         return None
 
 
+def review_nodes(table: pl.DataFrame) -> pl.DataFrame:
+    """Explode the review nodes of every anime into one row per review.
+
+    Shared by `reviews` and `users`; when both are collected together by
+    `utils.normalize`, the explosion is computed once.
+
+    Args:
+        table (pl.DataFrame): The table containing the data to preprocess.
+
+    Returns:
+        polars.DataFrame: One row per review with its nested columns.
+    """
+    return table.select(["reviews"]).unnest("reviews").explode("nodes").unnest("nodes")
+
+
 def reviews(table: pl.DataFrame) -> pl.DataFrame:
     """Preprocess the given table to a Polars DataFrame.
 
@@ -112,10 +143,7 @@ def reviews(table: pl.DataFrame) -> pl.DataFrame:
 
     try:
         return (
-            table.select(["reviews"])
-            .unnest("reviews")
-            .explode("nodes")
-            .unnest("nodes")
+            review_nodes(table)
             .rename(
                 {
                     "id": "ReviewID",
@@ -142,13 +170,15 @@ def reviews(table: pl.DataFrame) -> pl.DataFrame:
                     "seasonYear": "SeasonYear",
                 }
             )
-            .drop(["avatar", "name", "donatorTier", "createdAt", "donatorBadge"])
+            .drop(
+                ["avatar", "name", "donatorTier", "createdAt", "donatorBadge"],
+                strict=False,
+            )
             .select(
                 [
                     "ReviewID",
                     "Rating",
                     "RatingAmount",
-                    "Body",
                     "Summary",
                     "ReviewCreatedAt",
                     "ReviewUpdatedAt",
@@ -168,6 +198,31 @@ def reviews(table: pl.DataFrame) -> pl.DataFrame:
         return None
 
 
+def review_bodies(table: pl.DataFrame) -> pl.DataFrame:
+    """Preprocess the text of the reviews, stored apart from their numbers.
+
+    The bodies are most of the size of the reviews, so scans of the Review
+    table do not read them.
+
+    Args:
+        table (pl.DataFrame): The table containing the data to preprocess.
+
+    Returns:
+        polars.DataFrame: The ReviewID and Body of every review.
+    """
+    try:
+        return review_nodes(table).select(
+            pl.col("id").alias("ReviewID"), pl.col("body").alias("Body")
+        )
+    except SchemaError:
+        return 501
+    except ColumnNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error preprocessing REVIEW BODIES: {e}")
+        return None
+
+
 def web_assets(table):
     try:
         return (
@@ -205,30 +260,53 @@ def web_assets(table):
         return None
 
 
+def studio_nodes(table):
+    """Explode the studios of every anime into one row per link.
+
+    Shared by `studios` and `studio_dims`; when both are collected together
+    by `utils.normalize`, the explosion is computed once.
+    """
+    return (
+        table.select(
+            pl.col("id").alias("AnimeID"),
+            pl.col("season").alias("Season"),
+            pl.col("seasonYear").alias("SeasonYear"),
+            pl.col("studios").struct.field("nodes"),
+        )
+        .explode("nodes")
+        .unnest("nodes")
+        # A query pruned to the links of a table carries no names
+        .rename({"id": "StudioID", "name": "StudioName"}, strict=False)
+    )
+
+
 def studios(table):
+    """Link every anime to the studios that produced it.
+
+    Rows for the other media of a studio (its catalogue) are not part of a
+    page; see `utils.studio_cache`.
+    """
+    try:
+        return studio_nodes(table).select(["AnimeID", "Season", "SeasonYear", "StudioID"])
+    except SchemaError:
+        return 501
+    except Exception as e:
+        print(f"Error preprocessing STUDIOS: {e}")
+        return None
+
+
+def studio_dims(table):
+    """The name of every studio of a page, stored once per studio."""
     try:
         return (
-            table.select(["studios"])
-            .unnest("studios")
-            .explode("nodes")
-            .unnest("nodes")
-            .rename({"id": "StudioID", "name": "StudioName"})
-            .unnest("media")
-            .explode("nodes")
-            .unnest("nodes")
-            .rename(
-                {
-                    "id": "AnimeID",
-                    "season": "Season",
-                    "seasonYear": "SeasonYear",
-                }
-            )
-            .select(["AnimeID", "Season", "SeasonYear", "StudioID", "StudioName"])
+            studio_nodes(table)
+            .select(["StudioID", "StudioName"])
+            .unique("StudioID", maintain_order=True)
         )
     except SchemaError:
         return 501
     except Exception as e:
-        print(f"Error preprocessing STUDIOS: {e}")
+        print(f"Error preprocessing STUDIO DIMS: {e}")
         return None
 
 
@@ -260,50 +338,61 @@ def genres(table):
         return None
 
 
+def tag_nodes(table):
+    """Explode the tags of every anime into one row per tag.
+
+    Shared by `tags` and `tag_dims`, like `studio_nodes`.
+    """
+    return (
+        table.select(["tags", "id", "season", "seasonYear"])
+        .rename({"id": "AnimeID"})
+        .explode("tags")
+        .unnest("tags")
+        .rename(
+            {
+                "id": "TagID",
+                "isAdult": "IsAdult",
+                "category": "Category",
+                "description": "Description",
+                "season": "Season",
+                "seasonYear": "SeasonYear",
+            },
+            strict=False,
+        )
+    )
+
+
 def tags(table):
+    """Link every anime to its tags."""
+    try:
+        return tag_nodes(table).select(["AnimeID", "Season", "SeasonYear", "TagID"])
+    except SchemaError:
+        return 501
+    except Exception as e:
+        print(f"Error preprocessing TAGS: {e}")
+        return None
+
+
+def tag_dims(table):
+    """The category and description of every tag of a page, stored once per tag."""
     try:
         return (
-            table.select(["tags", "id", "season", "seasonYear"])
-            .rename({"id": "AnimeID"})
-            .explode("tags")
-            .unnest("tags")
-            .rename(
-                {
-                    "id": "TagID",
-                    "isAdult": "IsAdult",
-                    "category": "Category",
-                    "description": "Description",
-                    "season": "Season",
-                    "seasonYear": "SeasonYear",
-                }
-            )
+            tag_nodes(table)
+            .select(["TagID", "IsAdult", "Category", "Description"])
+            .unique("TagID", maintain_order=True)
         )
     except SchemaError:
         return 501
     except Exception as e:
-        print(f"Error preprocessing TAGS: {e}")
+        print(f"Error preprocessing TAG DIMS: {e}")
         return None
 
 
 def users(table):
     try:
         return (
-            table.select(["reviews"])
-            .unnest("reviews")
-            .explode("nodes")
-            .unnest("nodes")
-            .drop(
-                [
-                    "media",
-                    "id",
-                    "rating",
-                    "ratingAmount",
-                    "body",
-                    "summary",
-                    "createdAt",
-                    "updatedAt",
-                ]
-            )
+            review_nodes(table)
+            .select(["user"])
             .unnest("user")
             .unnest("avatar")
             .with_columns([pl.from_epoch("createdAt").alias("UserCreatedAt")])
@@ -365,3 +454,67 @@ def status(table):
     except Exception as e:
         print(f"Error preprocessing STATS: {e}")
         return None
+
+
+TABLES = {
+    "Anime": anime,
+    "Genre": genres,
+    "Review": reviews,
+    "ReviewBody": review_bodies,
+    "Status": status,
+    "AnimeStudio": studios,
+    "StudioDim": studio_dims,
+    "AnimeTag": tags,
+    "TagDim": tag_dims,
+    "User": users,
+    "WebAsset": web_assets,
+}
+
+KEYS = ["id", "season", "seasonYear"]
+
+FIELDS = {
+    "Anime": KEYS
+    + [
+        "title",
+        "format",
+        "meanScore",
+        "popularity",
+        "episodes",
+        "favourites",
+        "duration",
+        "startDate",
+        "endDate",
+    ],
+    "Genre": KEYS + ["genres"],
+    "Review": [
+        "reviews.nodes.id",
+        "reviews.nodes.createdAt",
+        "reviews.nodes.updatedAt",
+        "reviews.nodes.rating",
+        "reviews.nodes.ratingAmount",
+        "reviews.nodes.summary",
+        "reviews.nodes.media",
+        "reviews.nodes.user.id",
+    ],
+    "ReviewBody": ["reviews.nodes.id", "reviews.nodes.body"],
+    "Status": KEYS + ["stats"],
+    "AnimeStudio": KEYS + ["studios.nodes.id"],
+    "StudioDim": ["studios.nodes.id", "studios.nodes.name"],
+    "AnimeTag": KEYS + ["tags.id"],
+    "TagDim": ["tags.id", "tags.isAdult", "tags.category", "tags.description"],
+    "User": ["reviews.nodes.user"],
+    "WebAsset": KEYS + ["bannerImage", "coverImage", "siteUrl", "trailer"],
+}
+
+# Genre, AnimeStudio and AnimeTag rows consist of their key only.
+MUTABLE = ["Anime", "Review", "ReviewBody", "Status", "StudioDim", "TagDim", "User", "WebAsset"]
+
+# Review bodies and the media lists of studios make up most of a page; a
+# split transfer fetches them separately, only for new or changed media
+DETAIL_FIELDS = ["reviews", "studios"]
+DETAIL_TABLES = [
+    table
+    for table, paths in FIELDS.items()
+    if all(path in KEYS or path.split(".")[0] in DETAIL_FIELDS for path in paths)
+    and any(path not in KEYS for path in paths)
+]
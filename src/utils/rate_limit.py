@@ -0,0 +1,177 @@
+"""
+This module provides the shared request budget used when fetching from the
+AniList API with several requests in flight.
+
+Classes:
+    TokenBucket:
+        An asyncio token bucket refilled over a rate limit window and kept in
+        sync with the X-RateLimit-Remaining/X-RateLimit-Limit headers.
+    RateController:
+        A TokenBucket that also honours X-RateLimit-Reset and Retry-After and
+        computes jittered backoff delays for retried requests.
+"""
+
+import asyncio
+import random
+import time
+
+
+class TokenBucket:
+    """A token bucket shared by every request of a fetch.
+
+    Each request takes one token. Tokens refill continuously at
+    `capacity / period` per second. Whenever a response arrives, the bucket
+    is resynchronised with the server's view of the budget so that requests
+    made by other clients with the same IP are accounted for too.
+
+    Args:
+        capacity (int): The number of requests allowed per period (default: 90,
+                        AniList's documented limit per minute).
+        period (float): The length of the rate limit window in seconds.
+        reserve (int): Requests left untouched at the end of the window so
+                       that in-flight requests never push the budget to zero.
+    """
+
+    def __init__(self, capacity: int = 90, period: float = 60.0, reserve: int = 5):
+        self.capacity = capacity
+        self.period = period
+        self.reserve = reserve
+        self.tokens = float(capacity - reserve)
+        self._updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    @property
+    def rate(self) -> float:
+        """float: Tokens refilled per second."""
+        return self.capacity / self.period
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity - self.reserve,
+            self.tokens + (now - self._updated) * self.rate,
+        )
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        # The lock belongs to an event loop; the bucket may outlive one.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep(self._delay())
+
+    def _delay(self) -> float:
+        """float: Seconds until the next token is refilled."""
+        return (1 - self.tokens) / self.rate
+
+    def update(self, remaining: int, limit: int):
+        """Resynchronise the bucket with the rate limit headers of a response.
+
+        Args:
+            remaining (int): The X-RateLimit-Remaining header.
+            limit (int): The X-RateLimit-Limit header.
+        """
+        self._refill()
+        self.capacity = limit
+        self.tokens = min(self.tokens, float(remaining - self.reserve))
+
+
+class RateController(TokenBucket):
+    """Paces requests from the rate limit headers of every response.
+
+    On top of the token bucket, the controller
+
+    - refills the whole budget once `X-RateLimit-Reset` has passed instead of
+      waiting for the steady refill,
+    - pauses every request until `Retry-After` has elapsed after a 429,
+    - provides full-jitter exponential backoff for retried requests.
+
+    Args:
+        capacity (int): The number of requests allowed per period.
+        period (float): The length of the rate limit window in seconds.
+        reserve (int): Requests left untouched at the end of the window.
+        backoff_base (float): The first backoff delay in seconds.
+        backoff_cap (float): The longest backoff delay in seconds.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 90,
+        period: float = 60.0,
+        reserve: int = 5,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 60.0,
+    ):
+        super().__init__(capacity, period, reserve)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._reset_at = None
+        self._paused_until = 0.0
+
+    def _refill(self):
+        super()._refill()
+        if self._reset_at is not None and time.time() >= self._reset_at:
+            self.tokens = float(self.capacity - self.reserve)
+            self._reset_at = None
+
+    async def acquire(self):
+        """Wait for any Retry-After pause and for a token, then take it."""
+        while (delay := self._paused_until - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+        await super().acquire()
+
+    def _delay(self) -> float:
+        delay = super()._delay()
+        if self._reset_at is not None:
+            delay = min(delay, max(self._reset_at - time.time(), 0.0))
+        return delay
+
+    def observe(self, status_code: int, headers) -> float:
+        """Update the budget from a response.
+
+        Args:
+            status_code (int): The HTTP status code of the response.
+            headers (Mapping): The response headers.
+
+        Returns:
+            float: The Retry-After delay in seconds if the server sent one,
+                   otherwise None.
+        """
+        if "X-RateLimit-Remaining" in headers and "X-RateLimit-Limit" in headers:
+            self.update(
+                int(headers["X-RateLimit-Remaining"]), int(headers["X-RateLimit-Limit"])
+            )
+
+        if "X-RateLimit-Reset" in headers:
+            self._reset_at = float(headers["X-RateLimit-Reset"])
+
+        retry_after = headers.get("Retry-After")
+        if retry_after is None:
+            if status_code == 429:
+                # Out of budget without a hint: wait for the next token
+                self.tokens = min(self.tokens, 0.0)
+            return None
+
+        retry_after = float(retry_after)
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        return retry_after
+
+    def backoff(self, attempt: int) -> float:
+        """Return a full-jitter exponential backoff delay.
+
+        Args:
+            attempt (int): The number of failed attempts so far, starting at 0.
+
+        Returns:
+            float: A delay between 0 and min(cap, base * 2 ** attempt) seconds.
+        """
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2**attempt))
@@ -0,0 +1,212 @@
+"""
+This module derives fixed Polars schemas from the GraphQL query and decodes
+API responses straight into typed DataFrames.
+
+Building `pl.DataFrame(media)` without a schema infers every nested type from
+the Python objects of each page, which is slow and makes pages disagree
+(e.g. an all-null `trailer` or empty `reviews.nodes` infer to Null types), so
+that concatenating them fails. The schema here is computed once from the
+selection in api_query.graphql and the subset of the AniList schema in
+`TYPES`, and every page is decoded against it.
+
+Attributes:
+    TYPES (dict): The AniList object types used by the queries, mapping each
+                  field to a Polars dtype, the name of an object type, or a
+                  one-element list for list fields.
+
+Functions:
+    dtype(type_name: str, selections) -> pl.DataType:
+        The Polars dtype of a selection on an AniList type.
+    media_schema(query: str) -> pl.Schema:
+        The schema of `Page.media` for a query.
+    decode_page(body: bytes, schema: pl.Schema) -> tuple[pl.DataFrame, dict]:
+        Decode a page response into its typed media and page info.
+    decode_batch(body: bytes, schema: pl.Schema, count: int) -> list[tuple]:
+        Decode the response of a batched query into its pages.
+"""
+
+import json
+
+import polars as pl
+
+from utils.graphql import parse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; it only makes decoding faster
+    orjson = None
+
+Int = pl.Int64
+String = pl.String
+Boolean = pl.Boolean
+
+TYPES = {
+    "Page": {"pageInfo": "PageInfo", "media": ["Media"]},
+    "PageInfo": {
+        "total": Int,
+        "perPage": Int,
+        "currentPage": Int,
+        "lastPage": Int,
+        "hasNextPage": Boolean,
+    },
+    "Media": {
+        "id": Int,
+        "title": "MediaTitle",
+        "format": String,
+        "status": String,
+        "episodes": Int,
+        "duration": Int,
+        "meanScore": Int,
+        "averageScore": Int,
+        "popularity": Int,
+        "favourites": Int,
+        "genres": [String],
+        "season": String,
+        "seasonYear": Int,
+        "updatedAt": Int,
+        "tags": ["MediaTag"],
+        "startDate": "FuzzyDate",
+        "endDate": "FuzzyDate",
+        "reviews": "ReviewConnection",
+        "trailer": "MediaTrailer",
+        "siteUrl": String,
+        "studios": "StudioConnection",
+        "bannerImage": String,
+        "coverImage": "MediaCoverImage",
+        "stats": "MediaStats",
+    },
+    "MediaTitle": {"english": String, "native": String, "romaji": String},
+    "MediaTag": {
+        "id": Int,
+        "name": String,
+        "rank": Int,
+        "isAdult": Boolean,
+        "category": String,
+        "description": String,
+    },
+    "FuzzyDate": {"day": Int, "month": Int, "year": Int},
+    "ReviewConnection": {"pageInfo": "PageInfo", "nodes": ["Review"]},
+    "Review": {
+        "id": Int,
+        "createdAt": Int,
+        "updatedAt": Int,
+        "rating": Int,
+        "ratingAmount": Int,
+        "body": String,
+        "summary": String,
+        "media": "Media",
+        "user": "User",
+    },
+    "User": {
+        "avatar": "UserAvatar",
+        "id": Int,
+        "name": String,
+        "donatorTier": Int,
+        "donatorBadge": String,
+        "createdAt": Int,
+    },
+    "UserAvatar": {"large": String, "medium": String},
+    "MediaTrailer": {"id": String, "site": String, "thumbnail": String},
+    "StudioConnection": {"pageInfo": "PageInfo", "nodes": ["Studio"]},
+    "Studio": {"id": Int, "name": String, "media": "MediaConnection"},
+    "MediaConnection": {"pageInfo": "PageInfo", "nodes": ["Media"]},
+    "MediaCoverImage": {
+        "medium": String,
+        "large": String,
+        "extraLarge": String,
+        "color": String,
+    },
+    "MediaStats": {"statusDistribution": ["StatusDistribution"]},
+    "StatusDistribution": {"amount": Int, "status": String},
+}
+
+
+def _field_dtype(kind, selected) -> pl.DataType:
+    if isinstance(kind, list):
+        return pl.List(_field_dtype(kind[0], selected))
+    if isinstance(kind, str):
+        return dtype(kind, selected.selections)
+    return kind
+
+
+def dtype(type_name: str, selections) -> pl.DataType:
+    """The Polars dtype of a selection on an AniList type.
+
+    Args:
+        type_name (str): The AniList type, a key of `TYPES`.
+        selections (list[utils.graphql.Field]): The selected fields.
+
+    Returns:
+        pl.Struct: One struct field per selected field, in selection order.
+
+    Raises:
+        KeyError: If a selected field is not registered in `TYPES`.
+    """
+    fields = TYPES[type_name]
+    return pl.Struct(
+        {
+            selected.key: _field_dtype(fields[selected.name], selected)
+            for selected in selections
+        }
+    )
+
+
+def media_schema(query: str) -> pl.Schema:
+    """The schema of `Page.media` for a query.
+
+    Args:
+        query (str): The GraphQL query text.
+
+    Returns:
+        pl.Schema: One column per field selected on the media.
+    """
+    media = parse(query).get("Page").get("media")
+    return pl.Schema(dtype("Media", media.selections).to_schema())
+
+
+def _loads(body: bytes):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def decode_page(body: bytes, schema: pl.Schema) -> tuple[pl.DataFrame, dict]:
+    """Decode a page response into its typed media and page info.
+
+    Args:
+        body (bytes): The raw response body.
+        schema (pl.Schema): The media schema, see `media_schema`.
+
+    Returns:
+        tuple[pl.DataFrame, dict]: The media of the page and its `pageInfo`.
+
+    Raises:
+        KeyError, TypeError: If the response carries no page (e.g. a GraphQL
+                             error response).
+    """
+    page = _loads(body)["data"]["Page"]
+    media = pl.DataFrame(page["media"], schema=schema, strict=False)
+    return media, page["pageInfo"]
+
+
+def decode_batch(body: bytes, schema: pl.Schema, count: int) -> list[tuple]:
+    """Decode the response of a batched query (see `utils.graphql.batch`).
+
+    Args:
+        body (bytes): The raw response body.
+        schema (pl.Schema): The media schema, see `media_schema`.
+        count (int): The number of aliased pages, p1 ... p<count>.
+
+    Returns:
+        list[tuple[pl.DataFrame, dict, dict]]: The media, `pageInfo` and raw
+                                               `Page` object of every alias.
+
+    Raises:
+        KeyError, TypeError: If the response is missing a page.
+    """
+    data = _loads(body)["data"]
+    pages = [data[f"p{i}"] for i in range(1, count + 1)]
+    return [
+        (pl.DataFrame(page["media"], schema=schema, strict=False), page["pageInfo"], page)
+        for page in pages
+    ]
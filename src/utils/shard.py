@@ -0,0 +1,139 @@
+"""
+This module splits a backfill across several workers and merges their
+results. DuckDB allows a single writer per database file, so every worker
+loads its slice of the seasons into its own shard database, which has the
+same schema as the main one; the shards are merged afterwards.
+
+Functions:
+    parse_shard(text: str) -> tuple[int, int]:
+        Parse an 'INDEX/COUNT' shard specification.
+    shard_plan(plan, index: int, count: int) -> list:
+        The work items of one shard.
+    shard_path(index: int, count: int, directory: str) -> str:
+        The default database file of one shard.
+    merge(conn, paths) -> dict:
+        Load the tables of several shard databases into one database.
+"""
+
+import argparse
+import os
+
+
+def parse_shard(text: str) -> tuple[int, int]:
+    """Parse an 'INDEX/COUNT' shard specification, e.g. '0/4'.
+
+    Args:
+        text (str): The specification; INDEX counts from 0.
+
+    Returns:
+        tuple[int, int]: The shard index and the number of shards.
+
+    Raises:
+        argparse.ArgumentTypeError: If the specification is malformed.
+    """
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {text!r}") from None
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in [0, {count}), got {index}")
+    return index, count
+
+
+def shard_plan(plan, index: int, count: int) -> list:
+    """The work items of one shard.
+
+    Items are dealt out round-robin, so every shard gets a mix of early
+    (small) and recent (large) seasons.
+
+    Args:
+        plan (Iterable[tuple]): The work items of the whole backfill.
+        index (int): The shard index, counting from 0.
+        count (int): The number of shards.
+
+    Returns:
+        list: Every `count`-th work item, starting at `index`.
+    """
+    return list(plan)[index::count]
+
+
+def shard_path(index: int, count: int, directory: str = "src/shards") -> str:
+    """The default database file of one shard.
+
+    Args:
+        index (int): The shard index, counting from 0.
+        count (int): The number of shards.
+        directory (str): Where the shard databases are kept.
+
+    Returns:
+        str: The path of the shard database.
+    """
+    return os.path.join(directory, f"shard-{index}-of-{count}.duckdb")
+
+
+def merge(conn, paths) -> dict:
+    """Load the tables of several shard databases into one database.
+
+    Every shard is attached read-only. All keyed tables the shards share
+    with the target database (including their transfer checkpoints) are
+    loaded in a single transaction; rows whose primary key is already
+    stored, or that occur in several shards, are kept once. The summary
+    tables of `utils.aggregates` are not merged; rebuild them afterwards.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open connection to the target.
+        paths (Iterable[str]): The shard database files.
+
+    Returns:
+        dict: Mapping of table name to {"inserted": int, "skipped": int}.
+    """
+    # Imported here, so that planning a shard does not load polars
+    from utils.aggregates import SUMMARIES
+    from utils.insert_data import primary_key
+
+    aliases = []
+    try:
+        for i, path in enumerate(paths):
+            alias = f"shard_{i}"
+            quoted = path.replace("'", "''")
+            conn.execute(f"ATTACH '{quoted}' AS {alias} (READ_ONLY)")
+            aliases.append(alias)
+
+        target = conn.execute("SELECT current_database()").fetchone()[0]
+        sources = {}
+        for database, table in conn.execute(
+            "SELECT database_name, table_name FROM duckdb_tables() ORDER BY table_name"
+        ).fetchall():
+            if database in aliases:
+                sources.setdefault(table, []).append(database)
+        existing = {
+            table
+            for (table,) in conn.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE database_name = ?", [target]
+            ).fetchall()
+        }
+
+        counts = {}
+        conn.begin()
+        try:
+            for table, databases in sources.items():
+                # Summaries are rebuilt from the merged rows instead
+                if table not in existing or table in SUMMARIES or not primary_key(table, conn):
+                    continue
+                union = " UNION ALL BY NAME ".join(
+                    f'SELECT * FROM {database}."{table}"' for database in databases
+                )
+                rows = conn.execute(f"SELECT count(*) FROM ({union})").fetchone()[0]
+                inserted = conn.execute(
+                    f'INSERT INTO "{table}" BY NAME {union} ON CONFLICT DO NOTHING'
+                ).fetchone()[0]
+                counts[table] = {"inserted": inserted, "skipped": rows - inserted}
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    finally:
+        for alias in aliases:
+            conn.execute(f"DETACH {alias}")
+
+    return counts
@@ -0,0 +1,185 @@
+"""
+This module keeps the catalogue of every studio (all media it produced) so
+that it is downloaded once, instead of with every anime of the studio.
+
+Pages only carry the studios of each anime (see `preprocess.studios`). The
+fetch engine looks the studios of every page up in a StudioCache and, for
+studios whose catalogue is unknown or older than the TTL, fetches it with
+`StudioQuery`. The catalogue rows are loaded into the AnimeStudio and
+StudioDim tables, and the time they were fetched into the StudioFetch table,
+so the next run starts with the cache of the previous one.
+
+Functions:
+    create_table(conn, replace: bool):
+        Create the StudioFetch table.
+    decode_catalog(body: bytes) -> tuple[pl.DataFrame, bool]:
+        Decode one page of a studio catalogue.
+    merge_catalog(tables: dict, catalog: pl.DataFrame):
+        Add the catalogue rows of a page to its tables.
+
+Classes:
+    StudioCache:
+        The fetch times of the studio catalogues, with a TTL.
+
+Attributes:
+    STUDIO_QUERY (str): The GraphQL query of one page of a studio catalogue.
+    CATALOG_SCHEMA (dict): The columns of catalogue rows, those of the
+                           AnimeStudio and StudioDim tables.
+"""
+
+import json
+import time
+
+import polars as pl
+
+STUDIO_QUERY = """
+query StudioQuery($id: Int, $page: Int, $perPage: Int) {
+  Studio(id: $id) {
+    id
+    name
+    media(page: $page, perPage: $perPage, sort: ID) {
+      pageInfo {
+        hasNextPage
+      }
+      nodes {
+        id
+        season
+        seasonYear
+      }
+    }
+  }
+}
+"""
+
+CATALOG_SCHEMA = {
+    "AnimeID": pl.Int64,
+    "Season": pl.String,
+    "SeasonYear": pl.Int64,
+    "StudioID": pl.Int64,
+    "StudioName": pl.String,
+}
+
+FETCH_TABLE = """
+CREATE {} StudioFetch (
+    StudioID INTEGER PRIMARY KEY,
+    FetchedAt TIMESTAMP
+);
+"""
+
+
+def create_table(conn, replace: bool = False):
+    """Create the StudioFetch table.
+
+    Args:
+        conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+        replace (bool): Replace an existing table, forgetting the cache.
+    """
+    conn.execute(FETCH_TABLE.format("OR REPLACE TABLE" if replace else "TABLE IF NOT EXISTS"))
+
+
+def decode_catalog(body: bytes) -> tuple[pl.DataFrame, bool]:
+    """Decode one page of a studio catalogue.
+
+    Args:
+        body (bytes): The raw response body of a STUDIO_QUERY request.
+
+    Returns:
+        tuple[pl.DataFrame, bool]: The catalogue rows of the page and whether
+                                   the catalogue continues.
+
+    Raises:
+        KeyError, TypeError: If the response carries no studio.
+    """
+    studio = json.loads(body)["data"]["Studio"]
+    media = studio["media"]
+    rows = [
+        (node["id"], node["season"], node["seasonYear"], studio["id"], studio["name"])
+        for node in media["nodes"]
+    ]
+    return (
+        pl.DataFrame(rows, schema=CATALOG_SCHEMA, orient="row"),
+        media["pageInfo"]["hasNextPage"],
+    )
+
+
+def merge_catalog(tables: dict, catalog: pl.DataFrame):
+    """Add the catalogue rows of a page to its tables.
+
+    The rows join the AnimeStudio links and StudioDim names of the page, and
+    every studio in them gets a StudioFetch row, so all are stored in the
+    same transaction.
+
+    Args:
+        tables (dict): Mapping of table name to its preprocessed DataFrame.
+        catalog (pl.DataFrame): The catalogue rows fetched with the page.
+    """
+    if catalog is None or len(catalog) == 0:
+        return
+    for table, rows in (
+        ("AnimeStudio", catalog.select(["AnimeID", "Season", "SeasonYear", "StudioID"])),
+        ("StudioDim", catalog.select(["StudioID", "StudioName"]).unique(maintain_order=True)),
+    ):
+        stored = tables.get(table)
+        if isinstance(stored, pl.DataFrame):
+            rows = pl.concat([stored, rows], how="vertical_relaxed").unique(maintain_order=True)
+        tables[table] = rows
+    tables["StudioFetch"] = catalog.select(pl.col("StudioID").unique()).with_columns(
+        FetchedAt=pl.from_epoch(pl.lit(int(time.time())), time_unit="s")
+    )
+
+
+class StudioCache:
+    """The fetch times of the studio catalogues, with a TTL.
+
+    A studio is stale if its catalogue was never fetched or not within the
+    last `ttl` seconds. Claiming a stale studio marks it fetched right away,
+    so seasons fetched concurrently do not download the same catalogue.
+
+    Args:
+        ttl (float): How long a fetched catalogue stays fresh, in seconds.
+        fetched (dict): Mapping of studio id to its fetch time (unix time).
+    """
+
+    def __init__(self, ttl: float = 30 * 86400, fetched: dict = None):
+        self.ttl = ttl
+        self.fetched = dict(fetched or {})
+
+    @classmethod
+    def load(cls, conn, ttl: float = 30 * 86400) -> "StudioCache":
+        """Start from the fetch times stored in the StudioFetch table.
+
+        Args:
+            conn (duckdb.DuckDBPyConnection): An open DuckDB connection.
+            ttl (float): How long a fetched catalogue stays fresh, in seconds.
+
+        Returns:
+            StudioCache: The cache.
+        """
+        rows = conn.execute("SELECT StudioID, epoch(FetchedAt) FROM StudioFetch").fetchall()
+        return cls(ttl, dict(rows))
+
+    def claim(self, ids) -> list[int]:
+        """Mark the stale studios among `ids` as fetched now.
+
+        Args:
+            ids (Iterable[int]): The studios of a page.
+
+        Returns:
+            list[int]: The studios whose catalogue has to be fetched.
+        """
+        now = time.time()
+        stale = []
+        for studio in dict.fromkeys(ids):
+            if studio is None or now - self.fetched.get(studio, float("-inf")) < self.ttl:
+                continue
+            self.fetched[studio] = now
+            stale.append(studio)
+        return stale
+
+    def release(self, studio: int):
+        """Undo the claim of a studio whose catalogue could not be fetched.
+
+        Args:
+            studio (int): The studio.
+        """
+        self.fetched.pop(studio, None)
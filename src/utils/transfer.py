@@ -0,0 +1,567 @@
+"""
+This module runs transfers from Anilist into a DuckDB database in process,
+so that a scheduler can start one job after another without spawning an
+interpreter (and importing polars, DuckDB and the HTTP stack) for each.
+data_transfer.py is a thin command line over it.
+
+A Transfer opens the database connection, the pooled HTTP connections, the
+rate controller, the index of known keys and the studio cache once and
+keeps them warm; every `run` or `sync` then only fetches, normalizes and
+loads, and writes its own run report.
+
+Classes:
+    Transfer:
+        Transfers seasons or delta syncs into one database, run after run.
+
+Example:
+    >>> with Transfer(upsert=True) as transfer:
+    ...     transfer.run(range(2024, 2026))
+    ...     transfer.sync(report="src/.cache/reports/sync.json")
+"""
+
+import os
+from dataclasses import dataclass, field
+
+import duckdb
+from tqdm import tqdm
+
+from init_duckdb import create_tables
+from utils import aggregates, checkpoint, lake, preprocess, studio_cache
+from utils.cache import ResponseCache
+from utils.custom_exceptions import NoAnimeEntriesFound
+from utils.fetch_data import FetchEngine
+from utils.graphql import project
+from utils.key_index import KeyIndex
+from utils.memory import MemoryBudget
+from utils.metrics import REGISTRY
+from utils.normalize import normalize
+from utils.pipeline import pipeline
+from utils.plan import SEASONS, plan_seasons
+from utils.rate_limit import RateController
+from utils.shard import shard_path, shard_plan
+from utils.studio_cache import StudioCache
+from utils.transport import Transport
+
+QUERY_PATH = os.path.join(os.path.dirname(__file__), "api_query.graphql")
+
+
+@dataclass
+class _Tally:
+    """What has been loaded of the season being loaded."""
+
+    label: str
+    retrieved: int = 0
+    totals: dict = field(default_factory=dict)
+    written: dict = field(default_factory=dict)
+    touched: set = field(default_factory=set)
+
+
+class Transfer:
+    """Transfers seasons or delta syncs into one database, run after run.
+
+    The database must have been created with init_duckdb.py, except for a
+    new shard database, which is created with the same schema.
+
+    Args:
+        database (str): The database to load into (default: src/anilist.duckdb,
+                        or src/shards/shard-INDEX-of-COUNT.duckdb with `shard`).
+        url (str): The GraphQL endpoint.
+        concurrency (int): The maximum number of API requests in flight.
+        tables (Iterable[str]): Only fetch, preprocess and load these tables
+                                (default: all of preprocess.TABLES).
+        upsert (bool): Update stored rows whose values changed instead of
+                       skipping them. Pages are then fetched again rather
+                       than read from the response cache (unless replaying),
+                       which only stores the fresh responses.
+        cache_dir (str): Where raw API responses are cached; None to not
+                         read or write the cache.
+        replay (bool): Read pages from the response cache only.
+        shard (tuple[int, int]): (INDEX, COUNT); only transfer every COUNT-th
+                                 season of a plan, starting at INDEX.
+        output (str): duckdb, parquet or both.
+        lake_dir (str): Where the partitioned Parquet files are written.
+        row_group_size (int): The maximum number of rows per Parquet row group.
+        profile_tables (bool): Time the preprocessing of every table separately.
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait for a response.
+        http2 (bool): Use HTTP/2 if the optional httpx[http2] package is installed.
+        batch (int): Pages of a season fetched per request.
+        split (bool): Fetch reviews and studios with separate id_in queries,
+                      only for new or changed media.
+        studio_ttl (float): Days before the catalogue of a studio is fetched
+                            again; None to not fetch catalogues.
+        query (str): The GraphQL page query (default: utils/api_query.graphql).
+        keys_dir (str): Where the snapshots of the known keys are kept.
+
+    Raises:
+        ValueError: If a table or output is unknown, or `replay` has no
+                    cache to read from.
+    """
+
+    def __init__(
+        self,
+        database: str = None,
+        url: str = "https://graphql.anilist.co",
+        concurrency: int = 4,
+        tables=None,
+        upsert: bool = False,
+        cache_dir: str = "src/.cache/responses",
+        replay: bool = False,
+        shard: tuple[int, int] = None,
+        output: str = "duckdb",
+        lake_dir: str = "src/lake",
+        row_group_size: int = 100_000,
+        profile_tables: bool = False,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        http2: bool = False,
+        batch: int = 1,
+        split: bool = False,
+        studio_ttl: float = 30.0,
+        query: str = None,
+        keys_dir: str = "src/.cache/keys",
+    ):
+        unknown = [table for table in tables or () if table not in preprocess.TABLES]
+        if unknown:
+            raise ValueError(
+                f"unknown table(s) {', '.join(unknown)}; "
+                f"choose from {', '.join(preprocess.TABLES)}"
+            )
+        if output not in ("duckdb", "parquet", "both"):
+            raise ValueError(f"output must be duckdb, parquet or both, got {output!r}")
+        if replay and cache_dir is None:
+            raise ValueError("replay reads from the response cache, which is disabled")
+
+        self.url = url
+        self.concurrency = concurrency
+        self.tables = list(tables) if tables else None
+        self.targets = list(dict.fromkeys(tables or preprocess.TABLES))
+        self.upsert = upsert
+        self.cache = ResponseCache(cache_dir) if cache_dir is not None else None
+        self.replay = replay
+        self.shard = shard
+        self.load_db = output in ("duckdb", "both")
+        self.write_lake = output in ("parquet", "both")
+        self.lake_dir = lake_dir
+        self.row_group_size = row_group_size
+        self.profile_tables = profile_tables
+        self.batch = batch
+        self.split = split
+        # Recorded in the run reports
+        self.options = {
+            "url": url,
+            "concurrency": concurrency,
+            "tables": self.tables,
+            "upsert": upsert,
+            "replay": replay,
+            "shard": shard,
+            "output": output,
+            "batch": batch,
+            "split": split,
+            "studio_ttl": studio_ttl,
+        }
+
+        if query is None:
+            with open(QUERY_PATH, "r", encoding="UTF-8") as file:
+                query = file.read()
+        # Pages cached by a transfer of every table also serve selected ones
+        self.source_query = query
+        if self.tables:
+            # Only request the media fields the selected tables are built from
+            query = project(
+                query,
+                "Page.media",
+                [path for table in self.targets for path in preprocess.FIELDS[table]]
+                + ["updatedAt"],
+            )
+        self.query = query
+
+        self.database = database or (shard_path(*shard) if shard else "src/anilist.duckdb")
+        self.options["database"] = self.database
+        if shard:
+            os.makedirs(os.path.dirname(self.database) or ".", exist_ok=True)
+        self.conn = duckdb.connect(self.database)
+        if shard and not self.conn.execute(
+            "SELECT count(*) FROM duckdb_tables() WHERE table_name = 'Anime'"
+        ).fetchone()[0]:
+            # A new shard database starts with the schema of the main database
+            create_tables(self.conn)
+        checkpoint.create_table(self.conn)
+        studio_cache.create_table(self.conn)
+        aggregates.create_tables(self.conn)
+
+        self.index = KeyIndex(
+            os.path.join(keys_dir, os.path.splitext(os.path.basename(self.database))[0])
+        )
+        self.index.warm(self.conn, self.targets if self.load_db else [])
+
+        self.studios = None
+        if "AnimeStudio" in self.targets and studio_ttl is not None:
+            self.studios = StudioCache.load(self.conn, ttl=studio_ttl * 86400)
+
+        self.bucket = RateController()
+        self.transport = Transport(
+            pool_size=concurrency,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            http2=http2,
+        )
+        if http2 and not self.transport.http2:
+            print("🟨 HTTP/2 needs the httpx[http2] package; using HTTP/1.1.")
+
+    def __enter__(self) -> "Transfer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Close the HTTP connections and the database."""
+        self.transport.close()
+        self.conn.close()
+
+    def plan(self, years, resume: bool = False) -> list[tuple[int, str]]:
+        """The seasons a `run` over the given years transfers.
+
+        Args:
+            years (Iterable[int]): The years to transfer.
+            resume (bool): Leave out the seasons the checkpoints record as done.
+
+        Returns:
+            list[tuple[int, str]]: The (year, season) work items, in order.
+
+        Raises:
+            ValueError: If resuming a transfer of selected tables only.
+        """
+        if resume and self.tables:
+            raise ValueError("resuming needs the checkpoints of full transfers; drop the tables")
+        plan = plan_seasons(years)
+        if self.shard:
+            plan = shard_plan(plan, *self.shard)
+        if resume:
+            plan = checkpoint.pending(self.conn, plan)
+        return plan
+
+    def run(
+        self,
+        years,
+        resume: bool = False,
+        stream: bool = False,
+        max_memory: float = None,
+        report: str = None,
+        prometheus: str = None,
+    ) -> dict:
+        """Transfer every season of the given years.
+
+        Args:
+            years (Iterable[int]): The years to transfer.
+            resume (bool): Skip the pages already transferred by a previous run.
+            stream (bool): Normalize and load every page as soon as it is
+                           fetched, one season at a time (see utils.memory).
+            max_memory (float): MB of memory above which page requests wait
+                                for the loaded pages to be freed (implies
+                                `stream`).
+            report (str): Where the JSON run report is written; None to not
+                          write one.
+            prometheus (str): Also write the metrics in the Prometheus text format.
+
+        Returns:
+            dict: Mapping of table name to {"inserted": int, "updated": int,
+                  "skipped": int}, summed over the run.
+        """
+        years = list(years)
+        plan = self.plan(years, resume)
+        REGISTRY.reset()
+        if self.shard:
+            tqdm.write(
+                f"🟦 Shard {self.shard[0]}/{self.shard[1]}: {len(plan)} season(s) "
+                f"into {self.database}."
+            )
+        if resume:
+            tqdm.write(f"🟦 Resuming: {len(plan)} season(s) left to transfer.")
+
+        engine = self._engine()
+        budget = None
+        if stream or max_memory is not None:
+            budget = MemoryBudget(
+                limit=int(max_memory * 2**20) if max_memory is not None else None
+            )
+            # Page N is written while N+1 is preprocessed; N+2 is requested once N is freed
+            results = pipeline(engine.iter_pages(plan, budget), self._transform, maxsize=1)
+        else:
+            # Season N is written while N+1 is preprocessed and later seasons are fetched
+            results = pipeline(engine.iter_seasons(plan), self._transform)
+
+        arguments = {
+            **self.options,
+            "years": years,
+            "resume": resume,
+            "stream": budget is not None,
+            "max_memory": max_memory,
+        }
+        return self._load(results, len(plan), False, budget, report, prometheus, arguments)
+
+    def sync(self, report: str = None, prometheus: str = None) -> dict:
+        """Load the anime updated since the last sync, with upserts.
+
+        The changed media are fetched in one sequential walk down the update
+        time, which stops at the watermark of the previous sync. The first
+        sync loads the newest page of updates and records its watermark.
+
+        Args:
+            report (str): Where the JSON run report is written; None to not
+                          write one.
+            prometheus (str): Also write the metrics in the Prometheus text format.
+
+        Returns:
+            dict: Mapping of table name to {"inserted": int, "updated": int,
+                  "skipped": int}.
+
+        Raises:
+            ValueError: If the transfer is sharded.
+        """
+        if self.shard:
+            raise ValueError("a sync is a single sequential walk and cannot be sharded")
+        REGISTRY.reset()
+        watermark = checkpoint.watermark(self.conn)
+        if watermark is None:
+            tqdm.write("🟨 First sync: only the newest page of updates is loaded.")
+        results = pipeline(map(self._engine().sync, [watermark]), self._transform)
+        arguments = {**self.options, "sync": True}
+        return self._load(results, 1, True, None, report, prometheus, arguments)
+
+    def _engine(self) -> FetchEngine:
+        """A fetch engine over the warm connections, with the current versions."""
+        engine = FetchEngine(
+            url=self.url,
+            query=self.query,
+            concurrency=self.concurrency,
+            bucket=self.bucket,
+            cache=self.cache,
+            replay=self.replay,
+            # Cached pages hold the values an upsert is meant to refresh
+            refresh=self.upsert,
+            api=self.transport,
+            batch=self.batch,
+            details=preprocess.DETAIL_FIELDS if self.split else None,
+            # Details already in the database are only fetched again once changed
+            versions=checkpoint.versions(self.conn) if self.split and self.load_db else None,
+            studios=self.studios,
+            source_query=self.source_query,
+        )
+        if engine.batch < self.batch:
+            tqdm.write(
+                f"🟨 Batches are capped at {engine.batch} page(s) "
+                "by the estimated query complexity."
+            )
+            self.batch = engine.batch
+        return engine
+
+    def _transform(self, result):
+        """Preprocess each fetched page of a season into its tables.
+
+        Args:
+            result (SeasonResult): The fetched pages of a season.
+
+        Returns:
+            list[tuple[int, bool, dict]]: The (page, has_next_page, tables) units
+                                          to load. A complete season without any
+                                          anime yields one empty unit, so that it
+                                          is checkpointed too, as does the empty
+                                          page ending a streamed season.
+        """
+        last = len(result.frames) - 1
+        units = []
+        for i, frame in enumerate(result.frames):
+            details = result.details[i] if result.details else None
+            tables = normalize(
+                frame, self.targets, per_table=self.profile_tables, details=details
+            )
+            if details is not None:
+                tables["MediaVersion"] = checkpoint.version_rows(frame, details)
+            if result.catalogs:
+                studio_cache.merge_catalog(tables, result.catalogs[i])
+            has_next_page = result.more or not (result.complete and i == last)
+            units.append((result.first_page + i, has_next_page, tables))
+        if not result.frames and result.complete:
+            units.append((result.first_page, False, {}))
+        return units
+
+    def _load(self, results, seasons, sync, budget, report, prometheus, arguments) -> dict:
+        """Load the transformed results of a run, season by season.
+
+        The pipeline stages are stopped when loading stops early, so that
+        they do not keep fetching into the shared connections.
+
+        Returns:
+            dict: Mapping of table name to {"inserted": int, "updated": int,
+                  "skipped": int}, summed over the run.
+        """
+        upsert = self._upserted(sync)
+        loaded = {}
+        season_bar = tqdm(total=seasons or 1, position=0, leave=False, colour="#60D850")
+        tally = None
+        try:
+            for result, units in results:
+                # Streamed seasons arrive as several results, one per page
+                if tally is None or result.label != tally.label:
+                    tally = _Tally(result.label)
+                    tqdm.write(f"===== {SEASONS.get(result.season, '🔄')}  {result.label} =====")
+                    season_bar.set_description(f"Fetching {result.label}")
+
+                try:
+                    if result.frames:
+                        self._load_pages(result, units, tally, loaded, sync, budget, upsert)
+                    else:
+                        self._load_end(result, units, tally, sync, upsert)
+                except NoAnimeEntriesFound as e:
+                    tqdm.write(f"{e}")
+                except Exception as e:
+                    tqdm.write(f"🟥 Caught an error: {type(e).__name__}: {e}")
+
+                more, complete = result.more, result.complete
+                if budget is not None and result.frames:
+                    # Every reference to the page is dropped before it is released
+                    result = units = None
+                    budget.release()
+                if more:
+                    continue
+                REGISTRY.add("seasons", complete=str(complete).lower())
+                season_bar.update(1)
+
+        finally:
+            results.close()
+            season_bar.close()
+            self.index.save(self.conn)
+            REGISTRY.write(report=report, prometheus=prometheus, arguments=arguments)
+            if budget is not None:
+                tqdm.write(f"🟦 Peak memory: {budget.peak / 2**20:.0f} MB")
+            if report:
+                tqdm.write(f"🟦 Run report written to {report}")
+
+        return loaded
+
+    def _upserted(self, sync: bool) -> list[str]:
+        """The tables whose changed rows a run updates."""
+        upsert = [table for table in self.targets if table in preprocess.MUTABLE]
+        if not (self.upsert or sync):
+            upsert = []
+        if self.split:
+            # The versions are upserted with the details they describe
+            upsert.append("MediaVersion")
+        if self.studios is not None:
+            upsert.append("StudioFetch")
+        return upsert
+
+    def _load_unit(self, result, page, has_next_page, tables, sync, upsert) -> dict:
+        """Load one page and record its checkpoint, see `checkpoint.load_unit`."""
+        return checkpoint.load_unit(
+            self.conn,
+            result.year,
+            result.season,
+            page,
+            has_next_page,
+            tables,
+            record=not (self.tables or sync),
+            index=self.index,
+            upsert=upsert,
+        )
+
+    def _load_pages(self, result, units, tally, loaded, sync, budget, upsert):
+        """Write the pages of a result to the outputs, summing up a finished season."""
+        entries = sum(len(frame) for frame in result.frames)
+        if budget is not None:
+            retrieved = f"🟩 Page {result.first_page} retrieved. "
+        else:
+            retrieved = f"🟩 Maximum pages retrieved ({result.pages}, {result.cached} cached). "
+        tqdm.write(
+            f"{retrieved}Retrieved {entries} anime entries. "
+            f"Requests remaining: {result.rate_limit_remaining}/{result.rate_limit_limit}"
+        )
+        if not result.complete:
+            tqdm.write(f"🟥 Some pages of {result.label} could not be retrieved.")
+
+        if not tally.retrieved:
+            tqdm.write("🟦 Inserting data...")
+        tally.retrieved += entries
+        for page, has_next_page, tables in units:
+            if self.write_lake:
+                name = f"sync-{result.updated_at}" if sync else f"{result.season}-{result.year}"
+                for table, rows in lake.write_tables(
+                    self.lake_dir, tables, f"{name}-p{page:04d}", self.row_group_size
+                ).items():
+                    tally.written[table] = tally.written.get(table, 0) + rows
+            if not self.load_db:
+                # Only the checkpoint and the studio fetch times, which the
+                # lake does not keep, are recorded without the database output
+                tables = {table: data for table, data in tables.items() if table == "StudioFetch"}
+            counts = self._load_unit(result, page, has_next_page, tables, sync, upsert)
+            for table, count in counts.items():
+                for total in (
+                    tally.totals.setdefault(table, dict.fromkeys(count, 0)),
+                    loaded.setdefault(table, dict.fromkeys(count, 0)),
+                ):
+                    for key, value in count.items():
+                        total[key] += value
+            if self.load_db:
+                tally.touched |= aggregates.partitions(tables)
+
+        # A streamed season is summed up after its last page
+        if result.more:
+            return
+        if self.write_lake:
+            tqdm.write(
+                f"🟩 PARQUET: {sum(tally.written.values())} rows of {len(tally.written)} "
+                f"tables written to {self.lake_dir}"
+            )
+        if self.load_db:
+            for table in self.targets:
+                totals = tally.totals.get(table)
+                if totals is None:
+                    tqdm.write(f"🟨 No data found for {table.upper()}")
+                elif table in upsert:
+                    tqdm.write(
+                        f"🟩 {table.upper()}: {totals['inserted']} inserted, "
+                        f"{totals['updated']} updated, {totals['skipped']} unchanged"
+                    )
+                else:
+                    tqdm.write(
+                        f"🟩 {table.upper()}: {totals['inserted']} inserted, "
+                        f"{totals['skipped']} already exist"
+                    )
+        if tally.touched:
+            # Only the summaries of the loaded partitions are recomputed
+            aggregates.refresh(self.conn, tally.touched)
+            tqdm.write(f"🟩 Summaries of {len(tally.touched)} partition(s) refreshed")
+        if sync and result.complete:
+            checkpoint.advance(self.conn, result.updated_at)
+        tqdm.write(f"🟩 All data inserted for {result.label}!")
+
+    def _load_end(self, result, units, tally, sync, upsert):
+        """Record a result without pages: an empty season, or the end of one.
+
+        Raises:
+            NoAnimeEntriesFound: If a complete season holds no anime.
+        """
+        for page, has_next_page, tables in units:
+            self._load_unit(result, page, has_next_page, tables, sync, upsert)
+        if tally.touched:
+            # A streamed season ending on an empty page
+            aggregates.refresh(self.conn, tally.touched)
+        if sync and result.complete and result.updated_at is not None:
+            checkpoint.advance(self.conn, result.updated_at)
+
+        remaining = f"Requests remaining: {result.rate_limit_remaining}/{result.rate_limit_limit}"
+        # A failed first page is no evidence of an empty season
+        if not result.complete and not tally.retrieved:
+            tqdm.write(f"🟥 {result.label} could not be retrieved. {remaining}")
+        elif not result.complete:
+            tqdm.write(f"🟥 Some pages of {result.label} could not be retrieved.")
+        elif sync:
+            tqdm.write("🟩 No anime updated since the last sync.")
+        elif tally.retrieved:
+            tqdm.write(f"🟩 All data inserted for {result.label}!")
+        else:
+            raise NoAnimeEntriesFound(
+                f"🟨 No anime entries found for {result.label}. {remaining}"
+            )
@@ -0,0 +1,118 @@
+"""
+This module sends the GraphQL requests over a pooled, persistent HTTP
+session instead of opening a new connection for every page.
+
+Connections are kept alive and reused by all threads of the fetch engine,
+responses are requested compressed (gzip, plus brotli when the `brotli`
+package is installed) and the connect and read timeouts are separate.
+With `http2=True` and the optional `httpx[http2]` package installed,
+requests are multiplexed over HTTP/2; otherwise HTTP/1.1 is used.
+
+The bytes sent and received (as transferred, i.e. compressed) are recorded
+in `utils.metrics.REGISTRY`.
+
+A Transport can be passed to `FetchEngine(api=...)`, so tests and
+benchmarks can point it at a local server.
+
+Classes:
+    Transport:
+        A pooled HTTP client for the GraphQL endpoint.
+"""
+
+import importlib.util
+import json
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import REGISTRY
+from utils.plan import page_variables
+
+ENCODINGS = "gzip, deflate" + (
+    ", br" if any(importlib.util.find_spec(name) for name in ("brotli", "brotlicffi")) else ""
+)
+
+
+class Transport:
+    """A pooled HTTP client for the GraphQL endpoint.
+
+    Calling a Transport performs one page request, like `api_call`.
+
+    Args:
+        pool_size (int): The connections kept open; at least the number of
+                         requests in flight.
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait for the response.
+        http2 (bool): Use HTTP/2 if httpx and h2 are installed.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 8,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        http2: bool = False,
+    ):
+        self.timeout = (connect_timeout, read_timeout)
+        self.headers = {"Accept-Encoding": ENCODINGS, "Content-Type": "application/json"}
+        self.http2 = http2 and all(
+            importlib.util.find_spec(name) for name in ("httpx", "h2")
+        )
+
+        if self.http2:
+            import httpx
+
+            self.client = httpx.Client(
+                http2=True,
+                headers=self.headers,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(max_connections=pool_size),
+            )
+        else:
+            self.client = requests.Session()
+            self.client.headers.update(self.headers)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            self.client.mount("https://", adapter)
+            self.client.mount("http://", adapter)
+
+    def post(self, url: str, payload: dict):
+        """Send one GraphQL request.
+
+        Args:
+            url (str): The GraphQL endpoint.
+            payload (dict): The request body ({"query", "variables"}).
+
+        Returns:
+            requests.Response | httpx.Response: The response, or None if the
+                                                request failed.
+        """
+        body = json.dumps(payload).encode("UTF-8")
+        REGISTRY.add("request_bytes", len(body))
+        try:
+            if self.http2:
+                response = self.client.post(url, content=body)
+            else:
+                response = self.client.post(url, data=body, timeout=self.timeout)
+        except Exception as e:
+            print(f"Request failed: {type(e).__name__}: {e}")
+            return None
+
+        # Counted as read from the socket, before decompression; unlike
+        # Content-Length, this also covers chunked responses
+        if self.http2:
+            REGISTRY.add("response_wire_bytes", response.num_bytes_downloaded)
+        else:
+            REGISTRY.add("response_wire_bytes", response.raw.tell())
+        return response
+
+    def __call__(
+        self, url: str, query: str, year: int, season: str, page: int, sort: str = "ID"
+    ):
+        """Send one page request, with the signature of `api_call`."""
+        return self.post(
+            url, {"query": query, "variables": page_variables(year, season, page, sort)}
+        )
+
+    def close(self):
+        """Close every pooled connection."""
+        self.client.close()
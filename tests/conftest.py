@@ -0,0 +1,71 @@
+import json
+import os
+
+import duckdb
+import polars as pl
+import pytest
+
+from init_duckdb import create_tables
+from utils.mock_anilist import page_body, sample_media
+
+with open(
+    os.path.join(os.path.dirname(__file__), "..", "src", "utils", "api_query.graphql"),
+    encoding="UTF-8",
+) as file:
+    QUERY = file.read()
+
+
+@pytest.fixture
+def buffer():
+    return pl.DataFrame([sample_media(1), sample_media(2, reviews=2)])
+
+
+@pytest.fixture
+def conn():
+    connection = duckdb.connect()
+    create_tables(connection)
+    yield connection
+    connection.close()
+
+
+class FakeResponse:
+    """Stand-in for requests.Response carrying one page of sample media."""
+
+    def __init__(self, media, has_next_page, status_code=200, remaining=80, limit=90):
+        self.status_code = status_code
+        self.headers = {"X-RateLimit-Remaining": str(remaining), "X-RateLimit-Limit": str(limit)}
+        self.content = page_body(media, has_next_page)
+        self._json = json.loads(self.content)
+
+    def json(self):
+        return self._json
+
+
+def fake_api(pages_per_season=2, per_page=3, updated=None):
+    """Build an api_call replacement serving `pages_per_season` pages per season.
+
+    Pages sorted by UPDATED_AT_DESC serve the `updated` updatedAt values,
+    newest first, as anime with IDs starting at 1.
+    """
+    calls = []
+
+    def api(url, query, year, season, page, sort="ID"):
+        calls.append((year, season, page))
+        if sort == "UPDATED_AT_DESC":
+            chunk = (updated or [])[(page - 1) * per_page : page * per_page]
+            media = [
+                sample_media((page - 1) * per_page + i + 1, updated_at=updated_at)
+                for i, updated_at in enumerate(chunk)
+            ]
+            return FakeResponse(media, page * per_page < len(updated or []))
+        if page > pages_per_season:
+            return FakeResponse([], False)
+        first = year * 1000 + ["WINTER", "SPRING", "SUMMER", "FALL"].index(season) * 100
+        media = [
+            sample_media(first + (page - 1) * per_page + i, season, year)
+            for i in range(per_page)
+        ]
+        return FakeResponse(media, page < pages_per_season)
+
+    api.calls = calls
+    return api
@@ -0,0 +1,47 @@
+import polars as pl
+
+from utils import aggregates, checkpoint
+from utils.mock_anilist import sample_media
+from utils.normalize import normalize
+
+
+def load(conn, media, season="FALL", year=2014):
+    tables = normalize(pl.DataFrame(media))
+    checkpoint.load_unit(conn, year, season, 1, False, tables)
+    return tables
+
+
+def test_refresh_recomputes_only_the_loaded_partitions(conn):
+    fall = load(conn, [sample_media(1), sample_media(2, reviews=2)])
+    assert aggregates.partitions(fall) == {(2014, "FALL")}
+    aggregates.refresh(conn, aggregates.partitions(fall))
+
+    # Loaded without a refresh, so its summaries stay missing
+    load(conn, [sample_media(3, season="WINTER", year=2015)], "WINTER", 2015)
+    load(conn, [sample_media(4)])
+    aggregates.refresh(conn, {(2014, "FALL")})
+
+    assert conn.execute(
+        "SELECT AnimeCount, MeanScore, TotalPopularity FROM SeasonSummary"
+    ).fetchall() == [(3, 70.0, 3000)]
+    assert conn.execute(
+        "SELECT Genre, AnimeCount FROM GenreSummary ORDER BY Genre"
+    ).fetchall() == [("Action", 3), ("Drama", 3)]
+    assert conn.execute("SELECT ReviewCount FROM ReviewSummary").fetchall() == [(4,)]
+    stale = aggregates.verify(conn)
+    assert stale["SeasonSummary"] == 1 and stale["ReviewSummary"] == 1
+
+
+def test_full_refresh_matches_a_rebuild(conn):
+    load(conn, [sample_media(1), sample_media(2)])
+    load(conn, [sample_media(3, season="WINTER", year=2015)], "WINTER", 2015)
+    conn.execute("INSERT INTO SeasonSummary (SeasonYear, Season) VALUES (1999, 'FALL')")
+
+    counts = aggregates.refresh(conn)
+
+    assert counts["SeasonSummary"] == 2
+    assert not any(aggregates.verify(conn).values())
+    assert conn.execute(
+        "SELECT UserStatus, TotalUsers FROM StatusSummary "
+        "WHERE SeasonYear = 2015 ORDER BY UserStatus"
+    ).fetchall() == [("CURRENT", 10), ("DROPPED", 5)]
@@ -0,0 +1,87 @@
+import os
+import time
+
+from conftest import QUERY, fake_api
+from utils import preprocess
+from utils.cache import ResponseCache
+from utils.fetch_data import FetchEngine, plan_seasons
+from utils.graphql import project
+
+
+def test_cache_keys_on_query_and_variables(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("query A", {"page": 1}, b'{"a": 1}')
+
+    assert cache.get("query A", {"page": 1}) == b'{"a": 1}'
+    assert cache.get("query B", {"page": 1}) is None
+    assert cache.get("query A", {"page": 2}) is None
+
+
+def test_cache_evicts_by_age_and_size(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60)
+    cache.put("query", {"page": 1}, b"old")
+    cache.put("query", {"page": 2}, b"new")
+
+    old = cache._path(cache.key("query", {"page": 1}))
+    os.utime(old, (time.time() - 120, time.time() - 120))
+    assert cache.get("query", {"page": 1}) is None
+    assert cache.get("query", {"page": 1}, ignore_age=True) == b"old"
+
+    assert cache.evict() == 1
+    cache.max_bytes = 0
+    assert cache.evict() == 1
+
+
+def test_cache_size_counts_overwritten_entries_once(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    for _ in range(3):
+        cache.put("query", {"page": 1}, b"body" * 100)
+
+    assert cache._size == sum(stat.st_size for _, stat in cache._entries())
+
+
+def test_expired_entries_are_swept_before_the_cache_is_full(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_age=60)
+    cache.put("query", {"page": 1}, b"old")
+    old = cache._path(cache.key("query", {"page": 1}))
+    os.utime(old, (time.time() - 120, time.time() - 120))
+
+    cache._swept -= cache.SWEEP_INTERVAL + 1
+    cache.put("query", {"page": 2}, b"new")
+
+    assert not os.path.exists(old)
+
+
+def test_replay_serves_pages_without_network(tmp_path):
+    plan = plan_seasons([2000], ["WINTER", "SPRING"])
+    cache = ResponseCache(str(tmp_path))
+    api = fake_api(pages_per_season=2)
+    fetched = list(FetchEngine("http://test", QUERY, cache=cache, api=api).iter_seasons(plan))
+
+    def offline(*args):
+        raise AssertionError("replay must not hit the network")
+
+    engine = FetchEngine("http://test", QUERY, cache=cache, replay=True, api=offline)
+    replayed = list(engine.iter_seasons(plan))
+
+    assert [r.data.equals(f.data) for r, f in zip(replayed, fetched)] == [True, True]
+    assert all(r.cached == r.pages == 2 for r in replayed)
+
+
+def test_replay_of_some_tables_serves_the_full_pages(tmp_path):
+    plan = plan_seasons([2000], ["WINTER"])
+    cache = ResponseCache(str(tmp_path))
+    list(FetchEngine("http://test", QUERY, cache=cache, api=fake_api()).iter_seasons(plan))
+
+    def offline(*args):
+        raise AssertionError("replay must not hit the network")
+
+    query = project(QUERY, "Page.media", preprocess.FIELDS["Anime"])
+    engine = FetchEngine(
+        "http://test", query, cache=cache, replay=True, api=offline, source_query=QUERY
+    )
+    result = next(engine.iter_seasons(plan))
+
+    assert result.complete and result.cached == result.pages > 0
+    assert "reviews" not in result.data.columns
+    assert len(preprocess.anime(result.data)) == len(result.data)
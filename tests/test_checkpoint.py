@@ -0,0 +1,65 @@
+import pytest
+
+from utils import checkpoint
+from utils.normalize import normalize
+from utils.fetch_data import FetchEngine, plan_seasons
+from conftest import QUERY, fake_api
+
+
+def test_pending_skips_finished_seasons(conn, buffer):
+    tables = normalize(buffer)
+    checkpoint.load_unit(conn, 2000, "WINTER", 1, True, tables)
+    checkpoint.load_unit(conn, 2000, "WINTER", 2, False, {})
+    checkpoint.load_unit(conn, 2000, "SPRING", 1, True, {})
+
+    plan = plan_seasons([2000], ["WINTER", "SPRING", "SUMMER"])
+
+    assert checkpoint.pending(conn, plan) == [(2000, "SPRING", 2), (2000, "SUMMER", 1)]
+    assert conn.execute(
+        "SELECT MediaCount FROM TransferCheckpoint WHERE Page = 1 AND Season = 'WINTER'"
+    ).fetchone() == (2,)
+
+
+def test_load_unit_is_atomic(conn, buffer):
+    tables = normalize(buffer)
+    tables["Missing"] = tables["Anime"]
+
+    with pytest.raises(Exception):
+        checkpoint.load_unit(conn, 2000, "WINTER", 1, False, tables)
+
+    assert conn.execute("SELECT count(*) FROM Anime").fetchone() == (0,)
+    assert conn.execute("SELECT count(*) FROM TransferCheckpoint").fetchone() == (0,)
+
+
+def test_engine_resumes_from_first_page():
+    api = fake_api(pages_per_season=3)
+    engine = FetchEngine("http://test", QUERY, api=api)
+
+    result = next(engine.iter_seasons([(2000, "FALL", 3)]))
+
+    assert api.calls == [(2000, "FALL", 3)]
+    assert result.first_page == 3 and result.pages == 1
+
+
+def test_watermark_only_moves_forward(conn):
+    assert checkpoint.watermark(conn) is None
+
+    checkpoint.advance(conn, 1700000000)
+    checkpoint.advance(conn, 1600000000)
+    checkpoint.advance(conn, 1700000000)
+
+    assert checkpoint.watermark(conn) == 1700000000
+    assert conn.execute("SELECT count(*) FROM SyncWatermark").fetchone() == (1,)
+
+
+def test_versions_are_upserted_with_the_details(conn, buffer):
+    rows = checkpoint.version_rows(buffer, buffer.select("id", "season", "seasonYear"))
+    checkpoint.load_unit(conn, 2000, "WINTER", 1, False, {"MediaVersion": rows})
+    changed = rows.with_columns(UpdatedAt=rows["UpdatedAt"] + 1)
+    counts = checkpoint.load_unit(
+        conn, 2000, "WINTER", 1, False, {"MediaVersion": changed}, upsert=["MediaVersion"]
+    )
+
+    assert counts["MediaVersion"]["updated"] == len(buffer)
+    versions = checkpoint.versions(conn).sort("id")
+    assert versions["updatedAt"].to_list() == changed.sort("AnimeID")["UpdatedAt"].to_list()
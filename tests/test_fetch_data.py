@@ -1,4 +1,10 @@
-from utils.fetch_data import fetch_from, api_call
+import threading
+import time
+
+from utils.fetch_data import FetchEngine, api_call, fetch_from, plan_seasons
+from conftest import FakeResponse, QUERY, fake_api, sample_media
+from utils.memory import MemoryBudget
+from utils.rate_limit import RateController
 
 #TODO: Add more and finish tests
 def test_api_call():
@@ -14,4 +20,123 @@ def test_api_call():
         page=1,
     )
     
-    assert result.status_code == 200
\ No newline at end of file
+    assert result.status_code == 200
+
+
+def test_fetch_engine_yields_seasons_in_plan_order():
+    api = fake_api(pages_per_season=2, per_page=3)
+    engine = FetchEngine("http://test", QUERY, concurrency=3, api=api)
+    plan = plan_seasons(range(2000, 2002), ["WINTER", "SPRING", "SUMMER", "FALL"])
+
+    results = list(engine.iter_seasons(plan))
+
+    assert [(r.year, r.season) for r in results] == plan
+    assert all(r.complete and r.pages == 2 and len(r.data) == 6 for r in results)
+    assert sorted(api.calls) == sorted((y, s, p) for y, s in plan for p in (1, 2))
+
+
+def test_fetch_engine_respects_token_bucket():
+    api = fake_api(pages_per_season=1)
+    bucket = RateController(capacity=2, period=60.0, reserve=0)
+    engine = FetchEngine("http://test", QUERY, concurrency=4, bucket=bucket, api=api)
+
+    results = engine.iter_seasons(plan_seasons([2000], ["WINTER", "SPRING", "SUMMER"]))
+    next(results)
+    next(results)
+
+    # The third request has to wait for a token to be refilled
+    assert len(api.calls) == 2
+
+
+def test_consumer_stopping_early_shuts_the_event_loop_down():
+    api = fake_api(pages_per_season=5, per_page=3)
+    engine = FetchEngine("http://test", QUERY, concurrency=2, api=api)
+    before = set(threading.enumerate())
+
+    # The page taken is never released, so the next one waits on the budget
+    pages = engine.iter_pages(plan_seasons([2000]), MemoryBudget(ahead=1, measure=lambda: 0))
+    next(pages)
+    pages.close()
+
+    deadline = time.monotonic() + 5
+    while set(threading.enumerate()) - before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not set(threading.enumerate()) - before
+    assert len(api.calls) < 20
+
+
+def test_fetch_from_returns_rate_limit_when_empty(monkeypatch):
+    monkeypatch.setattr("utils.fetch_data.api_call", fake_api(pages_per_season=0))
+
+    assert fetch_from("http://test", QUERY, 2000, "WINTER") == (80, 90)
+
+
+def test_fetch_engine_retries_after_429():
+    responses = [
+        FakeResponse([], False, status_code=429),
+        None,  # network error
+        FakeResponse([sample_media(1)], False),
+    ]
+    responses[0].headers["Retry-After"] = "0.05"
+
+    def api(url, query, year, season, page, sort="ID"):
+        return responses.pop(0)
+
+    bucket = RateController(backoff_base=0.01)
+    engine = FetchEngine("http://test", QUERY, bucket=bucket, api=api)
+    result = next(engine.iter_seasons([(2000, "WINTER")]))
+
+    assert result.complete and result.pages == 1 and len(result.data) == 1
+
+
+def test_fetch_engine_gives_up_after_retries():
+    def api(url, query, year, season, page, sort="ID"):
+        return FakeResponse([], False, status_code=500)
+
+    bucket = RateController(backoff_base=0.01)
+    engine = FetchEngine("http://test", QUERY, bucket=bucket, retries=2, api=api)
+    result = next(engine.iter_seasons([(2000, "WINTER")]))
+
+    assert not result.complete and result.data is None
+
+
+def test_rate_controller_reads_reset_and_backoff():
+    controller = RateController(capacity=90, reserve=0, backoff_base=1.0, backoff_cap=4.0)
+    controller.observe(429, {"X-RateLimit-Remaining": "0", "X-RateLimit-Limit": "90",
+                             "X-RateLimit-Reset": "0"})
+
+    # A reset in the past refills the whole budget
+    controller._refill()
+    assert controller.tokens == 90
+    assert all(0 <= controller.backoff(10) <= 4.0 for _ in range(100))
+
+
+def test_fetch_updates_stops_at_watermark():
+    api = fake_api(per_page=3, updated=[500, 400, 300, 200, 100, 50, 40])
+    engine = FetchEngine("http://test", QUERY, api=api)
+
+    result = engine.sync(since=250)
+
+    assert result.updated_at == 500
+    assert result.data["updatedAt"].to_list() == [500, 400, 300]
+    # One page past the watermark is read for media shifted down meanwhile
+    assert result.pages == 3 and len(api.calls) == 3
+
+
+def test_fetch_updates_rereads_the_watermark_second():
+    api = fake_api(per_page=2, updated=[500, 300, 300, 200, 100, 50, 40])
+    engine = FetchEngine("http://test", QUERY, api=api)
+
+    result = engine.sync(since=300)
+
+    assert result.data["updatedAt"].to_list() == [500, 300, 300]
+    assert len(api.calls) == 3
+
+
+def test_first_sync_only_reads_the_newest_page():
+    api = fake_api(per_page=3, updated=[500, 400, 300, 200])
+    engine = FetchEngine("http://test", QUERY, api=api)
+
+    result = engine.sync()
+
+    assert result.updated_at == 500 and len(api.calls) == 1
@@ -0,0 +1,56 @@
+import polars as pl
+
+from utils import preprocess
+from utils.insert_data import bulk_insert, bulk_upsert, load_tables
+
+
+def test_bulk_insert_counts_duplicates(conn, buffer):
+    inserted, skipped = bulk_insert(preprocess.genres(buffer), "Genre", conn)
+    assert (inserted, skipped) == (4, 0)
+
+    inserted, skipped = bulk_insert(preprocess.genres(buffer), "Genre", conn)
+    assert (inserted, skipped) == (0, 4)
+
+
+def test_load_tables(conn, buffer):
+    tables = {
+        "Anime": preprocess.anime(buffer),
+        "AnimeTag": preprocess.tags(buffer),
+        "TagDim": preprocess.tag_dims(buffer),
+        "WebAsset": 501,
+    }
+    counts = load_tables(tables, conn)
+
+    assert counts == {
+        "Anime": {"inserted": 2, "updated": 0, "skipped": 0},
+        # Tag 1 is shared by both anime, and stored once
+        "AnimeTag": {"inserted": 4, "updated": 0, "skipped": 0},
+        "TagDim": {"inserted": 3, "updated": 0, "skipped": 0},
+    }
+    assert conn.execute("SELECT count(*) FROM Anime").fetchone()[0] == 2
+
+
+def test_bulk_upsert_only_updates_changed_rows(conn, buffer):
+    anime = preprocess.anime(buffer)
+    assert bulk_upsert(anime, "Anime", conn) == (2, 0, 0)
+    assert bulk_upsert(anime, "Anime", conn) == (0, 0, 2)
+
+    refreshed = anime.with_columns(
+        Popularity=pl.when(pl.col("AnimeID") == 1)
+        .then(pl.col("Popularity") + 10)
+        .otherwise(pl.col("Popularity"))
+    )
+    assert bulk_upsert(refreshed, "Anime", conn) == (0, 1, 1)
+    assert conn.execute(
+        "SELECT Popularity FROM Anime ORDER BY AnimeID"
+    ).fetchall() == [(row,) for row in refreshed.sort("AnimeID")["Popularity"]]
+
+
+def test_load_tables_upsert(conn, buffer):
+    status = preprocess.status(buffer)
+    load_tables({"Status": status}, conn)
+
+    counts = load_tables(
+        {"Status": status.with_columns(pl.col("AmountOfUsers") + 1)}, conn, upsert=["Status"]
+    )
+    assert counts == {"Status": {"inserted": 0, "updated": len(status), "skipped": 0}}
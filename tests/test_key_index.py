@@ -0,0 +1,81 @@
+from utils.insert_data import load_tables
+from utils.key_index import KeyIndex
+from utils.normalize import normalize
+
+
+def test_known_keys_are_skipped_before_insert(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    load_tables(tables, conn)
+
+    index = KeyIndex(str(tmp_path))
+    index.warm(conn, ["User", "AnimeTag"])
+
+    assert index.filter("User", tables["User"]).is_empty()
+    tags = tables["AnimeTag"]
+    assert len(index.filter("AnimeTag", tags.with_columns(TagID=tags["TagID"] + 50))) == 4
+
+
+def test_staged_keys_follow_the_transaction(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    index = KeyIndex(str(tmp_path))
+    index.warm(conn, ["User"])
+
+    index.filter("User", tables["User"])
+    index.rollback()
+    assert index.keys("User").is_empty()
+
+    counts = load_tables({"User": tables["User"]}, conn, index)
+    assert counts == {"User": {"inserted": 2, "updated": 0, "skipped": 1}}
+    assert len(index.keys("User")) == 2
+
+
+def test_snapshot_is_reused_only_while_it_matches(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    index = KeyIndex(str(tmp_path))
+    index.warm(conn, ["Anime"])
+    load_tables({"Anime": tables["Anime"]}, conn, index)
+    index.save(conn)
+
+    conn.execute("DELETE FROM Anime WHERE AnimeID = 1")
+    reloaded = KeyIndex(str(tmp_path))
+    reloaded.warm(conn, ["Anime"])
+
+    assert reloaded.keys("Anime")["AnimeID"].to_list() == [2]
+
+
+def test_snapshot_notices_replaced_rows(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    index = KeyIndex(str(tmp_path))
+    index.warm(conn, ["Anime"])
+    load_tables({"Anime": tables["Anime"]}, conn, index)
+    index.save(conn)
+
+    # As many rows deleted as inserted leaves the row count unchanged
+    conn.execute("DELETE FROM Anime WHERE AnimeID = 1")
+    conn.execute("INSERT INTO Anime SELECT * REPLACE (3 AS AnimeID) FROM Anime")
+    reloaded = KeyIndex(str(tmp_path))
+    reloaded.warm(conn, ["Anime"])
+
+    assert sorted(reloaded.keys("Anime")["AnimeID"].to_list()) == [2, 3]
+
+
+def test_snapshot_notices_a_rebuilt_table(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    index = KeyIndex(str(tmp_path))
+    index.warm(conn, ["Anime"])
+    load_tables({"Anime": tables["Anime"]}, conn, index)
+    index.save(conn)
+
+    # A rebuilt table starts its estimated size over, at the same row count
+    conn.execute(
+        "CREATE TEMP TABLE Rebuilt AS SELECT * REPLACE (AnimeID + 2 AS AnimeID) FROM Anime"
+    )
+    ddl = conn.execute(
+        "SELECT sql FROM duckdb_tables() WHERE table_name = 'Anime'"
+    ).fetchone()[0]
+    conn.execute(ddl.replace("CREATE TABLE", "CREATE OR REPLACE TABLE", 1))
+    conn.execute("INSERT INTO Anime SELECT * FROM Rebuilt")
+    reloaded = KeyIndex(str(tmp_path))
+    reloaded.warm(conn, ["Anime"])
+
+    assert sorted(reloaded.keys("Anime")["AnimeID"].to_list()) == [3, 4]
@@ -0,0 +1,93 @@
+import os
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from conftest import sample_media
+from utils import lake
+from utils.normalize import normalize
+
+
+def write_seasons(directory):
+    lake.write_tables(
+        directory, normalize(pl.DataFrame([sample_media(1), sample_media(2)])), "FALL-2014-p0001"
+    )
+    lake.write_tables(
+        directory, normalize(pl.DataFrame([sample_media(3, "WINTER", 2015)])), "WINTER-2015-p0001"
+    )
+
+
+def test_write_tables_partitions_by_season(tmp_path):
+    write_seasons(str(tmp_path))
+
+    (path,) = (tmp_path / "Anime" / "SeasonYear=2015" / "Season=WINTER").glob(
+        "WINTER-2015-p0001.v*.parquet"
+    )
+    metadata = pq.ParquetFile(path).metadata
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    assert "SeasonYear" not in pq.read_schema(path).names
+    # User has no season columns
+    assert sorted(name.split(".")[0] for name in os.listdir(tmp_path / "User")) == [
+        "FALL-2014-p0001",
+        "WINTER-2015-p0001",
+    ]
+
+
+def test_bookkeeping_tables_stay_out_of_the_lake(tmp_path):
+    tables = {
+        "Anime": pl.DataFrame({"AnimeID": [1], "Season": ["FALL"], "SeasonYear": [2014]}),
+        "MediaVersion": pl.DataFrame({"AnimeID": [1], "UpdatedAt": [1]}),
+        "StudioFetch": pl.DataFrame({"StudioID": [1]}),
+    }
+
+    assert list(lake.write_tables(str(tmp_path), tables, "FALL-2014-p0001")) == ["Anime"]
+    assert os.listdir(tmp_path) == ["Anime"]
+
+
+def test_views_prune_partitions_and_keep_one_row_per_key(conn, tmp_path):
+    write_seasons(str(tmp_path))
+    lake.create_views(conn, str(tmp_path))
+
+    assert conn.execute(
+        "SELECT AnimeID FROM lake.Anime WHERE SeasonYear = 2015"
+    ).fetchall() == [(3,)]
+    # Tag 1 and user 900 occur on every page
+    assert conn.execute("SELECT count(*) FROM lake.TagDim WHERE TagID = 1").fetchone() == (1,)
+    assert conn.execute("SELECT count(*) FROM lake.User").fetchone() == (1,)
+
+
+def test_rewritten_rows_are_read_from_the_newest_file(conn, tmp_path):
+    # A quote in the path must not break the read_parquet calls
+    directory = str(tmp_path / "anilist's lake")
+    write_seasons(directory)
+    anime = normalize(pl.DataFrame([sample_media(3, "WINTER", 2015)]))["Anime"]
+
+    def popularity():
+        lake.create_views(conn, directory)
+        return conn.execute("SELECT Popularity FROM lake.Anime WHERE AnimeID = 3").fetchall()
+
+    # A delta sync writes the changed media into a file of its own
+    synced = anime.with_columns(Popularity=pl.lit(2000))
+    lake.write_tables(directory, {"Anime": synced}, "sync-1500000000-p0001")
+    assert popularity() == [(2000,)]
+    # An upsert rewrites the season's page later on
+    upserted = anime.with_columns(Popularity=pl.lit(3000))
+    lake.write_tables(directory, {"Anime": upserted}, "WINTER-2015-p0001")
+    assert popularity() == [(3000,)]
+
+    assert lake.load(conn, directory)["Anime"] == {"inserted": 3, "skipped": 0}
+    assert conn.execute("SELECT Popularity FROM Anime WHERE AnimeID = 3").fetchone() == (3000,)
+    # Rewriting the page replaced its file
+    partition = os.path.join(directory, "Anime", "SeasonYear=2015", "Season=WINTER")
+    assert len(os.listdir(partition)) == 2
+
+
+def test_load_is_idempotent(conn, tmp_path):
+    write_seasons(str(tmp_path))
+
+    first = lake.load(conn, str(tmp_path))
+    second = lake.load(conn, str(tmp_path))
+
+    assert first["Anime"] == {"inserted": 3, "skipped": 0}
+    assert second["Anime"] == {"inserted": 0, "skipped": 3}
+    assert conn.execute("SELECT count(*) FROM Anime").fetchone() == (3,)
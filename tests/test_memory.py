@@ -0,0 +1,34 @@
+import asyncio
+
+from utils.memory import MemoryBudget, rss
+
+
+def test_rss_measures_the_process():
+    assert rss() > 0
+
+
+def test_budget_waits_for_held_pages_while_over_the_ceiling():
+    usage = [200]
+    budget = MemoryBudget(limit=100, ahead=4, interval=0.001, measure=lambda: usage[0])
+    budget.hold()
+
+    async def admitted_after_release():
+        admit = asyncio.create_task(budget.admit())
+        await asyncio.sleep(0.05)
+        waiting = not admit.done()
+        usage[0] = 50
+        budget.release()
+        await admit
+        return waiting
+
+    assert asyncio.run(admitted_after_release())
+    assert budget.peak == 200 and not budget.exceeded
+
+
+def test_budget_admits_when_nothing_is_left_to_free():
+    budget = MemoryBudget(limit=100, measure=lambda: 200)
+
+    asyncio.run(budget.admit())
+    asyncio.run(budget.admit())
+
+    assert budget.exceeded == 2
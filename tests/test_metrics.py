@@ -0,0 +1,48 @@
+import json
+
+from utils.insert_data import load_tables
+from utils.metrics import REGISTRY, Histogram, Metrics
+from utils.normalize import normalize
+
+
+def test_histogram_summary():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in [0.05, 0.05, 0.5, 2.0]:
+        histogram.observe(value)
+
+    summary = histogram.summary()
+    assert summary["count"] == 4 and summary["max"] == 2.0
+    assert summary["p50"] == 0.1
+    assert histogram.counts == [2, 1]
+
+
+def test_prometheus_text_format():
+    metrics = Metrics()
+    metrics.add("inserted_rows", 3, table="Anime")
+    metrics.set("rate_limit_remaining", 42)
+    metrics.observe("request_seconds", 0.02, status="200")
+
+    text = metrics.prometheus(prefix="t")
+
+    assert '# TYPE t_inserted_rows_total counter\nt_inserted_rows_total{table="Anime"} 3' in text
+    assert "t_rate_limit_remaining 42" in text
+    assert 't_request_seconds_bucket{status="200",le="0.025"} 1' in text
+    assert 't_request_seconds_bucket{status="200",le="+Inf"} 1' in text
+    assert 't_request_seconds_count{status="200"} 1' in text
+
+
+def test_stages_record_into_the_registry(conn, buffer, tmp_path):
+    REGISTRY.reset()
+    load_tables(normalize(buffer), conn)
+    REGISTRY.write(report=str(tmp_path / "run.json"), prometheus=str(tmp_path / "run.prom"))
+
+    report = json.loads((tmp_path / "run.json").read_text())
+    counters = {
+        (entry["name"], entry["labels"].get("table")): entry["value"]
+        for entry in report["counters"]
+    }
+    assert counters[("inserted_rows", "Anime")] == 2
+    assert counters[("skipped_rows", "User")] == 1
+    assert counters[("preprocessed_rows", "User")] == 3
+    assert "Anime" in report["insert_rows_per_second"]
+    assert (tmp_path / "run.prom").read_text().startswith("# TYPE")
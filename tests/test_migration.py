@@ -0,0 +1,94 @@
+import duckdb
+import pytest
+
+from init_duckdb import create_tables
+from utils.migration import SCAN_QUERIES, copy, measure
+
+OLD_SCHEMA = """
+CREATE TABLE Anime (
+    AnimeID INTEGER, Season VARCHAR(6), SeasonYear INTEGER, Format TEXT, MeanScore INTEGER,
+    PRIMARY KEY (AnimeID, Season, SeasonYear)
+);
+CREATE TABLE Review (
+    ReviewID INTEGER PRIMARY KEY, Rating INTEGER, RatingAmount INTEGER, Body TEXT,
+    Season VARCHAR(6), SeasonYear INTEGER
+);
+CREATE TABLE Status (AnimeID INTEGER, Season VARCHAR(6), SeasonYear INTEGER,
+    AmountOfUsers INTEGER, UserStatus TEXT);
+CREATE TABLE Genre (Genre TEXT, AnimeID INTEGER, Season VARCHAR(6), SeasonYear INTEGER);
+CREATE TABLE Tag (TagID INTEGER PRIMARY KEY, IsAdult BOOLEAN, Category TEXT,
+    AnimeID INTEGER, Season VARCHAR(6), SeasonYear INTEGER);
+CREATE TABLE Studio (AnimeID INTEGER, Season VARCHAR(6), SeasonYear INTEGER,
+    StudioID INTEGER, StudioName TEXT);
+CREATE TABLE User (UserID INTEGER PRIMARY KEY, DonatorTier TEXT);
+CREATE TABLE Notes (Note TEXT);
+INSERT INTO Anime VALUES (1, 'FALL', 2014, 'TV', 70), (2, 'WINTER', 2015, 'MOVIE', NULL);
+INSERT INTO Review VALUES (10, 80, 3, 'long text', 'FALL', 2014), (11, 60, 1, NULL, 'FALL', 2014);
+INSERT INTO Status VALUES (1, 'FALL', 2014, 5, 'CURRENT');
+INSERT INTO Tag VALUES (3, false, 'Theme', 1, 'FALL', 2014), (4, NULL, NULL, 2, 'WINTER', 2015);
+INSERT INTO Studio VALUES (1, 'FALL', 2014, 7, 'Sunrise'), (2, 'WINTER', 2015, 7, 'Sunrise');
+INSERT INTO User VALUES (7, '2');
+INSERT INTO Notes VALUES ('kept');
+"""
+
+
+@pytest.fixture
+def old_database(tmp_path):
+    # A quote in the path must not break the ATTACH statement
+    path = str(tmp_path / "anilist's old.duckdb")
+    with duckdb.connect(path) as conn:
+        conn.execute(OLD_SCHEMA)
+    return path
+
+
+def test_copy_converts_types_and_moves_review_bodies(old_database):
+    conn = duckdb.connect()
+    create_tables(conn)
+
+    counts = copy(conn, old_database)
+
+    assert counts["Anime"] == 2 and counts["ReviewBody"] == 1 and counts["Notes"] == 1
+    assert conn.execute("SELECT ReviewID, Body FROM ReviewBody").fetchall() == [(10, "long text")]
+    assert conn.execute("SELECT DonatorTier FROM User").fetchall() == [(2,)]
+    types = dict(
+        conn.execute(
+            "SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = 'Anime'"
+        ).fetchall()
+    )
+    assert types["Season"].startswith("ENUM") and types["Format"].startswith("ENUM")
+    assert "Body" not in [
+        column for (column,) in conn.execute("SELECT column_name FROM (DESCRIBE Review)").fetchall()
+    ]
+
+
+def test_copy_splits_tags_and_studios(old_database):
+    conn = duckdb.connect()
+    create_tables(conn)
+
+    counts = copy(conn, old_database)
+
+    assert "Tag" not in counts and "Studio" not in counts
+    assert counts["AnimeTag"] == 2 and counts["AnimeStudio"] == 2
+    # Tag 4 carries nothing but its id; studio 7 is stored once
+    assert conn.execute("SELECT TagID, Category FROM TagDim").fetchall() == [(3, "Theme")]
+    assert conn.execute("SELECT * FROM StudioDim").fetchall() == [(7, "Sunrise")]
+    tables = [name for (name,) in conn.execute("SELECT table_name FROM duckdb_tables()").fetchall()]
+    assert "Tag" not in tables and "Studio" not in tables
+
+
+def test_copy_rolls_back_values_outside_an_enum(old_database):
+    with duckdb.connect(old_database) as old:
+        old.execute("INSERT INTO Anime VALUES (3, 'FALL', 2016, 'PODCAST', 50)")
+    conn = duckdb.connect()
+    create_tables(conn)
+
+    with pytest.raises(duckdb.ConversionException):
+        copy(conn, old_database)
+
+    assert conn.execute("SELECT count(*) FROM Review").fetchone() == (0,)
+
+
+def test_measure_times_every_scan(old_database):
+    report = measure(old_database, repeat=1)
+
+    assert report["bytes"] > 0 and set(report["scans"]) == set(SCAN_QUERIES)
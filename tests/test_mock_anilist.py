@@ -0,0 +1,148 @@
+import json
+
+from conftest import QUERY
+from utils import checkpoint
+from utils.cache import ResponseCache
+from utils.fetch_data import FetchEngine, page_variables
+from utils.graphql import project
+from utils.memory import MemoryBudget
+from utils.mock_anilist import MockAniList, page_body, sample_media
+from utils.normalize import normalize
+from utils.preprocess import DETAIL_FIELDS, DETAIL_TABLES
+from utils.rate_limit import RateController
+from utils.transport import Transport
+
+
+def test_engine_fetches_generated_seasons_over_http():
+    with MockAniList(pages_per_season=2, per_page=5) as server:
+        engine = FetchEngine(server.url, QUERY, concurrency=2)
+        results = list(engine.iter_seasons([(2000, "WINTER"), (2000, "SPRING")]))
+
+    ids = [anime_id for result in results for anime_id in result.data["id"]]
+    assert [result.pages for result in results] == [2, 2]
+    assert len(ids) == len(set(ids)) == 20
+    assert server.requests == 4
+
+
+def test_rate_limit_answers_429_with_retry_after():
+    server = MockAniList(limit=2, window=30)
+    request = {"query": QUERY, "variables": page_variables(2000, "WINTER", 1)}
+
+    statuses = [server.respond(request)[0] for _ in range(3)]
+    status, headers, _ = server.respond(request)
+
+    assert statuses == [200, 200, 429] and status == 429
+    assert headers["X-RateLimit-Remaining"] == "0" and int(headers["Retry-After"]) >= 1
+
+
+def test_engine_retries_injected_errors():
+    with MockAniList(pages_per_season=3, per_page=2, error_rate=0.3, seed=1) as server:
+        engine = FetchEngine(server.url, QUERY, bucket=RateController(backoff_base=0.01))
+        result = next(engine.iter_seasons([(2000, "WINTER")]))
+
+    assert result.complete and result.pages == 3
+    assert server.requests > 3
+
+
+def test_recorded_responses_are_replayed(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    variables = page_variables(2000, "WINTER", 1)
+    cache.put(QUERY, variables, page_body([sample_media(42)], False))
+
+    _, _, body = MockAniList(cache=cache).respond({"query": QUERY, "variables": variables})
+
+    assert [media["id"] for media in json.loads(body)["data"]["Page"]["media"]] == [42]
+
+
+def test_engine_batches_pages_and_caches_them_one_by_one(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    # Few enough fields for two pages of 50 media per request
+    query = project(QUERY, "Page.media", ["id", "season", "seasonYear"])
+    with MockAniList(pages_per_season=5, per_page=2) as server:
+        engine = FetchEngine(server.url, query, api=Transport(), batch=2, cache=cache)
+        batched = next(engine.iter_seasons([(2000, "WINTER")]))
+
+    # Pages 1-2, 3-4 and 5-6, of which page 6 is past the end
+    assert server.requests == 3
+    assert batched.complete and batched.pages == 5 and len(batched.data) == 10
+
+    replayed = next(
+        FetchEngine("http://offline", query, cache=cache, replay=True).iter_seasons(
+            [(2000, "WINTER")]
+        )
+    )
+    assert replayed.cached == 5 and replayed.data.equals(batched.data)
+
+
+def test_rejected_batches_are_retried_in_halves():
+    class Strict(MockAniList):
+        rejected = 0
+
+        # Refuses batches of more than two pages, like a complexity limit
+        def respond(self, request):
+            if "p3:" in request["query"]:
+                self.rejected += 1
+                return 400, {}, b'{"errors": [{"message": "Max query complexity"}]}'
+            return super().respond(request)
+
+    query = project(QUERY, "Page.media", ["id", "season", "seasonYear"])
+    with Strict(pages_per_season=5, per_page=2) as server:
+        engine = FetchEngine(server.url, query, api=Transport())
+        engine.batch = 4
+        result = next(engine.iter_seasons([(2000, "WINTER")]))
+
+    # Pages 1-4 are refused, then fetched as 1-2 and 3-4, then 5-6
+    assert result.complete and result.pages == 5 and len(result.data) == 10
+    assert server.rejected == 1 and server.requests == 3 and engine.batch == 2
+
+
+def test_split_engine_fetches_details_of_changed_media_only():
+    with MockAniList(pages_per_season=1, per_page=4, reviews=2) as server:
+        plain = next(FetchEngine(server.url, QUERY).iter_seasons([(2000, "WINTER")]))
+
+        versions = plain.data.select("id", "updatedAt").head(3)
+        engine = FetchEngine(
+            server.url, QUERY, details=DETAIL_FIELDS, detail_batch=2, versions=versions
+        )
+        split = next(engine.iter_seasons([(2000, "WINTER")]))
+        requests = server.requests
+
+    assert "reviews" not in split.data.columns and "studios" not in split.data.columns
+    # One core page, then the one media not in `versions`
+    assert requests == 1 + 1 + 1
+    assert split.details[0]["id"].to_list() == [plain.data["id"][3]]
+
+    tables = normalize(split.frames[0], details=split.details[0])
+    expected = normalize(plain.data.tail(1))
+    for table in DETAIL_TABLES:
+        assert tables[table].equals(expected[table])
+    assert checkpoint.version_rows(split.frames[0], split.details[0]).rows() == [
+        tuple(plain.data.select("id", "updatedAt").row(3))
+    ]
+
+
+def test_engine_streams_pages_within_the_memory_budget():
+    held = []
+
+    class Budget(MemoryBudget):
+        def hold(self):
+            super().hold()
+            held.append(self.held)
+
+    budget = Budget(ahead=1)
+    with MockAniList(pages_per_season=3, per_page=2) as server:
+        engine = FetchEngine(server.url, QUERY, api=Transport())
+        pages = []
+        for result in engine.iter_pages([(2000, "WINTER"), (2000, "SPRING", 2)], budget):
+            pages.append((result.season, result.first_page, result.more, len(result.data)))
+            budget.release()
+
+    assert pages == [
+        ("WINTER", 1, True, 2),
+        ("WINTER", 2, True, 2),
+        ("WINTER", 3, False, 2),
+        ("SPRING", 2, True, 2),
+        ("SPRING", 3, False, 2),
+    ]
+    # The next page is only requested once the previous one is released
+    assert held == [1] * 5 and budget.held == 0
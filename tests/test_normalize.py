@@ -0,0 +1,39 @@
+import polars as pl
+
+from conftest import QUERY, sample_media
+from utils.graphql import project
+from utils.normalize import normalize
+from utils.preprocess import FIELDS, TABLES
+from utils.schema import media_schema
+
+
+def test_normalize_matches_preprocess(buffer):
+    tables = normalize(buffer)
+
+    assert list(tables) == list(TABLES)
+    for name, function in TABLES.items():
+        assert tables[name].equals(function(buffer)), name
+
+
+def test_normalize_isolates_failing_tables():
+    media = sample_media(1)
+    del media["stats"]
+    tables = normalize(pl.DataFrame([media]))
+
+    assert tables["Status"] is None
+    assert len(tables["Anime"]) == 1
+
+
+def test_projected_query_feeds_only_the_selected_tables(buffer):
+    targets = ["User", "Status"]
+    query = project(QUERY, "Page.media", [p for t in targets for p in FIELDS[t]])
+    schema = media_schema(query)
+
+    assert "title" not in schema and "body" not in str(schema["reviews"])
+
+    projected = pl.DataFrame(buffer.to_dicts(), schema=schema)
+    tables = normalize(projected, targets)
+
+    assert list(tables) == targets
+    for name in targets:
+        assert tables[name].equals(TABLES[name](buffer)), name
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from utils.pipeline import pipeline
+
+
+def test_pipeline_keeps_order_and_overlaps_stages():
+    transformed_while_writing = []
+
+    def source():
+        for i in range(5):
+            yield i
+
+    def transform(item):
+        transformed_while_writing.append(writing.is_set())
+        return item * 10
+
+    writing = threading.Event()
+    results = []
+    for item, value in pipeline(source(), transform, maxsize=1):
+        writing.set()
+        time.sleep(0.05)
+        results.append((item, value))
+        writing.clear()
+
+    assert results == [(i, i * 10) for i in range(5)]
+    assert any(transformed_while_writing)
+
+
+def test_pipeline_raises_stage_errors():
+    def transform(item):
+        raise ValueError("bad season")
+
+    with pytest.raises(ValueError, match="bad season"):
+        list(pipeline(iter([1]), transform))
+
+
+def test_pipeline_stops_its_stages_when_the_consumer_stops():
+    closed = threading.Event()
+    before = set(threading.enumerate())
+
+    def source():
+        try:
+            for i in range(100):
+                yield i
+        finally:
+            closed.set()
+
+    results = pipeline(source(), lambda item: item, maxsize=1)
+    assert next(results) == (0, 0)
+    results.close()
+
+    # Both stages gave up on their full queues and closed the source
+    assert closed.wait(5)
+    deadline = time.monotonic() + 5
+    while set(threading.enumerate()) - before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not set(threading.enumerate()) - before
@@ -0,0 +1,70 @@
+import json
+
+import polars as pl
+
+from conftest import QUERY, sample_media
+from utils.graphql import (
+    batch,
+    batch_variables,
+    complexity,
+    max_batch,
+    parse,
+    project,
+    split_variables,
+)
+from utils.schema import decode_page, media_schema
+
+
+def page_body(media, has_next_page=False):
+    return json.dumps(
+        {"data": {"Page": {"pageInfo": {"hasNextPage": has_next_page}, "media": media}}}
+    ).encode("UTF-8")
+
+
+def test_parse_merges_duplicate_fields_and_round_trips():
+    operation = parse(QUERY)
+    media = operation.get("Page").get("media")
+
+    # meanScore is selected twice in api_query.graphql
+    assert [f.key for f in media.selections].count("meanScore") == 1
+    assert parse(operation.render()) == operation
+
+
+def test_media_schema_matches_inferred_types():
+    schema = media_schema(QUERY)
+    inferred = pl.DataFrame([sample_media(1)])
+
+    assert inferred.schema == schema
+
+
+def test_decoded_pages_always_concatenate():
+    schema = media_schema(QUERY)
+    sparse = sample_media(2)
+    sparse["trailer"] = None
+    sparse["reviews"]["nodes"] = []
+    sparse["studios"]["nodes"] = []
+
+    first, _ = decode_page(page_body([sample_media(1)], True), schema)
+    second, page_info = decode_page(page_body([sparse]), schema)
+
+    assert second.schema == schema and page_info == {"hasNextPage": False}
+    assert len(pl.concat([first, second])) == 2
+
+
+def test_batch_aliases_pages_with_their_own_variables():
+    batched = parse(batch(QUERY, 3))
+
+    assert [field.key for field in batched.selections] == ["p1", "p2", "p3"]
+    assert "$page_3" in batched.get("p3").arguments
+    assert "$season_2" in batched.get("p2").get("media").arguments
+    assert "$perPage: Int" in batched.variables and "$perPage_1" not in batched.variables
+    # Every media field counts 50 times, and every review field 50 * 25 times
+    assert max_batch(QUERY, variables={"perPage": 50}) == 1
+    narrow = project(QUERY, "Page.media", ["id", "season", "seasonYear"])
+    assert complexity([parse(narrow).get("Page")], {"perPage": 50}) == 205
+    assert max_batch(narrow, variables={"perPage": 50}) == 2
+
+    slots = [{"page": page, "perPage": 50, "season": "FALL"} for page in (1, 2)]
+    assert split_variables(batch_variables(slots)) == [
+        {"perPage": 50, "page": page, "seasonYear": None, "season": "FALL"} for page in (1, 2)
+    ]
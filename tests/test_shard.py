@@ -0,0 +1,70 @@
+import argparse
+
+import duckdb
+import pytest
+
+from init_duckdb import create_tables
+from utils import checkpoint
+from utils.normalize import normalize
+from utils.shard import merge, parse_shard, shard_plan
+from utils.fetch_data import plan_seasons
+
+
+def test_shard_plans_cover_the_plan_once():
+    plan = plan_seasons(range(2000, 2003), ["WINTER", "SPRING", "SUMMER", "FALL"])
+    shards = [shard_plan(plan, index, 3) for index in range(3)]
+
+    assert sorted(item for shard in shards for item in shard) == sorted(plan)
+    assert [len(shard) for shard in shards] == [4, 4, 4]
+
+
+def test_parse_shard():
+    assert parse_shard("1/4") == (1, 4)
+    for text in ["4/4", "1-4", "x/2"]:
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(text)
+
+
+def test_merge_deduplicates_across_shards(conn, buffer, tmp_path):
+    tables = normalize(buffer)
+    paths = []
+    for index, (year, season) in enumerate([(2000, "WINTER"), (2000, "SPRING")]):
+        path = str(tmp_path / f"shard-{index}.duckdb")
+        shard = duckdb.connect(path)
+        create_tables(shard)
+        # Both shards loaded the same anime, as if it spanned two seasons
+        checkpoint.load_unit(shard, year, season, 1, False, tables)
+        shard.close()
+        paths.append(path)
+
+    counts = merge(conn, paths)
+
+    assert counts["Anime"] == {"inserted": 2, "skipped": 2}
+    assert counts["TransferCheckpoint"] == {"inserted": 2, "skipped": 0}
+    assert "SyncWatermark" not in counts
+    assert checkpoint.pending(conn, [(2000, "WINTER"), (2000, "SPRING")]) == []
+
+
+def test_merge_matches_shard_columns_by_name(conn, tmp_path):
+    # Shards written by different versions may order their columns differently
+    schemas = ["UserID INTEGER, Username TEXT", "Username TEXT, UserID INTEGER"]
+    directory = tmp_path / "worker's shards"
+    directory.mkdir()
+    paths = []
+    for index, schema in enumerate(schemas):
+        path = str(directory / f"shard-{index}.duckdb")
+        with duckdb.connect(path) as shard:
+            shard.execute(f'CREATE TABLE "User" ({schema})')
+            shard.execute(
+                f'INSERT INTO "User" BY NAME SELECT {index + 1} AS UserID, '
+                f"'user{index + 1}' AS Username"
+            )
+        paths.append(path)
+
+    counts = merge(conn, paths)
+
+    assert counts["User"] == {"inserted": 2, "skipped": 0}
+    assert conn.execute('SELECT UserID, Username FROM "User" ORDER BY 1').fetchall() == [
+        (1, "user1"),
+        (2, "user2"),
+    ]
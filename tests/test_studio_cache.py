@@ -0,0 +1,48 @@
+import time
+
+import polars as pl
+
+from conftest import QUERY
+from utils import checkpoint
+from utils.fetch_data import FetchEngine, plan_seasons
+from utils.mock_anilist import MockAniList
+from utils.normalize import normalize
+from utils.studio_cache import StudioCache, merge_catalog
+
+
+def test_claim_returns_each_stale_studio_once():
+    cache = StudioCache(ttl=60, fetched={1: time.time(), 2: time.time() - 120})
+
+    assert cache.claim([1, 2, 3, 3, None]) == [2, 3]
+    assert cache.claim([2, 3]) == []
+
+    cache.release(3)
+    assert cache.claim([3]) == [3]
+
+
+def test_engine_fetches_every_catalogue_once():
+    with MockAniList(pages_per_season=2, per_page=3, studio_media=60) as server:
+        engine = FetchEngine(server.url, QUERY, concurrency=2, studios=StudioCache())
+        results = list(engine.iter_seasons(plan_seasons([2000], ["WINTER", "SPRING"])))
+
+    # 4 pages, and 2 pages of the catalogue of the single studio
+    assert server.requests == 6
+    # Whichever season sees the studio first fetches its catalogue
+    catalog = pl.concat(catalog for result in results for catalog in result.catalogs)
+    assert sorted(catalog["AnimeID"]) == list(range(1, 61))
+
+
+def test_catalogues_are_stored_with_the_links(conn, buffer):
+    tables = normalize(buffer)
+    links = len(tables["AnimeStudio"])
+    with MockAniList(studio_media=3) as server:
+        engine = FetchEngine(server.url, QUERY, studios=StudioCache())
+        catalog = next(engine.iter_seasons([(2000, "WINTER")])).catalogs[0]
+
+    merge_catalog(tables, catalog)
+    checkpoint.load_unit(conn, 2014, "FALL", 1, False, tables)
+
+    assert conn.execute("SELECT count(*) FROM AnimeStudio").fetchone() == (links + 3,)
+    assert conn.execute("SELECT StudioName FROM StudioDim").fetchall() == [("Sunrise",)]
+    cache = StudioCache.load(conn, ttl=60)
+    assert list(cache.fetched) == [7] and cache.claim([7]) == []
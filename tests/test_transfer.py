@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+
+import duckdb
+import pytest
+
+from init_duckdb import create_tables
+from utils.mock_anilist import MockAniList
+from utils.transfer import Transfer
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "anilist.duckdb")
+    with duckdb.connect(path) as conn:
+        create_tables(conn)
+    return path
+
+
+def test_runs_reuse_the_connections(database, tmp_path):
+    with MockAniList(pages_per_season=2, per_page=3) as server:
+        with Transfer(
+            database, server.url, concurrency=2, cache_dir=None, keys_dir=str(tmp_path / "keys")
+        ) as transfer:
+            first = transfer.run([2000], report=str(tmp_path / "run.json"))
+            second = transfer.run([2000])
+            count = transfer.conn.execute("SELECT count(*) FROM Anime").fetchone()
+
+    assert first["Anime"] == {"inserted": 24, "updated": 0, "skipped": 0}
+    assert second["Anime"] == {"inserted": 0, "updated": 0, "skipped": 24}
+    assert count == (24,)
+    # Every run goes over the same keep-alive connections
+    assert server.connections <= 2
+    report = json.loads((tmp_path / "run.json").read_text())
+    assert report["arguments"]["years"] == [2000] and report["arguments"]["database"] == database
+
+
+def test_upsert_refetches_cached_pages(database, tmp_path):
+    class Changing(MockAniList):
+        popularity = 1000
+
+        def media(self, anime_id):
+            return {**super().media(anime_id), "popularity": self.popularity}
+
+    cache_dir = tmp_path / "cache"
+    with Changing(pages_per_season=2, per_page=3) as server:
+        with Transfer(
+            database, server.url, cache_dir=str(cache_dir), keys_dir=str(tmp_path / "keys")
+        ) as transfer:
+            transfer.run([2000])
+            server.popularity = 2000
+            transfer.upsert = True
+            counts = transfer.run([2000])
+            popularity = transfer.conn.execute("SELECT DISTINCT Popularity FROM Anime").fetchall()
+
+    # The pages are cached, yet the upsert sees the changed values
+    assert any(cache_dir.rglob("*.json.gz"))
+    assert counts["Anime"]["updated"] == 24 and popularity == [(2000,)]
+
+
+def test_failed_seasons_are_not_reported_empty(database, tmp_path, capsys):
+    with Transfer(
+        database, cache_dir=str(tmp_path / "cache"), replay=True, keys_dir=str(tmp_path / "keys")
+    ) as transfer:
+        assert transfer.run([2000]) == {}
+
+    output = capsys.readouterr().out
+    assert "🟥 FALL 2000 could not be retrieved." in output
+    assert "No anime entries found" not in output
+
+
+def test_unknown_tables_are_rejected_before_connecting(tmp_path):
+    with pytest.raises(ValueError, match="Foo"):
+        Transfer(str(tmp_path / "anilist.duckdb"), tables=["Anime", "Foo"])
+
+    assert not os.path.exists(tmp_path / "anilist.duckdb")
+
+
+@pytest.mark.parametrize("arguments", [["--help"], ["2000", "2002", "--shard", "1/2", "--plan"]])
+def test_help_and_plan_skip_the_heavy_imports(arguments):
+    code = (
+        "import sys, data_transfer\n"
+        "try:\n"
+        f"    data_transfer.main({arguments!r})\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted({'duckdb', 'polars', 'requests', 'tqdm'} & set(sys.modules)))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True
+    ).stdout
+
+    assert output.splitlines()[-1] == "[]"
+    if "--plan" in arguments:
+        assert "🟦 4 season(s)" in output and "🍂  FALL 2001" in output
+
+
+def test_parquet_runs_keep_the_studio_fetch_times(database, tmp_path):
+    with MockAniList(pages_per_season=1, per_page=3) as server:
+        with Transfer(
+            database,
+            server.url,
+            cache_dir=None,
+            output="parquet",
+            lake_dir=str(tmp_path / "lake"),
+            keys_dir=str(tmp_path / "keys"),
+        ) as transfer:
+            transfer.run([2000])
+            fetched = transfer.conn.execute("SELECT count(*) FROM StudioFetch").fetchone()
+            requests = server.requests
+            transfer.run([2000])
+
+    assert fetched[0] > 0
+    # The catalogues are not fetched again, only the 4 season pages
+    assert server.requests - requests == 4
@@ -0,0 +1,77 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conftest import QUERY
+from utils.fetch_data import FetchEngine
+from utils.metrics import REGISTRY
+from utils.mock_anilist import MockAniList
+from utils.transport import Transport
+
+
+def test_requests_reuse_pooled_connections():
+    transport = Transport(pool_size=2)
+    with MockAniList(pages_per_season=3, per_page=2) as server:
+        responses = [transport(server.url, QUERY, 2000, "WINTER", page) for page in (1, 2, 3)]
+    transport.close()
+
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert server.requests == 3 and server.connections == 1
+
+
+def test_compressed_responses_are_decoded_and_counted():
+    REGISTRY.reset()
+    transport = Transport()
+    with MockAniList(pages_per_season=1, per_page=20) as server:
+        response = transport(server.url, QUERY, 2000, "WINTER", 1)
+    transport.close()
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert len(response.json()["data"]["Page"]["media"]) == 20
+    report = {metric["name"]: metric["value"] for metric in REGISTRY.report()["counters"]}
+    assert report["request_bytes"] > 0
+    assert 0 < report["response_wire_bytes"] < len(response.content)
+
+
+def test_responses_without_content_length_count_compressed_bytes():
+    body = gzip.compress(json.dumps({"data": {"Page": {"media": [{"id": 1}] * 100}}}).encode())
+
+    class Handler(BaseHTTPRequestHandler):
+        # HTTP/1.0 responses without Content-Length end with the connection
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    REGISTRY.reset()
+    transport = Transport()
+    response = transport(f"http://127.0.0.1:{server.server_port}", QUERY, 2000, "WINTER", 1)
+    transport.close()
+    server.shutdown()
+
+    assert "Content-Length" not in response.headers
+    report = {metric["name"]: metric["value"] for metric in REGISTRY.report()["counters"]}
+    assert report["response_wire_bytes"] == len(body) < len(response.content)
+
+
+def test_engine_fetches_through_transport():
+    transport = Transport(pool_size=2)
+    with MockAniList(pages_per_season=2, per_page=5) as server:
+        engine = FetchEngine(server.url, QUERY, concurrency=2, api=transport)
+        result = next(engine.iter_seasons([(2000, "WINTER")]))
+    transport.close()
+
+    assert result.complete and len(result.data) == 10
+
+
+def test_failed_requests_return_none():
+    transport = Transport(connect_timeout=0.5)
+    assert transport("http://127.0.0.1:9", QUERY, 2000, "WINTER", 1) is None